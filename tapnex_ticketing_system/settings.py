@@ -203,6 +203,95 @@ DEFAULT_FROM_EMAIL = 'Tapnex <noreply@tapnex.tech>'
 CUSTOM_EMAIL_MAX_RETRIES = 3
 CUSTOM_EMAIL_RETRY_DELAY = 2
 
+# Checkout capacity holds - seats stay reserved this long while the customer pays
+CAPACITY_HOLD_TTL_MINUTES = 15
+
+# Background job queue (see ticketing/job_utils.py and the run_workers command)
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_BASE_SECONDS = 30  # doubled after every failed attempt
+JOB_RETRY_MAX_SECONDS = 3600
+JOB_LOCK_TIMEOUT_SECONDS = 600  # RUNNING jobs older than this are assumed orphaned by a dead worker
+
+# Rows fetched per query by the streaming CSV exports (ticketing/export_utils.py)
+EXPORT_CHUNK_SIZE = 2000
+
+# Rendered QR code / pass image cache (ticketing/render_cache_utils.py).
+# BACKEND is 'filesystem' (LOCATION defaults to the temp dir, LRU-trimmed to MAX_ENTRIES files)
+# or 'django' to store renders in the CACHE_ALIAS cache.
+PASS_RENDER_CACHE = {
+    'BACKEND': os.environ.get('PASS_RENDER_CACHE_BACKEND', 'filesystem'),
+    'LOCATION': os.environ.get('PASS_RENDER_CACHE_DIR', ''),
+    'MAX_ENTRIES': 5000,
+    'CACHE_ALIAS': 'default',
+}
+
+# Rendered invoice PDFs (ticketing/invoice_utils.py), stored once and served from here. BACKEND is
+# 'filesystem' (LOCATION, defaults to MEDIA_ROOT/invoices) or 'default' for the default storage (e.g. S3).
+INVOICE_PDF_STORAGE = {
+    'BACKEND': os.environ.get('INVOICE_PDF_STORAGE_BACKEND', 'filesystem'),
+    'LOCATION': os.environ.get('INVOICE_PDF_DIR', ''),
+}
+
+# Render processes used by `manage.py export_invoice_pdfs` for missing invoice PDFs (None: one per CPU)
+INVOICE_EXPORT_WORKERS = int(os.environ['INVOICE_EXPORT_WORKERS']) if os.environ.get('INVOICE_EXPORT_WORKERS') else None
+
+# Decoded 60x60 sponsor logos used by the pass renderer (ticketing/render_assets_utils.py), defaults to the temp dir
+SPONSOR_LOGO_CACHE_DIR = os.environ.get('SPONSOR_LOGO_CACHE_DIR', '')
+
+# Per-process in-memory cache (catalogue, promo index, pass renders with the 'django' backend).
+# Every serverless instance has its own copy, so the cached data below expires on short timeouts.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+# Cached published-event catalogue (home, event list, customer dashboard). It is invalidated by
+# signals on save; the timeout bounds staleness for other processes when the cache is per-process.
+EVENT_CATALOGUE_CACHE_TIMEOUT = 60
+
+# Per-event promo code index used by the validate-promo endpoint (ticketing/promo_utils.py). Saves and
+# redemptions bump its version; the timeout bounds staleness for other processes when the cache is per-process.
+PROMO_INDEX_CACHE_TIMEOUT = 60
+# Unknown promo codes one client IP may try per window before validation answers 429. The counter
+# lives in the PROMO_GUESS_CACHE_ALIAS cache: with the default LocMem cache the limit applies per
+# process (each serverless instance counts on its own). Point it at a shared backend
+# (Redis, Memcached or a DatabaseCache) to enforce it across instances.
+PROMO_GUESS_LIMIT = 20
+PROMO_GUESS_WINDOW_SECONDS = 600
+PROMO_GUESS_CACHE_ALIAS = os.environ.get('PROMO_GUESS_CACHE_ALIAS', 'default')
+
+# Proxies in front of the app that append to X-Forwarded-For (Vercel's edge is one). The client
+# address is read this many hops from the right of the header, never from its client-controlled left.
+TRUSTED_PROXY_COUNT = int(os.environ.get('TRUSTED_PROXY_COUNT', 1))
+
+# Largest batch of queued offline check-ins accepted in one sync upload
+CHECKIN_SYNC_MAX_SCANS = 1000
+# Largest number of scans accepted by the batch validation endpoint
+CHECKIN_BATCH_MAX_SCANS = 100
+
+# How often the event dashboard refreshes the live gate occupancy (each refresh is one short request)
+OCCUPANCY_POLL_SECONDS = 10
+
+# Shared Cashfree API client (ticketing/gateway_utils.py). The base URL defaults to the sandbox in
+# DEBUG and production otherwise; point it at a local stub server for testing.
+CASHFREE_API_BASE_URL = os.environ.get('CASHFREE_API_BASE_URL', '')
+CASHFREE_POOL_SIZE = 10  # keep-alive connections per process
+CASHFREE_CONNECT_TIMEOUT = 3.05
+CASHFREE_READ_TIMEOUT = 10
+CASHFREE_MAX_RETRIES = 2  # retries of timeouts, 429 and 5xx, with jittered exponential backoff
+CASHFREE_RETRY_BACKOFF_SECONDS = 0.5
+# Circuit breaker: open after this many consecutive failed or slow calls, try again after the reset period
+CASHFREE_BREAKER_FAILURES = 5
+CASHFREE_BREAKER_RESET_SECONDS = 30
+CASHFREE_SLOW_CALL_SECONDS = 5
+
+# reconcile_payments: CREATED/PENDING orders older than this are checked against Cashfree,
+# with at most PAYMENT_RECONCILE_WORKERS lookups in flight
+PAYMENT_RECONCILE_AFTER_MINUTES = 15
+PAYMENT_RECONCILE_WORKERS = 4
+
 # CSRF settings for production
 CSRF_TRUSTED_ORIGINS = [
     'https://tickets.tapnex.tech',
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Event, Ticket, PromoCode, EventStaff, User, TicketType, PaymentTransaction, EventCommission, Invoice
+from .models import Event, Ticket, PromoCode, PromoRedemption, EventStaff, User, TicketType, PaymentTransaction, Order, OrderLine, EventCommission, Invoice, CapacityHold, Job, ScanEvent, WebhookInbox
 
 @admin.register(Event)
 class EventAdmin(admin.ModelAdmin):
@@ -7,7 +7,7 @@ class EventAdmin(admin.ModelAdmin):
     list_filter = ('status', 'featured', 'date')
     search_fields = ('title', 'description', 'venue')
     prepopulated_fields = {'slug': ('title',)}
-    readonly_fields = ('created_at', 'updated_at')
+    readonly_fields = ('attendees_sold', 'attendees_held', 'created_at', 'updated_at')
     list_editable = ('status', 'featured')
     fieldsets = (
         ('Basic Information', {
@@ -17,7 +17,7 @@ class EventAdmin(admin.ModelAdmin):
             'fields': ('date', 'end_date', 'time', 'end_time', 'venue', 'venue_address', 'venue_map_link')
         }),
         ('Event Settings', {
-            'fields': ('capacity', 'registration_start_date', 'registration_deadline')
+            'fields': ('capacity', 'attendees_sold', 'attendees_held', 'max_promo_redemptions', 'registration_start_date', 'registration_deadline')
         }),
         ('Organization', {
             'fields': ('organizer', 'status', 'featured')
@@ -35,14 +35,48 @@ class TicketAdmin(admin.ModelAdmin):
     search_fields = ('ticket_number', 'customer__email', 'event__title')
     readonly_fields = ('purchase_date',)
 
+    # Keep the capacity ledger in step with admin edits, like the admin panel views do
+    def save_model(self, request, obj, form, change):
+        from django.db import transaction
+        from .capacity_utils import record_tickets_sold, record_ticket_changed
+        with transaction.atomic():
+            original = Ticket.objects.get(pk=obj.pk) if change else None
+            super().save_model(request, obj, form, change)
+            if original is not None:
+                record_ticket_changed(original, obj)
+            else:
+                record_tickets_sold([obj])
+
+    def delete_model(self, request, obj):
+        from django.db import transaction
+        from .capacity_utils import record_ticket_removed
+        with transaction.atomic():
+            record_ticket_removed(obj)
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        from django.db import transaction
+        from .capacity_utils import record_ticket_removed
+        with transaction.atomic():
+            for ticket in queryset:
+                record_ticket_removed(ticket)
+            super().delete_queryset(request, queryset)
+
 @admin.register(PromoCode)
 class PromoCodeAdmin(admin.ModelAdmin):
-    list_display = ('code', 'event', 'discount_type', 'discount_value', 'valid_from', 'valid_until', 'is_active')
+    list_display = ('code', 'event', 'discount_type', 'discount_value', 'valid_from', 'valid_until', 'current_uses', 'max_uses', 'is_active')
     list_filter = ('discount_type', 'is_active', 'event')
     search_fields = ('code', 'event__title')
     readonly_fields = ('current_uses', 'created_at')
     list_editable = ('is_active',)
 
+@admin.register(PromoRedemption)
+class PromoRedemptionAdmin(admin.ModelAdmin):
+    list_display = ('promo_code', 'user', 'order', 'status', 'created_at', 'updated_at')
+    list_filter = ('status',)
+    search_fields = ('promo_code__code', 'user__email')
+    readonly_fields = ('promo_code', 'user', 'order', 'status', 'created_at', 'updated_at')
+
 @admin.register(EventStaff)
 class EventStaffAdmin(admin.ModelAdmin):
     list_display = ('user', 'event', 'role', 'assigned_at')
@@ -61,6 +95,19 @@ class TicketTypeAdmin(admin.ModelAdmin):
         return obj.total_attendees_capacity
     total_attendees_capacity.short_description = 'Total Attendees Capacity'
 
+class OrderLineInline(admin.TabularInline):
+    model = OrderLine
+    extra = 0
+    readonly_fields = ('ticket_type', 'type_name', 'price', 'quantity', 'attendees_per_ticket')
+
+@admin.register(Order)
+class OrderAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'event', 'status', 'total_attendees', 'subtotal', 'discount', 'total', 'promo_code', 'created_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('user__email', 'event__title', 'promo_code')
+    readonly_fields = ('created_at', 'updated_at')
+    inlines = [OrderLineInline]
+
 @admin.register(PaymentTransaction)
 class PaymentTransactionAdmin(admin.ModelAdmin):
     list_display = ('order_id', 'user', 'amount', 'status', 'payment_gateway', 'transaction_id', 'created_at', 'updated_at')
@@ -70,7 +117,7 @@ class PaymentTransactionAdmin(admin.ModelAdmin):
     list_editable = ('status',)
     fieldsets = (
         ('Basic Information', {
-            'fields': ('order_id', 'transaction_id', 'user', 'amount', 'status', 'payment_gateway')
+            'fields': ('order_id', 'transaction_id', 'user', 'purchase_order', 'amount', 'status', 'payment_gateway')
         }),
         ('Response Data', {
             'fields': ('response_data',)
@@ -80,6 +127,35 @@ class PaymentTransactionAdmin(admin.ModelAdmin):
         }),
     )
 
+@admin.register(CapacityHold)
+class CapacityHoldAdmin(admin.ModelAdmin):
+    list_display = ('transaction', 'event', 'user', 'attendees', 'status', 'expires_at', 'created_at')
+    list_filter = ('status', 'event')
+    search_fields = ('transaction__order_id', 'user__email', 'event__title')
+    readonly_fields = ('created_at', 'updated_at')
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'job_type', 'status', 'attempts', 'max_attempts', 'run_after', 'locked_by', 'updated_at')
+    list_filter = ('status', 'job_type')
+    readonly_fields = ('created_at', 'updated_at')
+    actions = ['requeue_jobs']
+
+    def requeue_jobs(self, request, queryset):
+        from .job_utils import requeue_job
+        for job in queryset.exclude(status='RUNNING'):
+            requeue_job(job)
+        self.message_user(request, "Selected jobs were queued again.")
+    requeue_jobs.short_description = "Requeue selected jobs"
+
+@admin.register(WebhookInbox)
+class WebhookInboxAdmin(admin.ModelAdmin):
+    list_display = ('received_at', 'provider', 'event_type', 'order_id', 'status', 'deliveries', 'attempts', 'processed_at')
+    list_filter = ('status', 'provider', 'event_type')
+    search_fields = ('order_id', 'event_id')
+    date_hierarchy = 'received_at'
+    readonly_fields = ('provider', 'event_id', 'order_id', 'event_type', 'payload', 'deliveries', 'attempts', 'received_at', 'processed_at')
+
 @admin.register(EventCommission)
 class EventCommissionAdmin(admin.ModelAdmin):
     list_display = ('event', 'commission_type', 'commission_value', 'created_at')
@@ -94,6 +170,7 @@ class InvoiceAdmin(admin.ModelAdmin):
     list_filter = ('created_at', 'event')
     search_fields = ('invoice_number', 'ticket__ticket_number', 'user__email', 'event__title')
     readonly_fields = ('invoice_number', 'created_at')
+    actions = ['download_pdfs']
     fieldsets = (
         ('Invoice Information', {
             'fields': ('invoice_number', 'ticket', 'user', 'event', 'ticket_type', 'transaction')
@@ -107,8 +184,30 @@ class InvoiceAdmin(admin.ModelAdmin):
         }),
     )
 
+    def download_pdfs(self, request, queryset):
+        from django.utils import timezone
+        from .invoice_export_utils import zip_streaming_response
+        filename = f'invoices_{timezone.now().strftime("%Y%m%d_%H%M%S")}.zip'
+        return zip_streaming_response(filename, queryset.select_related('event', 'user', 'ticket', 'ticket_type', 'transaction'))
+    download_pdfs.short_description = "Download PDFs of selected invoices (ZIP)"
+
 # Only register User model if it hasn't been registered already
 try:
     admin.site.register(User)
 except admin.sites.AlreadyRegistered:
     pass
+
+@admin.register(ScanEvent)
+class ScanEventAdmin(admin.ModelAdmin):
+    list_display = ('scanned_at', 'outcome', 'error_code', 'ticket_id', 'event', 'volunteer', 'device', 'source', 'latency_ms')
+    list_filter = ('outcome', 'error_code', 'source')
+    search_fields = ('device', 'volunteer__email')
+    date_hierarchy = 'scanned_at'
+    list_select_related = ('event', 'volunteer')
+
+    # The scan log is append-only
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
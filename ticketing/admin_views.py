@@ -1,22 +1,28 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.views.decorators.http import require_http_methods
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse
 from django.contrib import messages
 from django.db import transaction
-import csv
 import logging
 from datetime import datetime, timedelta
 from decimal import Decimal
-from django.db.models import Sum, Q, Count
+from django.db.models import Sum, Q, Count, F, Max, Window
+from django.db.models.functions import RowNumber
 from django.utils import timezone
-from .models import Event, TicketType, Ticket, PromoCode, EventStaff, PromoCodeUsage, EventSponsor, EventCommission, Invoice, User
+from .models import Event, TicketType, Ticket, PromoCode, EventStaff, PromoCodeUsage, EventSponsor, EventCommission, Invoice, User, CheckInCounter
 from .invoice_forms import EventCommissionForm
 from .forms import (
-    EventForm, AdminUserCreationForm, TicketForm, PromoCodeForm,
+    EventForm, AdminUserCreationForm, TicketForm, AdminTicketCreateForm, PromoCodeForm,
     EventStaffForm, TicketTypeForm, EventSponsorFormSet
 )
 from .utils import handle_event_csv_upload, generate_sample_csv
+from .capacity_utils import record_tickets_sold, record_ticket_changed, record_ticket_removed, CapacityError
+from .issuance_utils import issue_tickets, generate_ticket_numbers
+from .export_utils import csv_streaming_response, iterate_in_chunks, start_of_day
+from .invoice_export_utils import filter_invoices, zip_streaming_response
+from .gateway_utils import get_cashfree_gateway
+from .promo_utils import with_promo_code_stats, get_promo_totals
 
 logger = logging.getLogger(__name__)
 
@@ -309,13 +315,34 @@ def admin_ticket_list(request):
 @user_passes_test(is_admin)
 def admin_create_ticket(request):
     if request.method == 'POST':
-        form = TicketForm(request.POST)
+        form = AdminTicketCreateForm(request.POST)
         if form.is_valid():
-            form.save()
-            messages.success(request, 'Ticket created successfully!')
-            return redirect('admin_ticket_list')
+            quantity = form.cleaned_data['quantity']
+            if quantity == 1:
+                with transaction.atomic():
+                    ticket = form.save(commit=False)
+                    if not ticket.ticket_number:
+                        ticket.ticket_number = generate_ticket_numbers(1)[0]
+                    ticket.save()
+                    record_tickets_sold([ticket])
+                messages.success(request, 'Ticket created successfully!')
+                return redirect('admin_ticket_list')
+
+            try:
+                tickets = issue_tickets(
+                    form.cleaned_data['ticket_type'],
+                    form.cleaned_data['customer'],
+                    quantity,
+                    status=form.cleaned_data['status'],
+                )
+            except CapacityError as e:
+                form.add_error('quantity', str(e))
+            else:
+                logger.info(f"Admin {request.user.email} issued {len(tickets)} tickets for event {form.cleaned_data['event'].id}")
+                messages.success(request, f'{len(tickets)} tickets issued successfully!')
+                return redirect('admin_ticket_list')
     else:
-        form = TicketForm()
+        form = AdminTicketCreateForm()
     return render(request, 'core/admin/ticket_form.html', {'form': form, 'action': 'Create'})
 
 @login_required
@@ -323,9 +350,12 @@ def admin_create_ticket(request):
 def admin_edit_ticket(request, ticket_id):
     ticket = get_object_or_404(Ticket, id=ticket_id)
     if request.method == 'POST':
+        original_ticket = Ticket.objects.get(id=ticket.id)
         form = TicketForm(request.POST, instance=ticket)
         if form.is_valid():
-            form.save()
+            with transaction.atomic():
+                ticket = form.save()
+                record_ticket_changed(original_ticket, ticket)
             messages.success(request, 'Ticket updated successfully!')
             return redirect('admin_ticket_list')
     else:
@@ -336,7 +366,9 @@ def admin_edit_ticket(request, ticket_id):
 @user_passes_test(is_admin)
 def admin_delete_ticket(request, ticket_id):
     ticket = get_object_or_404(Ticket, id=ticket_id)
-    ticket.delete()
+    with transaction.atomic():
+        record_ticket_removed(ticket)
+        ticket.delete()
     messages.success(request, 'Ticket deleted successfully!')
     return redirect('admin_ticket_list')
 
@@ -366,6 +398,9 @@ def admin_delete_all_tickets(request):
         # Delete all tickets
         with transaction.atomic():
             deleted_count, deleted_objects = Ticket.objects.all().delete()
+            # No tickets left, so the whole capacity ledger is empty
+            Event.objects.update(attendees_sold=0)
+            TicketType.objects.update(attendees_sold=0)
             
         # Success message
         messages.success(
@@ -907,87 +942,27 @@ def download_sample_csv(request):
 @user_passes_test(is_admin)
 def admin_promo_code_analytics(request):
     """Admin dashboard for promo code analytics"""
-    promo_codes = PromoCode.objects.all().order_by('-created_at')
-    
-    # Enhance promo codes with analytics data (now filtering for successful, non-sandbox transactions)
-    for promo_code in promo_codes:
-        # Only count successful, non-sandbox transactions
-        successful_usages = promo_code.promo_code_usages.filter(
-            ticket__purchase_transaction__status='SUCCESS'
-        ).exclude(
-            ticket__purchase_transaction__payment_gateway='SANDBOX'
-        )
-        
-        promo_code.usage_count = successful_usages.count()
-        promo_code.tickets_booked = promo_code.total_tickets_booked()
-        promo_code.amount_saved = promo_code.total_amount_saved()
-        promo_code.revenue_generated = promo_code.total_revenue_generated()
-        promo_code.average_order_value = promo_code.average_order_value()
-        promo_code.redemption_rate = promo_code.redemption_rate()
+    promo_codes = with_promo_code_stats(PromoCode.objects.order_by('-created_at'))
     
     return render(request, 'core/admin/promo_code_analytics.html', {
-        'promo_codes': promo_codes
+        'promo_codes': promo_codes,
+        **get_promo_totals(promo_codes),
     })
 
 @login_required
 def organizer_promo_code_analytics(request):
     """Organizer dashboard for promo code analytics for their events"""
-    # Get events where this user is an organizer (either directly or through EventStaff model)
-    organizer_events = list(Event.objects.filter(organizer=request.user))
-    staff_events = list(Event.objects.filter(staff__user=request.user, staff__role='ORGANIZER'))
-    
-    # Combine both event lists (removing duplicates)
-    all_events = list(set(organizer_events + staff_events))
-    
-    # Get all promo codes for these events
-    promo_codes = PromoCode.objects.filter(event__in=all_events).order_by('-created_at')
-    
-    # Initialize aggregate totals
-    total_active_promos = 0
-    total_saved = 0
-    total_revenue = 0
-    total_redemptions = 0
-    total_max_uses = 0
-    
-    # Enhance promo codes with analytics data and calculate aggregate totals
-    for promo_code in promo_codes:
-        # Only count successful, non-sandbox transactions
-        successful_usages = promo_code.promo_code_usages.filter(
-            ticket__purchase_transaction__status='SUCCESS'
-        ).exclude(
-            ticket__purchase_transaction__payment_gateway='SANDBOX'
-        )
-        
-        promo_code.usage_count = successful_usages.count()
-        promo_code.tickets_booked = promo_code.total_tickets_booked()
-        promo_code.amount_saved = promo_code.total_amount_saved()
-        promo_code.revenue_generated = promo_code.total_revenue_generated()
-        promo_code.average_order_value = promo_code.average_order_value()
-        promo_code.redemption_rate = promo_code.redemption_rate()
-        
-        # Add to aggregate totals
-        if promo_code.is_active and promo_code.is_valid:
-            total_active_promos += 1
-            
-        total_saved += float(promo_code.amount_saved)
-        total_revenue += float(promo_code.revenue_generated)
-        total_redemptions += promo_code.usage_count
-        
-        if promo_code.max_uses > 0:
-            total_max_uses += promo_code.max_uses
+    # Events this user organizes, directly or through an EventStaff organizer role
+    all_events = list(Event.objects.filter(
+        Q(organizer=request.user) | Q(staff__user=request.user, staff__role='ORGANIZER')
+    ).distinct())
     
-    # Calculate average redemption rate
-    if total_max_uses > 0:
-        avg_redemption_rate = (total_redemptions / total_max_uses) * 100
-    else:
-        avg_redemption_rate = 0
+    # Metrics for every code come from one grouped query; the totals are summed from it
+    promo_codes = with_promo_code_stats(PromoCode.objects.filter(event__in=all_events).order_by('-created_at'))
     
     return render(request, 'core/organizer_promo_code_analytics.html', {
         'promo_codes': promo_codes,
-        'total_active_promos': total_active_promos,
-        'total_saved': total_saved,
-        'total_revenue': total_revenue,
-        'avg_redemption_rate': avg_redemption_rate,
+        **get_promo_totals(promo_codes),
         'all_events': all_events,
     })
     
@@ -1022,7 +997,6 @@ def api_get_event_ticket_types(request, event_id):
             'message': f'Error fetching ticket types: {str(e)}'
         }, status=400)
 
-import csv
 import logging
 from datetime import datetime, timedelta
 from decimal import Decimal
@@ -1038,43 +1012,9 @@ def invoice_dashboard(request):
     """
     Admin dashboard for invoice management
     """
-    # Get filter parameters
-    start_date = request.GET.get('start_date')
-    end_date = request.GET.get('end_date')
-    event_id = request.GET.get('event')
-    search_query = request.GET.get('search')
-    
-    # Base queryset
-    invoices = Invoice.objects.select_related(
-        'event', 'user', 'ticket', 'ticket_type', 'transaction'
-    ).order_by('-created_at')
-    
-    # Apply filters
-    if start_date:
-        try:
-            start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
-            invoices = invoices.filter(created_at__date__gte=start_date)
-        except ValueError:
-            messages.error(request, "Invalid start date format")
-    
-    if end_date:
-        try:
-            end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
-            invoices = invoices.filter(created_at__date__lte=end_date)
-        except ValueError:
-            messages.error(request, "Invalid end date format")
-    
-    if event_id:
-        invoices = invoices.filter(event_id=event_id)
-    
-    if search_query:
-        invoices = invoices.filter(
-            Q(invoice_number__icontains=search_query) |
-            Q(ticket__ticket_number__icontains=search_query) |
-            Q(user__email__icontains=search_query) |
-            Q(event__title__icontains=search_query) |
-            Q(transaction__transaction_id__icontains=search_query)
-        )
+    invoices, filters, errors = filter_invoices(request.GET)
+    for error in errors:
+        messages.error(request, error)
     
     # Calculate revenue summary
     total_revenue = invoices.aggregate(
@@ -1101,12 +1041,7 @@ def invoice_dashboard(request):
         'total_invoices': total_invoices,
         'total_amount': total_amount,
         'events': events,
-        'filters': {
-            'start_date': start_date,
-            'end_date': end_date,
-            'event_id': event_id,
-            'search_query': search_query,
-        }
+        'filters': filters,
     }
     
     return render(request, 'ticketing/admin/invoice_dashboard.html', context)
@@ -1137,52 +1072,10 @@ def export_invoices_csv(request):
     """
     Export invoices to CSV format
     """
-    # Get filter parameters (same as dashboard)
-    start_date = request.GET.get('start_date')
-    end_date = request.GET.get('end_date')
-    event_id = request.GET.get('event')
-    search_query = request.GET.get('search')
-    
-    # Base queryset
-    invoices = Invoice.objects.select_related(
-        'event', 'user', 'ticket', 'ticket_type', 'transaction'
-    ).order_by('-created_at')
-    
-    # Apply filters
-    if start_date:
-        try:
-            start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
-            invoices = invoices.filter(created_at__date__gte=start_date)
-        except ValueError:
-            pass
+    # Same filters as the dashboard; bad dates are ignored
+    invoices, _, _ = filter_invoices(request.GET)
     
-    if end_date:
-        try:
-            end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
-            invoices = invoices.filter(created_at__date__lte=end_date)
-        except ValueError:
-            pass
-    
-    if event_id:
-        invoices = invoices.filter(event_id=event_id)
-    
-    if search_query:
-        invoices = invoices.filter(
-            Q(invoice_number__icontains=search_query) |
-            Q(ticket__ticket_number__icontains=search_query) |
-            Q(user__email__icontains=search_query) |
-            Q(event__title__icontains=search_query) |
-            Q(transaction__transaction_id__icontains=search_query)
-        )
-    
-    # Create CSV response
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = f'attachment; filename="invoices_{timezone.now().strftime("%Y%m%d_%H%M%S")}.csv"'
-    
-    writer = csv.writer(response)
-    
-    # Write header
-    writer.writerow([
+    header = [
         'Invoice Number',
         'Event Name',
         'Ticket ID',
@@ -1194,25 +1087,39 @@ def export_invoices_csv(request):
         'Purchase Date & Time',
         'Transaction ID',
         'Order ID',
-    ])
-    
-    # Write data
-    for invoice in invoices:
-        writer.writerow([
-            invoice.invoice_number,
-            invoice.event.title,
-            invoice.ticket.ticket_number,
-            invoice.user.email,
-            invoice.ticket_type.type_name,
-            invoice.base_price,
-            invoice.commission,
-            invoice.total_price,
-            invoice.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-            invoice.transaction.transaction_id or 'N/A',
-            invoice.transaction.order_id,
-        ])
-    
-    return response
+    ]
+    
+    def rows():
+        # Newest first, matching the dashboard; walked in chunks so memory stays flat
+        for invoice in iterate_in_chunks(invoices, descending=True):
+            yield [
+                invoice.invoice_number,
+                invoice.event.title,
+                invoice.ticket.ticket_number,
+                invoice.user.email,
+                invoice.ticket_type.type_name,
+                invoice.base_price,
+                invoice.commission,
+                invoice.total_price,
+                invoice.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+                invoice.transaction.transaction_id or 'N/A',
+                invoice.transaction.order_id,
+            ]
+    
+    filename = f'invoices_{timezone.now().strftime("%Y%m%d_%H%M%S")}.csv'
+    return csv_streaming_response(filename, header, rows())
+
+@login_required
+@user_passes_test(is_admin)
+def export_invoices_zip(request):
+    """
+    Download the PDFs of the filtered invoices as one ZIP. Stored PDFs are streamed as
+    they are; for month-end ranges run `manage.py export_invoice_pdfs` first, which
+    renders the missing ones in parallel.
+    """
+    invoices, _, _ = filter_invoices(request.GET)
+    filename = f'invoices_{timezone.now().strftime("%Y%m%d_%H%M%S")}.zip'
+    return zip_streaming_response(filename, invoices)
 
 @login_required
 @user_passes_test(is_admin)
@@ -1239,7 +1146,8 @@ def invoice_analytics(request):
     
     # Get invoices in date range
     invoices = Invoice.objects.filter(
-        created_at__date__range=[start_date, end_date]
+        created_at__gte=start_of_day(start_date),
+        created_at__lt=start_of_day(end_date + timedelta(days=1)),
     ).select_related('event')
     
     # Calculate analytics
@@ -1329,17 +1237,13 @@ def event_commission_management(request):
 @user_passes_test(is_admin)
 def admin_volunteer_statistics(request):
     """Admin view for volunteer ticket scanning statistics"""
-    from django.db.models import Count, Q
-    from datetime import date, timedelta
+    from datetime import date
     
     # Get filter parameters
     date_filter = request.GET.get('date_filter', 'today')
     event_id = request.GET.get('event_id')
     volunteer_id = request.GET.get('volunteer_id')
     
-    # Base queryset for volunteers
-    volunteers = User.objects.filter(role='VOLUNTEER').select_related()
-    
     # Date filtering
     today = date.today()
     if date_filter == 'today':
@@ -1362,7 +1266,7 @@ def admin_volunteer_statistics(request):
     ticket_filters = Q(validated_by__role='VOLUNTEER')
     
     if start_date and end_date:
-        ticket_filters &= Q(used_at__date__range=[start_date, end_date])
+        ticket_filters &= Q(used_at__gte=start_of_day(start_date), used_at__lt=start_of_day(end_date + timedelta(days=1)))
     
     if event_id:
         ticket_filters &= Q(event_id=event_id)
@@ -1370,62 +1274,77 @@ def admin_volunteer_statistics(request):
     if volunteer_id:
         ticket_filters &= Q(validated_by_id=volunteer_id)
     
-    # Get all tickets validated by volunteers with the filters
-    validated_tickets = Ticket.objects.filter(ticket_filters).select_related(
-        'validated_by', 'event', 'ticket_type'
-    ).order_by('-used_at')
+    validated_tickets = Ticket.objects.filter(ticket_filters)
+    
+    # One grouped query: scans and attendees per volunteer and event
+    rows = validated_tickets.values('validated_by_id', 'event__title').annotate(
+        scanned=Count('id'),
+        valid=Count('id', filter=Q(status='USED')),
+        attendees=Sum('total_admission_count'),
+        last_scan=Max('used_at'),
+    ).order_by('validated_by_id', '-scanned')
+    
+    totals = {}
+    for row in rows:
+        stats = totals.setdefault(row['validated_by_id'], {
+            'total_scanned': 0,
+            'valid_entries': 0,
+            'total_attendees': 0,
+            'last_scan': None,
+            'event_breakdown': {},
+        })
+        stats['total_scanned'] += row['scanned']
+        stats['valid_entries'] += row['valid']
+        stats['total_attendees'] += row['attendees'] or 0
+        if row['last_scan'] and (stats['last_scan'] is None or row['last_scan'] > stats['last_scan']):
+            stats['last_scan'] = row['last_scan']
+        event_name = row['event__title'] or 'Unknown Event'
+        breakdown = stats['event_breakdown'].setdefault(event_name, {'count': 0, 'attendees': 0})
+        breakdown['count'] += row['scanned']
+        breakdown['attendees'] += row['attendees'] or 0
+    
+    # Rejected attempts come from the per-minute scan counters
+    counter_filters = Q(volunteer__role='VOLUNTEER')
+    if start_date and end_date:
+        counter_filters &= Q(minute__gte=start_of_day(start_date), minute__lt=start_of_day(end_date + timedelta(days=1)))
+    if event_id:
+        counter_filters &= Q(event_id=event_id)
+    if volunteer_id:
+        counter_filters &= Q(volunteer_id=volunteer_id)
+    rejected = dict(
+        CheckInCounter.objects.filter(counter_filters).values('volunteer_id').annotate(
+            total=Sum('rejected'),
+        ).values_list('volunteer_id', 'total')
+    )
     
-    # Calculate statistics for each volunteer
+    # Every volunteer is listed only when no filter narrows the view, otherwise just the active ones
+    volunteers = User.objects.filter(role='VOLUNTEER')
+    if any([date_filter != 'all', event_id, volunteer_id]):
+        volunteers = volunteers.filter(id__in=totals)
+    volunteers = list(volunteers)
+    
+    # The ten most recent scans of each listed volunteer in one windowed query
+    recent_scans = {}
+    recent = validated_tickets.filter(validated_by__in=volunteers).select_related('event').annotate(
+        scan_rank=Window(RowNumber(), partition_by=F('validated_by_id'), order_by=F('used_at').desc()),
+    ).filter(scan_rank__lte=10).order_by('validated_by_id', '-used_at')
+    for ticket in recent:
+        recent_scans.setdefault(ticket.validated_by_id, []).append(ticket)
+    
+    empty = {'total_scanned': 0, 'valid_entries': 0, 'total_attendees': 0, 'last_scan': None, 'event_breakdown': {}}
     volunteer_stats = []
     for volunteer in volunteers:
-        volunteer_tickets = validated_tickets.filter(validated_by=volunteer)
-        
-        # Calculate basic stats
-        total_scanned = volunteer_tickets.count()
-        valid_entries = volunteer_tickets.filter(status='USED').count()
-        
-        # Calculate total attendees (considering tickets with multiple attendees)
-        total_attendees = sum(
-            ticket.total_admission_count or 1 
-            for ticket in volunteer_tickets
-        )
-        
-        # Get recent scans (last 10)
-        recent_scans = volunteer_tickets[:10]
-        
-        # Get event breakdown
-        event_breakdown = {}
-        for ticket in volunteer_tickets:
-            event_name = ticket.event.title if ticket.event else 'Unknown Event'
-            if event_name not in event_breakdown:
-                event_breakdown[event_name] = {
-                    'count': 0,
-                    'attendees': 0
-                }
-            event_breakdown[event_name]['count'] += 1
-            event_breakdown[event_name]['attendees'] += ticket.total_admission_count or 1
-        
-        # Convert to list for easier JSON serialization
-        event_breakdown_list = [
-            {'event_name': k, 'count': v['count'], 'attendees': v['attendees']} 
-            for k, v in event_breakdown.items()
-        ]
-        
-        # Only include volunteers who have scanned tickets (if filtering)
-        if volunteer_id and str(volunteer.id) != volunteer_id:
-            continue
-            
-        if total_scanned > 0 or not any([date_filter != 'all', event_id, volunteer_id]):
-            volunteer_stats.append({
-                'volunteer': volunteer,
-                'total_scanned': total_scanned,
-                'valid_entries': valid_entries,
-                'total_attendees': total_attendees,
-                'recent_scans': recent_scans,
-                'event_breakdown': event_breakdown,
-                'event_breakdown_list': event_breakdown_list,
-                'last_scan': volunteer_tickets.first().used_at if volunteer_tickets.exists() else None
-            })
+        stats = totals.get(volunteer.id, empty)
+        volunteer_stats.append({
+            'volunteer': volunteer,
+            **stats,
+            'rejected_scans': rejected.get(volunteer.id) or 0,
+            'recent_scans': recent_scans.get(volunteer.id, []),
+            'event_breakdown_list': [
+                {'event_name': name, 'count': data['count'], 'attendees': data['attendees']}
+                for name, data in stats['event_breakdown'].items()
+            ],
+        })
     
     # Sort by total scanned (most active first)
     volunteer_stats.sort(key=lambda x: x['total_scanned'], reverse=True)
@@ -1440,11 +1359,8 @@ def admin_volunteer_statistics(request):
     ).distinct().order_by('first_name', 'last_name', 'email')
     
     # Calculate summary statistics
-    total_scanned_all = validated_tickets.count()
-    total_attendees_all = sum(
-        ticket.total_admission_count or 1 
-        for ticket in validated_tickets
-    )
+    total_scanned_all = sum(stats['total_scanned'] for stats in totals.values())
+    total_attendees_all = sum(stats['total_attendees'] for stats in totals.values())
     active_volunteers_count = len([v for v in volunteer_stats if v['total_scanned'] > 0])
     
     context = {
@@ -1460,13 +1376,21 @@ def admin_volunteer_statistics(request):
             'total_scanned': total_scanned_all,
             'total_attendees': total_attendees_all,
             'active_volunteers': active_volunteers_count,
-            'total_volunteers': volunteers.count(),
+            'total_volunteers': User.objects.filter(role='VOLUNTEER').count(),
         },
         'date_range_text': _get_date_range_text(date_filter, start_date, end_date),
     }
     
     return render(request, 'core/admin/volunteer_statistics.html', context)
 
+@login_required
+@user_passes_test(is_admin)
+@require_http_methods(["GET"])
+def admin_gateway_metrics(request):
+    """Cashfree client call counts, latency percentiles and circuit state for this server process"""
+    return JsonResponse(get_cashfree_gateway().get_metrics())
+
+
 def _get_date_range_text(date_filter, start_date, end_date):
     """Helper function to get human-readable date range text"""
     if date_filter == 'today':
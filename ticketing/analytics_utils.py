@@ -0,0 +1,179 @@
+import logging
+from datetime import timedelta
+from decimal import Decimal
+from django.db.models import Count, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+from .models import Ticket
+
+logger = logging.getLogger(__name__)
+
+# Dashboard revenue is booked on SOLD tickets at the ticket type price,
+# check-ins are tickets the volunteers have marked USED.
+SOLD = Q(status='SOLD')
+CHECKED_IN = Q(status='USED')
+TICKET_PRICE = Coalesce('ticket_type__price', Value(Decimal('0.00')))
+TICKET_ATTENDEES = Coalesce('ticket_type__attendees_per_ticket', Value(1))
+
+
+def percent_change(current, previous):
+    """Whole-number percentage change, 0 when there is nothing to compare against"""
+    if not previous:
+        return 0
+    return round((float(current) - float(previous)) / float(previous) * 100)
+
+
+def get_event_totals(event_ids):
+    """
+    Per-event totals in a single grouped query.
+    Returns {event_id: {'tickets': all tickets, 'tickets_sold', 'revenue', 'attendees', 'checked_in'}}
+    """
+    rows = Ticket.objects.filter(event_id__in=event_ids).values('event_id').annotate(
+        tickets=Count('id'),
+        tickets_sold=Count('id', filter=SOLD),
+        revenue=Sum(TICKET_PRICE, filter=SOLD),
+        attendees=Sum(TICKET_ATTENDEES, filter=SOLD),
+        checked_in=Count('id', filter=CHECKED_IN),
+    )
+    return {
+        row['event_id']: {
+            'tickets': row['tickets'],
+            'tickets_sold': row['tickets_sold'],
+            'revenue': row['revenue'] or Decimal('0.00'),
+            'attendees': row['attendees'] or 0,
+            'checked_in': row['checked_in'],
+        }
+        for row in rows
+    }
+
+
+def get_sales_comparison(event_ids, now=None):
+    """
+    Week-over-week ticket sales and month-over-month revenue in one aggregate query.
+    "This week" is the last 7 days, "last week" the 7 days before that;
+    months are rolling 30-day windows.
+    """
+    now = now or timezone.now()
+    week_start = now - timedelta(days=7)
+    prev_week_start = now - timedelta(days=14)
+    month_start = now - timedelta(days=30)
+    prev_month_start = now - timedelta(days=60)
+
+    totals = Ticket.objects.filter(SOLD, event_id__in=event_ids).aggregate(
+        tickets_this_week=Count('id', filter=Q(purchase_date__gte=week_start)),
+        tickets_last_week=Count('id', filter=Q(purchase_date__gte=prev_week_start, purchase_date__lt=week_start)),
+        revenue_this_month=Sum(TICKET_PRICE, filter=Q(purchase_date__gte=month_start)),
+        revenue_last_month=Sum(TICKET_PRICE, filter=Q(purchase_date__gte=prev_month_start, purchase_date__lt=month_start)),
+    )
+    totals['revenue_this_month'] = totals['revenue_this_month'] or Decimal('0.00')
+    totals['revenue_last_month'] = totals['revenue_last_month'] or Decimal('0.00')
+    totals['tickets_change'] = percent_change(totals['tickets_this_week'], totals['tickets_last_week'])
+    totals['revenue_change'] = percent_change(totals['revenue_this_month'], totals['revenue_last_month'])
+    return totals
+
+
+def get_daily_sales(event_ids):
+    """
+    Tickets sold and revenue per purchase day, oldest first.
+    Tickets without a purchase date are counted on today, as the dashboards always did.
+    """
+    rows = Ticket.objects.filter(SOLD, event_id__in=event_ids).annotate(
+        day=TruncDate('purchase_date')
+    ).values('day').annotate(
+        tickets=Count('id'),
+        revenue=Sum(TICKET_PRICE),
+    ).order_by('day')
+
+    today = timezone.localdate()
+    by_day = {}
+    for row in rows:
+        day = row['day'] or today
+        entry = by_day.setdefault(day, {'date': day, 'tickets': 0, 'revenue': Decimal('0.00')})
+        entry['tickets'] += row['tickets']
+        entry['revenue'] += row['revenue'] or Decimal('0.00')
+    return [by_day[day] for day in sorted(by_day)]
+
+
+def get_ticket_type_breakdown(event_ids):
+    """Sold tickets and revenue per ticket type: {ticket_type_id: {'name', 'count', 'revenue'}}"""
+    rows = Ticket.objects.filter(SOLD, event_id__in=event_ids, ticket_type__isnull=False).values(
+        'ticket_type_id', 'ticket_type__type_name'
+    ).annotate(
+        count=Count('id'),
+        revenue=Sum(TICKET_PRICE),
+    ).order_by('ticket_type_id')
+    return {
+        row['ticket_type_id']: {
+            'name': row['ticket_type__type_name'],
+            'count': row['count'],
+            'revenue': float(row['revenue'] or 0),
+        }
+        for row in rows
+    }
+
+
+def get_organizer_dashboard_stats(events):
+    """
+    Everything the organizer dashboard shows for a list of events,
+    computed in a fixed number of queries regardless of how many events there are.
+    """
+    event_ids = [event.id for event in events]
+    event_totals = get_event_totals(event_ids)
+    comparison = get_sales_comparison(event_ids)
+    daily_sales = get_daily_sales(event_ids)
+    ticket_types = get_ticket_type_breakdown(event_ids)
+
+    empty = {'tickets': 0, 'tickets_sold': 0, 'revenue': Decimal('0.00'), 'attendees': 0, 'checked_in': 0}
+    per_event = [event_totals.get(event.id, empty) for event in events]
+
+    total_tickets_sold = sum(totals['tickets_sold'] for totals in per_event)
+    total_checked_in = sum(totals['checked_in'] for totals in per_event)
+    checked_in_percentage = None
+    if total_tickets_sold > 0:
+        checked_in_percentage = round(total_checked_in / total_tickets_sold * 100)
+
+    return {
+        'total_revenue': sum((totals['revenue'] for totals in per_event), Decimal('0.00')),
+        'total_tickets_sold': total_tickets_sold,
+        'total_attendees': sum(totals['attendees'] for totals in per_event),
+        'revenue_dates': [day['date'].strftime('%b %d') for day in daily_sales],
+        'revenue_amounts': [float(day['revenue']) for day in daily_sales],
+        'ticket_types_data': [{'name': data['name'], 'count': data['count']} for data in ticket_types.values()],
+        'event_names': [event.title for event in events],
+        'total_tickets': [totals['tickets_sold'] for totals in per_event],
+        'checked_in_tickets': [totals['checked_in'] for totals in per_event],
+        'event_revenues': {event.id: totals['revenue'] for event, totals in zip(events, per_event)},
+        'event_checkins': {event.id: totals['checked_in'] for event, totals in zip(events, per_event)},
+        'event_ticket_counts': {event.id: totals['tickets'] for event, totals in zip(events, per_event)},
+        'tickets_change': comparison['tickets_change'],
+        'revenue_change': comparison['revenue_change'],
+        'checked_in_percentage': checked_in_percentage,
+    }
+
+
+def get_event_dashboard_stats(event):
+    """Revenue, sales-over-time and ticket type breakdown for a single event's dashboard"""
+    totals = get_event_totals([event.id]).get(event.id, {})
+    daily_sales = get_daily_sales([event.id])
+    sold_by_type = get_ticket_type_breakdown([event.id])
+
+    # Every ticket type is listed, including the ones that have not sold yet
+    ticket_types_data = []
+    for ticket_type in event.ticket_types.all():
+        sold = sold_by_type.get(ticket_type.id, {})
+        ticket_types_data.append({
+            'name': ticket_type.type_name,
+            'count': sold.get('count', 0),
+            'revenue': sold.get('revenue', 0),
+        })
+
+    tickets_sold = totals.get('tickets_sold', 0)
+    return {
+        'total_revenue': totals.get('revenue', Decimal('0.00')),
+        'tickets_sold': tickets_sold,
+        'tickets_remaining': event.capacity - tickets_sold,
+        'checked_in': totals.get('checked_in', 0),
+        'sales_dates': [day['date'].strftime('%b %d') for day in daily_sales],
+        'sales_counts': [day['tickets'] for day in daily_sales],
+        'ticket_types_data': ticket_types_data,
+    }
@@ -10,7 +10,7 @@ import random
 import string
 import hmac
 import hashlib
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw
 from io import BytesIO
 from django.conf import settings
 import base64
@@ -21,6 +21,8 @@ import logging
 from django.conf import settings
 
 from .models import User, TicketType, Ticket
+from .capacity_utils import record_tickets_sold
+from .render_assets_utils import get_font
 
 # Get the logger instance for this module
 logger = logging.getLogger(__name__)
@@ -68,6 +70,7 @@ def api_checkout_ticket(request):
             unique_secure_token=unique_secure_token,
             unique_id=uuid.uuid4()  # Ensure unique_id is set
         )
+        record_tickets_sold([ticket])
         
         return JsonResponse({
             'success': True,
@@ -182,11 +185,8 @@ def generate_ticket_image(ticket):
     # Add text information using PIL's ImageDraw
     draw = ImageDraw.Draw(result_image)
     
-    try:
-        # Try to use a system font
-        font = ImageFont.truetype("arial.ttf", 16)
-    except IOError:
-        font = ImageFont.load_default()
+    # Font is parsed once per process by the asset cache
+    font = get_font(16)
     
     # Add ticket information text
     text_y = 30
@@ -0,0 +1,242 @@
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q, Sum, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from .models import Event, TicketType, Ticket, CapacityHold
+from .promo_utils import release_promo_code
+
+logger = logging.getLogger(__name__)
+
+# Ticket statuses that occupy event capacity. USED tickets still count - a
+# checked-in attendee does not free up a seat for somebody else.
+SOLD_STATUSES = ('SOLD', 'VALID', 'USED')
+
+
+class CapacityError(ValueError):
+    """Raised when an event does not have enough remaining capacity"""
+    def __init__(self, requested, available):
+        self.requested = requested
+        self.available = available
+        super().__init__(f'Not enough event capacity. Need {requested}, available {available}.')
+
+
+def add_sold_attendees(event_id, ticket_type_id, attendees):
+    """
+    Atomically add attendees to the Event and TicketType sold counters.
+    Uses F() expressions so concurrent ticket issuance never loses an update.
+    """
+    if not attendees:
+        return
+    Event.objects.filter(pk=event_id).update(attendees_sold=F('attendees_sold') + attendees)
+    if ticket_type_id:
+        TicketType.objects.filter(pk=ticket_type_id).update(attendees_sold=F('attendees_sold') + attendees)
+
+
+def release_sold_attendees(event_id, ticket_type_id, attendees):
+    """
+    Atomically remove attendees from the sold counters (refunds, deletes, status changes).
+    Counters are floored at zero so a stale ledger can never go negative.
+    """
+    if not attendees:
+        return
+    Event.objects.filter(pk=event_id).update(
+        attendees_sold=Greatest(F('attendees_sold') - attendees, Value(0))
+    )
+    if ticket_type_id:
+        TicketType.objects.filter(pk=ticket_type_id).update(
+            attendees_sold=Greatest(F('attendees_sold') - attendees, Value(0))
+        )
+
+
+def record_tickets_sold(tickets):
+    """Add the admissions of freshly issued tickets to the capacity ledger"""
+    totals = {}
+    for ticket in tickets:
+        if ticket.status not in SOLD_STATUSES:
+            continue
+        key = (ticket.event_id, ticket.ticket_type_id)
+        totals[key] = totals.get(key, 0) + (ticket.total_admission_count or 1)
+
+    for (event_id, ticket_type_id), attendees in totals.items():
+        add_sold_attendees(event_id, ticket_type_id, attendees)
+
+
+def record_ticket_removed(ticket):
+    """Release the capacity held by a ticket that is being deleted or refunded"""
+    if ticket.status in SOLD_STATUSES:
+        release_sold_attendees(ticket.event_id, ticket.ticket_type_id, ticket.total_admission_count or 1)
+
+
+def record_ticket_changed(old_ticket, new_ticket):
+    """
+    Move capacity between ledgers when an existing ticket is edited.
+    Handles status changes (e.g. SOLD -> AVAILABLE) as well as event/type reassignment.
+    """
+    record_ticket_removed(old_ticket)
+    record_tickets_sold([new_ticket])
+
+
+def reconcile_capacity(event_ids=None, dry_run=False):
+    """
+    Rebuild the attendees_sold counters from the Ticket table and
+    attendees_held from the ACTIVE capacity holds.
+    Returns a list of (event, old_value, new_value) tuples for events whose counter drifted.
+    With dry_run=True the drift is reported but nothing is written.
+    """
+    events = Event.objects.all()
+    ticket_types = TicketType.objects.all()
+    sold_tickets = Ticket.objects.filter(status__in=SOLD_STATUSES)
+    if event_ids:
+        events = events.filter(id__in=event_ids)
+        ticket_types = ticket_types.filter(event_id__in=event_ids)
+        sold_tickets = sold_tickets.filter(event_id__in=event_ids)
+
+    drifted = []
+    with transaction.atomic():
+        # Lock the counter rows first so tickets issued meanwhile wait for the rebuild
+        locked_events = list(events.select_for_update().only('id', 'title', 'attendees_sold', 'attendees_held'))
+        locked_types = list(ticket_types.select_for_update().only('id', 'attendees_sold'))
+
+        event_totals = dict(
+            sold_tickets.values('event_id').annotate(total=Sum('total_admission_count')).values_list('event_id', 'total')
+        )
+        held_totals = dict(
+            CapacityHold.objects.filter(status='ACTIVE', event__in=locked_events)
+            .values('event_id').annotate(total=Sum('attendees')).values_list('event_id', 'total')
+        )
+        type_totals = dict(
+            sold_tickets.exclude(ticket_type__isnull=True)
+            .values('ticket_type_id').annotate(total=Sum('total_admission_count'))
+            .values_list('ticket_type_id', 'total')
+        )
+
+        for event in locked_events:
+            expected = event_totals.get(event.id) or 0
+            expected_held = held_totals.get(event.id) or 0
+            if event.attendees_sold != expected:
+                drifted.append((event, event.attendees_sold, expected))
+            if not dry_run and (event.attendees_sold != expected or event.attendees_held != expected_held):
+                Event.objects.filter(pk=event.pk).update(attendees_sold=expected, attendees_held=expected_held)
+
+        for ticket_type in locked_types:
+            expected = type_totals.get(ticket_type.id) or 0
+            if ticket_type.attendees_sold != expected and not dry_run:
+                TicketType.objects.filter(pk=ticket_type.pk).update(attendees_sold=expected)
+
+    if drifted and not dry_run:
+        logger.warning(f"Capacity ledger reconciled for {len(drifted)} events")
+    return drifted
+
+
+# --- Checkout capacity holds ---
+
+def get_hold_ttl():
+    return timedelta(minutes=getattr(settings, 'CAPACITY_HOLD_TTL_MINUTES', 15))
+
+
+def place_hold(event_id, attendees, payment_transaction):
+    """
+    Reserve capacity for a checkout while the customer pays.
+    The Event row is locked with select_for_update so concurrent checkouts are
+    serialised and can never hold more seats than the event has left.
+    Raises CapacityError if the event cannot fit the requested attendees.
+    """
+    with transaction.atomic():
+        event = Event.objects.select_for_update().get(pk=event_id)
+        available = event.remaining_attendee_capacity
+        if attendees > available:
+            raise CapacityError(attendees, available)
+
+        hold = CapacityHold.objects.create(
+            event=event,
+            transaction=payment_transaction,
+            user=payment_transaction.user,
+            attendees=attendees,
+            expires_at=timezone.now() + get_hold_ttl(),
+        )
+        Event.objects.filter(pk=event.pk).update(attendees_held=F('attendees_held') + attendees)
+
+    logger.info(f"Placed capacity hold of {attendees} attendees on event {event_id} for order {payment_transaction.order_id}")
+    return hold
+
+
+def _close_hold(hold, status):
+    """Mark a locked ACTIVE hold as CONSUMED/RELEASED and give its seats back to the held counter"""
+    hold.status = status
+    hold.save(update_fields=['status', 'updated_at'])
+    Event.objects.filter(pk=hold.event_id).update(
+        attendees_held=Greatest(F('attendees_held') - hold.attendees, Value(0))
+    )
+
+
+def release_hold(payment_transaction):
+    """Release the active hold of a failed, cancelled or abandoned checkout. Returns True if a hold was released"""
+    with transaction.atomic():
+        hold = CapacityHold.objects.select_for_update().filter(
+            transaction=payment_transaction, status='ACTIVE'
+        ).first()
+        if not hold:
+            return False
+        _close_hold(hold, 'RELEASED')
+
+    logger.info(f"Released capacity hold of {hold.attendees} attendees for order {payment_transaction.order_id}")
+    return True
+
+
+def claim_capacity(event_id, attendees, payment_transaction):
+    """
+    Secure capacity for issuing tickets after a successful payment.
+    Must be called inside the transaction that creates the tickets. An active
+    hold for the order is consumed as-is; orders without one (legacy sessions,
+    or a hold already swept after expiry) fall back to a capacity check taken
+    under the Event row lock. Returns the locked Event.
+    """
+    event = Event.objects.select_for_update().get(pk=event_id)
+    hold = CapacityHold.objects.select_for_update().filter(
+        transaction=payment_transaction, status='ACTIVE'
+    ).first()
+
+    if hold:
+        _close_hold(hold, 'CONSUMED')
+        return event
+
+    available = event.remaining_attendee_capacity
+    if attendees > available:
+        raise CapacityError(attendees, available)
+    return event
+
+
+def get_stale_holds(now=None):
+    """ACTIVE holds whose checkout timed out or whose payment failed (paid orders are left to be consumed)"""
+    now = now or timezone.now()
+    return CapacityHold.objects.filter(status='ACTIVE').filter(
+        Q(expires_at__lte=now) | Q(transaction__status__in=['FAILED', 'CANCELLED'])
+    ).exclude(transaction__status='SUCCESS')
+
+
+def release_expired_holds(now=None):
+    """
+    Sweep holds whose checkout timed out or whose payment failed, giving back the
+    promo code slot reserved for the same checkout with the seats.
+    Returns the number of holds released.
+    """
+    stale_hold_ids = list(get_stale_holds(now).values_list('id', flat=True))
+
+    released = 0
+    for hold_id in stale_hold_ids:
+        with transaction.atomic():
+            hold = CapacityHold.objects.select_for_update().select_related(
+                'transaction__purchase_order'
+            ).filter(id=hold_id, status='ACTIVE').first()
+            if hold:
+                _close_hold(hold, 'RELEASED')
+                if hold.transaction.purchase_order_id:
+                    release_promo_code(hold.transaction.purchase_order)
+                released += 1
+
+    if released:
+        logger.info(f"Released {released} expired capacity holds")
+    return released
@@ -0,0 +1,77 @@
+import logging
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Min
+from django.utils import timezone
+from .models import Event
+
+logger = logging.getLogger(__name__)
+
+CATALOGUE_VERSION_KEY = 'event_catalogue:version'
+
+
+def get_catalogue_timeout():
+    return getattr(settings, 'EVENT_CATALOGUE_CACHE_TIMEOUT', 60)
+
+
+def _catalogue_key():
+    version = cache.get(CATALOGUE_VERSION_KEY)
+    if version is None:
+        version = 1
+        cache.add(CATALOGUE_VERSION_KEY, version, None)
+    return f"event_catalogue:v{version}"
+
+
+def build_event_catalogue():
+    """Published events, newest first, with their cheapest ticket price computed by the database"""
+    events = Event.objects.filter(status='PUBLISHED').annotate(
+        min_price=Min('ticket_types__price')
+    ).order_by('-created_at')
+    return [
+        {
+            'event': event,
+            'min_price': event.min_price,
+            'registration_start_date': event.registration_start_date,
+        }
+        for event in events
+    ]
+
+
+def get_event_catalogue():
+    """
+    The published event catalogue used by the home page, event list and customer dashboard.
+
+    Served from the cache; tickets_are_live is worked out per request from the
+    cached registration start date, so sales opening never needs a cache refresh.
+    """
+    key = _catalogue_key()
+    catalogue = cache.get(key)
+    if catalogue is None:
+        catalogue = build_event_catalogue()
+        cache.set(key, catalogue, get_catalogue_timeout())
+
+    now = timezone.now()
+    return [
+        {
+            'event': entry['event'],
+            'min_price': entry['min_price'],
+            'tickets_are_live': entry['registration_start_date'] is None or now >= entry['registration_start_date'],
+        }
+        for entry in catalogue
+    ]
+
+
+def get_upcoming_event_catalogue():
+    """Catalogue entries for events that have not happened yet, soonest first"""
+    today = timezone.localdate()
+    upcoming = [entry for entry in get_event_catalogue() if entry['event'].date >= today]
+    upcoming.sort(key=lambda entry: entry['event'].date)
+    return upcoming
+
+
+def invalidate_event_catalogue():
+    """Start a new catalogue version; the old cached entry simply expires"""
+    try:
+        cache.incr(CATALOGUE_VERSION_KEY)
+    except ValueError:
+        cache.set(CATALOGUE_VERSION_KEY, 2, None)
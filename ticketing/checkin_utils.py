@@ -0,0 +1,284 @@
+import hashlib
+import hmac
+import json
+import logging
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.crypto import salted_hmac
+from .models import Ticket
+from .occupancy_utils import move_check_in, record_check_ins
+
+logger = logging.getLogger(__name__)
+
+# Statuses a ticket can be admitted from, and the statuses listed in an offline manifest
+ADMITTABLE_STATUSES = ('SOLD', 'VALID')
+MANIFEST_STATUSES = ('SOLD', 'VALID', 'USED')
+MANIFEST_SALT = 'ticketing.checkin_manifest'
+
+
+def hash_token(token):
+    """SHA-256 of a ticket's secure token, as listed in offline manifests"""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def manifest_digest(tickets):
+    """SHA-256 of a manifest's ticket rows as compact JSON; the scanner page computes the same digest"""
+    return hashlib.sha256(json.dumps(tickets, separators=(',', ':')).encode()).hexdigest()
+
+
+def sign_manifest(event_id, generated_at, digest):
+    """HMAC binding a manifest's event, generation time and ticket rows"""
+    return salted_hmac(MANIFEST_SALT, f"{event_id}:{generated_at}:{digest}", algorithm='sha256').hexdigest()
+
+
+def verify_manifest(event_id, stamp):
+    """
+    Check the stamp ({'generated_at', 'digest', 'signature'}) a scanner sends for the
+    manifest it holds. The device cannot check the HMAC itself, so it sends the digest
+    of its stored ticket rows instead of the whole manifest.
+    Returns the manifest's generation time, or None if this server did not sign it.
+    """
+    if not isinstance(stamp, dict):
+        return None
+    try:
+        generated_at = int(stamp.get('generated_at'))
+    except (TypeError, ValueError):
+        return None
+    expected = sign_manifest(event_id, generated_at, str(stamp.get('digest', '')))
+    if not hmac.compare_digest(expected, str(stamp.get('signature', ''))):
+        return None
+    return datetime.fromtimestamp(generated_at, tz=dt_timezone.utc)
+
+
+def build_event_manifest(event):
+    """
+    Compact list of the event's admittable tickets for offline scanning.
+
+    Each row is [ticket id, sha256(secure token), admission count, status]; only the
+    token hash is shipped, so a lost device cannot be used to forge passes.
+    Returns {'manifest': ..., 'signature': ...}; scanners send the signature back with
+    every sync, see verify_manifest.
+    """
+    rows = Ticket.objects.filter(
+        event=event,
+        status__in=MANIFEST_STATUSES,
+        unique_secure_token__isnull=False,
+    ).order_by('id').values_list('id', 'unique_secure_token', 'total_admission_count', 'status')
+
+    manifest = {
+        'event_id': event.id,
+        'generated_at': int(timezone.now().timestamp()),
+        'tickets': [
+            [ticket_id, hash_token(token), admission_count or 1, status]
+            for ticket_id, token, admission_count, status in rows
+        ],
+    }
+    signature = sign_manifest(event.id, manifest['generated_at'], manifest_digest(manifest['tickets']))
+    return {'manifest': manifest, 'signature': signature}
+
+
+def parse_scan_time(value, not_before=None):
+    """
+    Scan time sent by a device (epoch milliseconds), never later than now and never
+    earlier than not_before (the generation time of the manifest it was scanned against)
+    """
+    now = timezone.now()
+    try:
+        scanned_at = datetime.fromtimestamp(int(value) / 1000, tz=dt_timezone.utc)
+    except (TypeError, ValueError, OverflowError, OSError):
+        return now
+    if not_before is not None:
+        scanned_at = max(scanned_at, not_before)
+    return min(scanned_at, now)
+
+
+def apply_offline_checkins(event, scans, volunteer, not_before=None):
+    """
+    Apply check-ins queued by offline scanners.
+
+    scans is a list of {'tid', 'tok', 'scanned_at'} dicts, possibly from several
+    devices and possibly containing the same ticket more than once. Conflicts are
+    resolved deterministically: the earliest scan of a ticket is the admission and
+    its time becomes used_at, even when another device already synced a later one.
+    Every update is conditional, so concurrent syncs cannot overwrite an earlier scan.
+    Scan times are device clocks, so they are clamped to not_before (when the verified
+    manifest was generated): a backdated scan cannot take over an earlier check-in.
+
+    Returns one result dict per scan, in the order received, with 'result' one of
+    ADMITTED, DUPLICATE, INVALID_TOKEN, INVALID_STATUS or NOT_FOUND.
+    """
+    parsed = []
+    for index, scan in enumerate(scans):
+        try:
+            ticket_id = int(scan.get('tid'))
+        except (TypeError, ValueError):
+            ticket_id = None
+        parsed.append({
+            'index': index,
+            'ticket_id': ticket_id,
+            'token': scan.get('tok') or '',
+            'scanned_at': parse_scan_time(scan.get('scanned_at'), not_before),
+        })
+
+    tickets = Ticket.objects.filter(
+        event=event,
+        id__in={scan['ticket_id'] for scan in parsed if scan['ticket_id'] is not None},
+    ).only('id', 'event_id', 'unique_secure_token', 'status', 'used_at', 'validated_by_id', 'total_admission_count').in_bulk()
+
+    results = [None] * len(parsed)
+    earliest = {}
+    for scan in parsed:
+        ticket = tickets.get(scan['ticket_id'])
+        if ticket is None:
+            results[scan['index']] = {'tid': scan['ticket_id'], 'result': 'NOT_FOUND'}
+        elif not ticket.unique_secure_token or not hmac.compare_digest(ticket.unique_secure_token, scan['token']):
+            results[scan['index']] = {'tid': ticket.id, 'result': 'INVALID_TOKEN'}
+        elif ticket.status not in MANIFEST_STATUSES:
+            results[scan['index']] = {'tid': ticket.id, 'result': 'INVALID_STATUS'}
+        else:
+            first = earliest.get(ticket.id)
+            if first is None or scan['scanned_at'] < first['scanned_at']:
+                earliest[ticket.id] = scan
+
+    check_ins = []
+    for ticket_id, scan in earliest.items():
+        admitted = Ticket.objects.filter(pk=ticket_id, status__in=ADMITTABLE_STATUSES).update(
+            status='USED', used_at=scan['scanned_at'], validated_by=volunteer,
+        )
+        if admitted:
+            ticket = tickets[ticket_id]
+            check_ins.append((ticket.event_id, volunteer.id, ticket.total_admission_count, scan['scanned_at']))
+        else:
+            # Already checked in (online or by another device): keep whichever scan came first,
+            # moving the check-in counter along so per-volunteer and occupancy numbers match
+            admitted = 0
+            with transaction.atomic():
+                previous = Ticket.objects.select_for_update().filter(
+                    pk=ticket_id, status='USED', used_at__gt=scan['scanned_at'],
+                ).values('used_at', 'validated_by_id').first()
+                if previous is not None:
+                    admitted = Ticket.objects.filter(pk=ticket_id).update(used_at=scan['scanned_at'], validated_by=volunteer)
+                    ticket = tickets[ticket_id]
+                    move_check_in(
+                        ticket.event_id, ticket.total_admission_count,
+                        (previous['validated_by_id'], previous['used_at']), (volunteer.id, scan['scanned_at']),
+                    )
+        scan['admitted'] = bool(admitted)
+        if admitted:
+            scan['used_at'] = scan['scanned_at']
+        else:
+            scan['used_at'] = Ticket.objects.filter(pk=ticket_id).values_list('used_at', flat=True).first()
+
+    record_check_ins(check_ins)
+
+    for scan in parsed:
+        if results[scan['index']] is not None:
+            continue
+        winner = earliest[scan['ticket_id']]
+        results[scan['index']] = {
+            'tid': scan['ticket_id'],
+            'result': 'ADMITTED' if scan is winner and winner['admitted'] else 'DUPLICATE',
+            'used_at': winner['used_at'].isoformat() if winner['used_at'] else None,
+        }
+
+    admitted_count = sum(1 for result in results if result['result'] == 'ADMITTED')
+    logger.info(f"Offline sync by {volunteer.email} for event {event.id}: {len(scans)} scans, {admitted_count} admitted")
+    return results
+
+
+def scan_signature(ticket_id, token, timestamp):
+    """The 16 hex character HMAC that create_signed_ticket_data puts in a pass QR code"""
+    secret_key = settings.SECRET_KEY.encode()
+    message = f"{ticket_id}:{token}:{timestamp}".encode()
+    return hmac.new(secret_key, message, hashlib.sha256).hexdigest()[:16]
+
+
+def ticket_details(ticket):
+    """Ticket fields shown by the scanner for every validation outcome"""
+    return {
+        'ticket_number': ticket.ticket_number,
+        'ticket_type_name': ticket.ticket_type.type_name if ticket.ticket_type else 'General Admission',
+        'event_name': ticket.event.title,
+        'entry_count': ticket.total_admission_count,
+        'booking_quantity': ticket.booking_quantity,
+    }
+
+
+def validate_ticket_batch(payloads, user):
+    """
+    Validate several scanned QR payloads ({'tid', 'tok', 'ts', 'sig'}) at once.
+
+    Signatures are checked in one pass, the tickets are loaded and row-locked with a
+    single id__in query (event and ticket type joined in), and every admittable
+    ticket is marked USED by one conditional UPDATE. Must run inside a transaction.
+    Returns one result per payload, in the same order.
+    """
+    results = [None] * len(payloads)
+    wanted = {}
+    for index, payload in enumerate(payloads):
+        ticket_id = payload.get('tid') or payload.get('ticket_id')
+        token = payload.get('tok') or payload.get('unique_secure_token')
+        try:
+            ticket_id = int(ticket_id)
+        except (TypeError, ValueError):
+            ticket_id = None
+        if not ticket_id or not token:
+            results[index] = {'success': False, 'error_code': 'MISSING_DATA', 'message': 'Missing required data'}
+            continue
+        signature, timestamp = payload.get('sig'), payload.get('ts')
+        if signature and timestamp and not hmac.compare_digest(scan_signature(ticket_id, token, timestamp), str(signature)):
+            results[index] = {'success': False, 'error_code': 'INVALID_SIGNATURE', 'message': 'Invalid ticket signature'}
+            continue
+        wanted[index] = (ticket_id, token)
+
+    tickets = Ticket.objects.select_related('event', 'ticket_type', 'validated_by').select_for_update(
+        of=('self',)
+    ).in_bulk({ticket_id for ticket_id, _ in wanted.values()})
+
+    now = timezone.now()
+    admit = set()
+    for index, (ticket_id, token) in wanted.items():
+        ticket = tickets.get(ticket_id)
+        if ticket is None:
+            results[index] = {'success': False, 'error_code': 'NOT_FOUND', 'message': 'Ticket not found'}
+        elif ticket.unique_secure_token != token:
+            results[index] = {'success': False, 'error_code': 'INVALID_TOKEN', 'message': 'Invalid ticket token'}
+        elif ticket.status == 'USED' or ticket.id in admit:
+            used_at = now if ticket.id in admit else ticket.used_at
+            validated_by = user if ticket.id in admit else ticket.validated_by
+            results[index] = {
+                'success': False,
+                'error_code': 'ALREADY_USED',
+                'message': 'This ticket has already been used',
+                'used_at': timezone.localtime(used_at).strftime('%B %d, %Y at %I:%M %p') if used_at else None,
+                'validated_by': (validated_by.get_full_name() or validated_by.email) if validated_by else None,
+                **ticket_details(ticket),
+            }
+        elif ticket.status not in ADMITTABLE_STATUSES:
+            results[index] = {
+                'success': False,
+                'error_code': 'INVALID_STATUS',
+                'message': f'Invalid ticket status: {ticket.get_status_display()}',
+                **ticket_details(ticket),
+            }
+        else:
+            admit.add(ticket.id)
+            results[index] = {
+                'success': True,
+                'message': 'Ticket validated successfully',
+                'event_date': ticket.event.date.strftime('%B %d, %Y'),
+                'validation_time': timezone.localtime(now).strftime('%I:%M %p'),
+                **ticket_details(ticket),
+            }
+
+    if admit:
+        Ticket.objects.filter(pk__in=admit, status__in=ADMITTABLE_STATUSES).update(
+            status='USED', used_at=now, validated_by=user,
+        )
+        record_check_ins(
+            (tickets[ticket_id].event_id, user.id, tickets[ticket_id].total_admission_count, now) for ticket_id in admit
+        )
+        logger.info(f"Batch validation by {user.email}: {len(admit)} of {len(payloads)} tickets admitted")
+    return results
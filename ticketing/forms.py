@@ -187,7 +187,7 @@ class PromoCodeForm(forms.ModelForm):
         model = PromoCode
         fields = [
             'code', 'event', 'discount_type', 'discount_value',
-            'valid_from', 'valid_until', 'max_uses', 'is_active'
+            'valid_from', 'valid_until', 'max_uses', 'max_uses_per_user', 'is_active'
         ]
         widgets = {
             'valid_from': forms.DateTimeInput(attrs={'type': 'datetime-local'}),
@@ -251,6 +251,35 @@ class TicketForm(forms.ModelForm):
         model = Ticket
         fields = ['event', 'ticket_type', 'customer', 'ticket_number', 'status', 'purchase_date']
 
+class AdminTicketCreateForm(TicketForm):
+    """Admin ticket creation. A quantity above one issues a block of tickets in bulk"""
+    quantity = forms.IntegerField(
+        min_value=1,
+        max_value=10000,
+        initial=1,
+        help_text="Number of tickets to issue (e.g. for group, corporate or complimentary blocks)"
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['ticket_number'].required = False
+        self.fields['ticket_number'].help_text = "Leave blank to generate one automatically"
+
+    def clean(self):
+        cleaned_data = super().clean()
+        quantity = cleaned_data.get('quantity') or 1
+        ticket_type = cleaned_data.get('ticket_type')
+        event = cleaned_data.get('event')
+
+        if quantity > 1:
+            if cleaned_data.get('ticket_number'):
+                raise ValidationError("Ticket numbers are generated automatically when issuing more than one ticket.")
+            if not ticket_type:
+                raise ValidationError("Select a ticket type to issue more than one ticket.")
+        if ticket_type and event and ticket_type.event_id != event.id:
+            raise ValidationError("The ticket type does not belong to the selected event.")
+        return cleaned_data
+
 class EventSponsorForm(forms.ModelForm):
     class Meta:
         model = EventSponsor
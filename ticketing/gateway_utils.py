@@ -0,0 +1,250 @@
+import logging
+import random
+import threading
+import time
+from collections import deque
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CASHFREE_API_VERSION = "2023-08-01"
+SANDBOX_BASE_URL = "https://sandbox.cashfree.com/pg"
+PRODUCTION_BASE_URL = "https://api.cashfree.com/pg"
+
+# Responses worth retrying: rate limiting and server side errors
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Latency samples kept per endpoint for the percentiles in get_metrics()
+LATENCY_SAMPLES = 200
+
+
+class GatewayError(Exception):
+    """The gateway answered with an error response"""
+    def __init__(self, message, status_code=None, body=None):
+        self.status_code = status_code
+        self.body = body
+        super().__init__(message)
+
+
+class GatewayUnavailable(GatewayError):
+    """The gateway could not be reached, kept failing, or the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """
+    Stops calling the gateway after failure_threshold consecutive failures.
+    While open every call fails fast; after reset_seconds one trial call is let
+    through (half-open) and its outcome closes or re-opens the circuit.
+    """
+    def __init__(self, failure_threshold=5, reset_seconds=30):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.error(f"Cashfree circuit breaker opened after {self.failures} failures")
+                self.opened_at = time.monotonic()
+            self._trial_running = False
+
+
+class CallMetrics:
+    """Per-endpoint call counts and latencies, kept in memory for this process"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def record(self, endpoint, latency_ms, ok, retries=0):
+        with self._lock:
+            stats = self._endpoints.setdefault(endpoint, {
+                'calls': 0, 'errors': 0, 'retries': 0, 'latencies': deque(maxlen=LATENCY_SAMPLES),
+            })
+            stats['calls'] += 1
+            stats['retries'] += retries
+            if not ok:
+                stats['errors'] += 1
+            if latency_ms is not None:
+                stats['latencies'].append(latency_ms)
+
+    def snapshot(self):
+        with self._lock:
+            result = {}
+            for endpoint, stats in self._endpoints.items():
+                latencies = sorted(stats['latencies'])
+                result[endpoint] = {
+                    'calls': stats['calls'],
+                    'errors': stats['errors'],
+                    'retries': stats['retries'],
+                    'last_ms': round(stats['latencies'][-1], 1) if latencies else None,
+                    'p50_ms': round(latencies[len(latencies) // 2], 1) if latencies else None,
+                    'p95_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 1) if latencies else None,
+                    'max_ms': round(latencies[-1], 1) if latencies else None,
+                }
+            return result
+
+
+class CashfreeGateway:
+    """
+    Cashfree PG REST client shared by the whole process.
+
+    One requests.Session with a connection pool keeps TLS connections to the
+    gateway alive between payments. Every call has bounded connect/read
+    timeouts, idempotent calls are retried with exponential backoff and full
+    jitter, and a circuit breaker fails fast with GatewayUnavailable while the
+    gateway is down or too slow, so callers can show a degraded response.
+    """
+    def __init__(self, base_url=None, client_id=None, client_secret=None, api_version=CASHFREE_API_VERSION,
+                 connect_timeout=None, read_timeout=None, max_retries=None, backoff_seconds=None,
+                 pool_size=None, breaker=None, slow_call_seconds=None):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.base_url = (base_url or getattr(settings, 'CASHFREE_API_BASE_URL', '') or
+                         (SANDBOX_BASE_URL if settings.DEBUG else PRODUCTION_BASE_URL)).rstrip('/')
+        self.client_id = client_id if client_id is not None else settings.CASHFREE_CLIENT_ID
+        self.client_secret = client_secret if client_secret is not None else settings.CASHFREE_CLIENT_SECRET
+        self.api_version = api_version
+        self.timeout = (
+            connect_timeout or getattr(settings, 'CASHFREE_CONNECT_TIMEOUT', 3.05),
+            read_timeout or getattr(settings, 'CASHFREE_READ_TIMEOUT', 10),
+        )
+        self.max_retries = max_retries if max_retries is not None else getattr(settings, 'CASHFREE_MAX_RETRIES', 2)
+        self.backoff_seconds = backoff_seconds if backoff_seconds is not None else getattr(settings, 'CASHFREE_RETRY_BACKOFF_SECONDS', 0.5)
+        self.slow_call_seconds = slow_call_seconds or getattr(settings, 'CASHFREE_SLOW_CALL_SECONDS', 5)
+        self.breaker = breaker or CircuitBreaker(
+            failure_threshold=getattr(settings, 'CASHFREE_BREAKER_FAILURES', 5),
+            reset_seconds=getattr(settings, 'CASHFREE_BREAKER_RESET_SECONDS', 30),
+        )
+        self.metrics = CallMetrics()
+
+        pool_size = pool_size or getattr(settings, 'CASHFREE_POOL_SIZE', 10)
+        self.session = requests.Session()
+        # Retries are done by _request so they can be jittered and counted
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'Accept': 'application/json',
+            'x-api-version': str(self.api_version),
+            'x-client-id': str(self.client_id or ''),
+            'x-client-secret': str(self.client_secret or ''),
+        })
+
+    def _backoff(self, attempt):
+        """Full jitter: a random wait up to backoff_seconds * 2^attempt"""
+        return random.uniform(0, self.backoff_seconds * (2 ** attempt))
+
+    def _request(self, method, path, endpoint, retry=True, **kwargs):
+        import requests
+
+        if not self.breaker.allow():
+            # Short-circuited calls count as errors but add no latency sample
+            self.metrics.record(endpoint, None, ok=False)
+            raise GatewayUnavailable('Payment gateway circuit is open')
+
+        attempts = 1 + (self.max_retries if retry else 0)
+        started = time.monotonic()
+        error = None
+        for attempt in range(attempts):
+            if attempt:
+                time.sleep(self._backoff(attempt - 1))
+            try:
+                response = self.session.request(method, f"{self.base_url}{path}", timeout=self.timeout, **kwargs)
+            except requests.RequestException as e:
+                # Every requests failure must reach the breaker, or a half-open trial never ends
+                error = GatewayUnavailable(f"Payment gateway request failed: {e}")
+                if isinstance(e, (requests.ConnectionError, requests.Timeout)):
+                    continue
+                break
+            if response.status_code in RETRY_STATUSES:
+                error = GatewayUnavailable(
+                    f"Payment gateway returned {response.status_code}", response.status_code, response.text,
+                )
+                continue
+            error = None
+            break
+
+        latency_ms = (time.monotonic() - started) * 1000
+        self.metrics.record(endpoint, latency_ms, ok=error is None and response.ok, retries=attempt)
+        if error is not None:
+            self.breaker.record_failure()
+            logger.error(f"Cashfree {endpoint} failed after {attempt + 1} attempts in {latency_ms:.0f}ms: {error}")
+            raise error
+
+        # A gateway that answers but too slowly counts against the breaker as well
+        if latency_ms > self.slow_call_seconds * 1000:
+            logger.warning(f"Cashfree {endpoint} took {latency_ms:.0f}ms")
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+        if not response.ok:
+            raise GatewayError(
+                f"Payment gateway returned {response.status_code}: {response.text[:200]}",
+                response.status_code, response.text,
+            )
+        try:
+            return response.json()
+        except ValueError:
+            raise GatewayError(f"Payment gateway returned invalid JSON: {response.text[:200]}", response.status_code, response.text)
+
+    def create_order(self, order):
+        """POST /orders. The order_id doubles as idempotency key, so retrying cannot create two orders"""
+        return self._request(
+            'POST', '/orders', 'create_order', json=order,
+            headers={'x-idempotency-key': str(order['order_id'])},
+        )
+
+    def get_order(self, order_id):
+        """GET /orders/{order_id}"""
+        return self._request('GET', f"/orders/{order_id}", 'get_order')
+
+    def get_order_payments(self, order_id):
+        """GET /orders/{order_id}/payments, the payment attempts made on an order"""
+        return self._request('GET', f"/orders/{order_id}/payments", 'get_order_payments')
+
+    def get_metrics(self):
+        return {'circuit': self.breaker.state, 'endpoints': self.metrics.snapshot()}
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_cashfree_gateway():
+    """The process-wide CashfreeGateway, created on first use"""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = CashfreeGateway()
+    return _gateway
@@ -0,0 +1,194 @@
+import logging
+import multiprocessing
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from . import invoice_utils
+from .export_utils import iterate_in_chunks, start_of_day
+from .invoice_render_worker import init_worker, render_invoice_batch
+from .models import Invoice
+
+logger = logging.getLogger(__name__)
+
+# Invoices handed to a render worker at a time, and PDF bytes copied into the ZIP per write
+RENDER_BATCH_SIZE = 50
+ZIP_BLOCK_SIZE = 64 * 1024
+PROGRESS_EVERY = 500
+
+
+def filter_invoices(params):
+    """
+    Invoices matching the invoice dashboard filters in params (start_date, end_date,
+    event, search), newest first. Returns (queryset, filters, errors): filters holds
+    the parsed values for the dashboard form, unparseable dates are left out of the
+    filter and reported in errors.
+    """
+    invoices = Invoice.objects.select_related(
+        'event', 'user', 'ticket', 'ticket_type', 'transaction'
+    ).order_by('-created_at')
+    errors = []
+
+    start_date = params.get('start_date')
+    if start_date:
+        try:
+            start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
+            invoices = invoices.filter(created_at__gte=start_of_day(start_date))
+        except ValueError:
+            errors.append("Invalid start date format")
+
+    end_date = params.get('end_date')
+    if end_date:
+        try:
+            end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
+            invoices = invoices.filter(created_at__lt=start_of_day(end_date + timedelta(days=1)))
+        except ValueError:
+            errors.append("Invalid end date format")
+
+    event_id = params.get('event')
+    if event_id:
+        invoices = invoices.filter(event_id=event_id)
+
+    search_query = params.get('search')
+    if search_query:
+        invoices = invoices.filter(
+            Q(invoice_number__icontains=search_query) |
+            Q(ticket__ticket_number__icontains=search_query) |
+            Q(user__email__icontains=search_query) |
+            Q(event__title__icontains=search_query) |
+            Q(transaction__transaction_id__icontains=search_query)
+        )
+
+    filters = {
+        'start_date': start_date,
+        'end_date': end_date,
+        'event_id': event_id,
+        'search_query': search_query,
+    }
+    return invoices, filters, errors
+
+
+def get_export_workers():
+    return getattr(settings, 'INVOICE_EXPORT_WORKERS', None) or multiprocessing.cpu_count()
+
+
+def stale_invoices(invoices):
+    """The invoices without a stored PDF for the current INVOICE_TEMPLATE_VERSION"""
+    return invoices.filter(Q(pdf_path='') | ~Q(pdf_version=invoice_utils.INVOICE_TEMPLATE_VERSION))
+
+
+def _id_batches(invoices):
+    batch = []
+    for invoice in iterate_in_chunks(invoices.select_related(None).only('id')):
+        batch.append(invoice.id)
+        if len(batch) == RENDER_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def render_missing_invoice_pdfs(invoices, workers=None, progress=None):
+    """
+    Render and store the PDFs the invoices do not have yet, across a pool of
+    worker processes (ReportLab is CPU-bound, so threads would not help).
+
+    Ids are read in keyset chunks and at most two batches per worker are in
+    flight, so memory stays flat however many invoices there are. progress is
+    called with the number of invoices handled so far after every batch.
+    With workers=1 everything is rendered in this process.
+    Returns (rendered, failed_ids).
+    """
+    workers = workers or get_export_workers()
+    rendered, failed = 0, []
+
+    def collect(result):
+        nonlocal rendered
+        rendered += result[0]
+        failed.extend(result[1])
+        if progress:
+            progress(rendered + len(failed))
+
+    batches = _id_batches(stale_invoices(invoices))
+    if workers <= 1:
+        for batch in batches:
+            collect(render_invoice_batch(batch))
+        return rendered, failed
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=init_worker,
+    ) as pool:
+        pending = set()
+        for batch in batches:
+            pending.add(pool.submit(render_invoice_batch, batch))
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    collect(future.result())
+        for future in pending:
+            collect(future.result())
+
+    logger.info(f"Rendered {rendered} invoice PDFs with {workers} workers, {len(failed)} failed")
+    return rendered, failed
+
+
+class ZipOutput:
+    """Write-only file for zipfile: keeps what was written until the generator takes it"""
+    def __init__(self):
+        self._parts = []
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def stream_invoice_zip(invoices, progress=None):
+    """
+    Yield a ZIP archive of the invoices' stored PDFs piece by piece.
+
+    The archive is written to an unseekable ZipOutput, so zipfile emits each entry
+    as it goes and only one block of a PDF is held at a time. Entries are stored
+    uncompressed: the PDFs are compressed already. Invoices without a stored PDF
+    are rendered inline; render_missing_invoice_pdfs them first for large exports.
+    """
+    output = ZipOutput()
+    count = 0
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_STORED) as archive:
+        for invoice in iterate_in_chunks(invoices):
+            entry = zipfile.ZipInfo(
+                f"Invoice-{invoice.invoice_number}.pdf",
+                date_time=timezone.localtime(invoice.created_at).timetuple()[:6],
+            )
+            with invoice_utils.open_invoice_pdf(invoice) as pdf, archive.open(entry, 'w') as target:
+                for block in iter(lambda: pdf.read(ZIP_BLOCK_SIZE), b''):
+                    target.write(block)
+                    data = output.take()
+                    if data:
+                        yield data
+            count += 1
+            if progress:
+                progress(count)
+            if count % PROGRESS_EVERY == 0:
+                logger.info(f"Invoice ZIP export: {count} PDFs written")
+    yield output.take()
+    logger.info(f"Invoice ZIP export finished with {count} PDFs")
+
+
+def zip_streaming_response(filename, invoices):
+    """StreamingHttpResponse downloading the invoices' PDFs as one ZIP"""
+    response = StreamingHttpResponse(stream_invoice_zip(invoices), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,30 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Entry points of the invoice render processes (see invoice_export_utils.render_missing_invoice_pdfs).
+# Workers are spawned and import this module before Django is set up, so ticketing
+# modules are only imported inside the functions.
+
+
+def init_worker():
+    # Spawned, not forked: the worker opens its own database connections
+    import django
+    django.setup()
+
+
+def render_invoice_batch(invoice_ids):
+    """Store the PDFs of the given invoices. Returns (rendered, failed_ids)"""
+    from .invoice_utils import get_invoice_pdf_path
+    from .models import Invoice
+
+    rendered, failed = 0, []
+    invoices = Invoice.objects.select_related('event', 'user', 'ticket', 'ticket_type', 'transaction')
+    for invoice in invoices.filter(pk__in=invoice_ids):
+        try:
+            get_invoice_pdf_path(invoice)
+            rendered += 1
+        except Exception as e:
+            logger.error(f"Failed to render PDF for invoice {invoice.invoice_number}: {e}")
+            failed.append(invoice.id)
+    return rendered, failed
@@ -1,8 +1,12 @@
+import hashlib
 import io
 import logging
 import os
 from decimal import Decimal
+from functools import lru_cache
 from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
 from django.core.mail import EmailMultiAlternatives
 from django.template.loader import render_to_string
 from django.utils import timezone
@@ -30,72 +34,80 @@ def calculate_commission(event, total_price, attendee_count=1):
         # No commission settings found, return 0
         return Decimal('0.00')
 
+# Bump whenever the invoice PDF layout changes so stored PDFs are rendered again
+INVOICE_TEMPLATE_VERSION = 1
+
+NEXGEN_LOGO_PATHS = (
+    os.path.join('ticketing', 'static', 'images', 'logos', 'LOGO_NEXGEN_FC.png'),
+    os.path.join('staticfiles_build', 'static', 'images', 'logos', 'LOGO_NEXGEN_FC.png'),
+    os.path.join('static', 'images', 'logos', 'LOGO_NEXGEN_FC.png'),
+)
+
+
+@lru_cache(maxsize=None)
+def get_invoice_logo():
+    """The NexGen FC logo bytes from the local static files, read once per process (None if missing)"""
+    for relative_path in NEXGEN_LOGO_PATHS:
+        try:
+            with open(os.path.join(settings.BASE_DIR, relative_path), 'rb') as logo_file:
+                return logo_file.read()
+        except OSError:
+            continue
+    logger.warning("NexGen FC logo not found in the static files, invoices are rendered without it")
+    return None
+
+
+@lru_cache(maxsize=None)
+def get_invoice_styles():
+    """Paragraph styles for the invoice, built once per process"""
+    styles = getSampleStyleSheet()
+    return {
+        'title': ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontSize=18,
+            spaceAfter=30,
+            alignment=TA_CENTER,
+            textColor=colors.darkblue
+        ),
+        'heading': ParagraphStyle(
+            'CustomHeading',
+            parent=styles['Heading2'],
+            fontSize=14,
+            spaceAfter=12,
+            textColor=colors.darkblue
+        ),
+        'footer': ParagraphStyle(
+            'Footer',
+            parent=styles['Normal'],
+            fontSize=12,
+            alignment=TA_CENTER,
+            textColor=colors.darkblue,
+            spaceBefore=20
+        ),
+    }
+
+
 def generate_invoice_pdf(invoice):
     """
-    Generate PDF invoice for the given invoice object
+    Render the PDF for the given invoice object. Use get_invoice_pdf_path /
+    open_invoice_pdf instead, which render an invoice only once.
     """
     buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
+    # invariant: no timestamps or random document id, so the same invoice renders to the same bytes
+    doc = SimpleDocTemplate(buffer, pagesize=A4, invariant=1)
     story = []
     
-    # Get styles
-    styles = getSampleStyleSheet()
+    styles = get_invoice_styles()
+    title_style = styles['title']
+    heading_style = styles['heading']
     
-    # Create custom styles
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=18,
-        spaceAfter=30,
-        alignment=TA_CENTER,
-        textColor=colors.darkblue
-    )
-    
-    heading_style = ParagraphStyle(
-        'CustomHeading',
-        parent=styles['Heading2'],
-        fontSize=14,
-        spaceAfter=12,
-        textColor=colors.darkblue
-    )
-    
-    normal_style = styles['Normal']
-    normal_style.fontSize = 10
-    
-    # Add NexGen FC Logo from Google Drive
-    try:
-        import requests
-        from io import BytesIO
-        
-        # Google Drive direct download URL for the logo
-        # Replace this with your actual Google Drive file ID
-        logo_drive_id = "1giAtj3jwPxY7z-MI9vpc1Ep7RsJaLeeb"  # Update this with actual file ID
-        logo_url = f"https://drive.google.com/uc?export=download&id={logo_drive_id}"
-        
-        # Download logo from Google Drive
-        response = requests.get(logo_url, timeout=10)
-        if response.status_code == 200:
-            logo_data = BytesIO(response.content)
-            logo = Image(logo_data, width=1*inch, height=1*inch)
-            logo.hAlign = 'CENTER'
-            story.append(logo)
-            story.append(Spacer(1, 10))
-            logger.info("Successfully loaded NexGen FC logo from Google Drive")
-        else:
-            logger.warning(f"Failed to download logo from Google Drive: HTTP {response.status_code}")
-    except Exception as e:
-        logger.warning(f"Could not load NexGen FC logo from Google Drive: {e}")
-        # Fallback to local file if Google Drive fails
-        try:
-            logo_path = os.path.join(settings.STATIC_ROOT, 'core', 'images', 'LOGO_NEXGEN_FC.png')
-            if os.path.exists(logo_path):
-                logo = Image(logo_path, width=1*inch, height=1*inch)
-                logo.hAlign = 'CENTER'
-                story.append(logo)
-                story.append(Spacer(1, 10))
-                logger.info("Fallback: Loaded logo from local static files")
-        except Exception as fallback_e:
-            logger.warning(f"Fallback logo loading also failed: {fallback_e}")
+    logo_data = get_invoice_logo()
+    if logo_data:
+        logo = Image(io.BytesIO(logo_data), width=1*inch, height=1*inch)
+        logo.hAlign = 'CENTER'
+        story.append(logo)
+        story.append(Spacer(1, 10))
     
     # Title
     story.append(Paragraph("TICKET INVOICE", title_style))
@@ -173,14 +185,7 @@ def generate_invoice_pdf(invoice):
     story.append(Spacer(1, 30))
     
     # Footer
-    footer_style = ParagraphStyle(
-        'Footer',
-        parent=styles['Normal'],
-        fontSize=12,
-        alignment=TA_CENTER,
-        textColor=colors.darkblue,
-        spaceBefore=20
-    )
+    footer_style = styles['footer']
     story.append(Paragraph("Paid To: NexGen FC", footer_style))
     story.append(Spacer(1, 5))
     story.append(Paragraph("A premium brand by NexGen FC", footer_style))
@@ -192,6 +197,58 @@ def generate_invoice_pdf(invoice):
     buffer.seek(0)
     return buffer
 
+
+_invoice_storage = None
+
+
+def get_invoice_storage():
+    """The storage holding rendered invoice PDFs (settings.INVOICE_PDF_STORAGE), created once per process"""
+    global _invoice_storage
+    if _invoice_storage is None:
+        config = getattr(settings, 'INVOICE_PDF_STORAGE', {})
+        if config.get('BACKEND', 'filesystem') == 'default':
+            _invoice_storage = default_storage
+        else:
+            _invoice_storage = FileSystemStorage(
+                location=config.get('LOCATION') or os.path.join(settings.MEDIA_ROOT, 'invoices'),
+            )
+    return _invoice_storage
+
+
+def get_invoice_pdf_path(invoice, force=False):
+    """
+    Storage path of the invoice's PDF, rendering it first if needed.
+
+    PDFs are stored content-addressed (by SHA-256 of the file) and the path is kept
+    on the Invoice row, so an invoice is rendered once. It is rendered again only
+    when INVOICE_TEMPLATE_VERSION changes, the stored file has gone missing, or
+    force is set.
+    """
+    storage = get_invoice_storage()
+    if (not force and invoice.pdf_path and invoice.pdf_version == INVOICE_TEMPLATE_VERSION
+            and storage.exists(invoice.pdf_path)):
+        return invoice.pdf_path
+
+    data = generate_invoice_pdf(invoice).getvalue()
+    digest = hashlib.sha256(data).hexdigest()
+    path = f"{digest[:2]}/{digest}.pdf"
+    if not storage.exists(path):
+        path = storage.save(path, ContentFile(data))
+
+    invoice.pdf_path = path
+    invoice.pdf_version = INVOICE_TEMPLATE_VERSION
+    invoice.pdf_rendered_at = timezone.now()
+    Invoice.objects.filter(pk=invoice.pk).update(
+        pdf_path=invoice.pdf_path, pdf_version=invoice.pdf_version, pdf_rendered_at=invoice.pdf_rendered_at,
+    )
+    logger.info(f"Stored PDF for invoice {invoice.invoice_number} at {path} ({len(data)} bytes)")
+    return path
+
+
+def open_invoice_pdf(invoice):
+    """The invoice's stored PDF opened for binary reading"""
+    return get_invoice_storage().open(get_invoice_pdf_path(invoice), 'rb')
+
 def send_invoice_email(invoice, force_send=False):
     """
     Send invoice PDF via email to the customer
@@ -208,8 +265,9 @@ def send_invoice_email(invoice, force_send=False):
                 logger.info(f"Skipping email for existing invoice {invoice.invoice_number} - likely already sent")
                 return True
         
-        # Generate PDF
-        pdf_buffer = generate_invoice_pdf(invoice)
+        # The stored PDF, rendered now only if this invoice has none yet
+        with open_invoice_pdf(invoice) as pdf_file:
+            pdf_content = pdf_file.read()
         
         # Email subject and content
         subject = f"Invoice for {invoice.event.title} - {invoice.invoice_number}"
@@ -251,7 +309,7 @@ def send_invoice_email(invoice, force_send=False):
         # Attach PDF
         email.attach(
             f"invoice_{invoice.invoice_number}.pdf",
-            pdf_buffer.getvalue(),
+            pdf_content,
             'application/pdf'
         )
         
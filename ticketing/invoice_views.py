@@ -5,14 +5,14 @@ from datetime import datetime
 
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
-from django.http import HttpResponse, JsonResponse
+from django.http import FileResponse, HttpResponse, JsonResponse
 from django.contrib import messages
 from django.db.models import Sum, Count
 from django.utils import timezone
 from django.core.paginator import Paginator
 
 from .models import Invoice, Event
-from .invoice_utils import generate_invoice_pdf
+from .invoice_utils import open_invoice_pdf
 
 logger = logging.getLogger(__name__)
 
@@ -150,15 +150,12 @@ def admin_download_invoice_csv(request):
 @login_required
 @user_passes_test(is_admin)
 def admin_download_invoice_pdf(request, invoice_id):
-    """Generate and download a specific invoice as PDF"""
+    """Download a specific invoice as PDF, streamed from the stored copy"""
     invoice = get_object_or_404(Invoice, id=invoice_id)
-    pdf_content = generate_invoice_pdf(invoice)
-    
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="Invoice-{invoice.invoice_number}.pdf"'
-    response.write(pdf_content)
-    
-    return response
+    return FileResponse(
+        open_invoice_pdf(invoice), as_attachment=True,
+        filename=f"Invoice-{invoice.invoice_number}.pdf", content_type='application/pdf',
+    )
 
 @login_required
 @user_passes_test(is_admin)
@@ -0,0 +1,137 @@
+import logging
+import random
+import string
+import uuid
+from decimal import Decimal
+from django.db import transaction
+from django.utils import timezone
+from .models import Event, Ticket, Invoice
+from .capacity_utils import CapacityError, record_tickets_sold
+
+logger = logging.getLogger(__name__)
+
+# Rows per INSERT / IN (...) lookup
+BULK_BATCH_SIZE = 1000
+
+
+def _generate_unique_codes(model, field, count, make_code):
+    """
+    Generate count codes that are unique among themselves and in model.field.
+    Candidates are produced in memory and checked against the table with one
+    IN query per batch instead of an exists() query per code.
+    """
+    codes = set()
+    while len(codes) < count:
+        needed = count - len(codes)
+        candidates = set()
+        while len(candidates) < min(needed, BULK_BATCH_SIZE):
+            code = make_code()
+            if code not in codes:
+                candidates.add(code)
+        taken = set(model.objects.filter(**{f"{field}__in": candidates}).values_list(field, flat=True))
+        codes.update(candidates - taken)
+    return list(codes)
+
+
+def _make_ticket_number():
+    # Same shape as generate_ticket_number (two letters + digits) with a longer numeric part,
+    # so a 5,000 ticket block almost never needs a second round
+    return ''.join(random.choices(string.ascii_uppercase, k=2)) + ''.join(random.choices(string.digits, k=8))
+
+
+def _make_invoice_number():
+    return f"INV-{uuid.uuid4().hex[:8].upper()}"
+
+
+def generate_ticket_numbers(count):
+    """Collision-free ticket numbers for a batch of new tickets"""
+    return _generate_unique_codes(Ticket, 'ticket_number', count, _make_ticket_number)
+
+
+def bulk_create_tickets(tickets):
+    """
+    Insert unsaved Ticket objects with bulk_create and add them to the capacity ledger.
+    Ticket numbers and tokens missing on the objects are filled in first.
+    Call inside a transaction.
+    """
+    missing_numbers = [ticket for ticket in tickets if not ticket.ticket_number]
+    for ticket, number in zip(missing_numbers, generate_ticket_numbers(len(missing_numbers))):
+        ticket.ticket_number = number
+    for ticket in tickets:
+        if not ticket.unique_secure_token:
+            ticket.unique_secure_token = str(uuid.uuid4())
+        if not ticket.unique_id:
+            ticket.unique_id = uuid.uuid4()
+
+    created = Ticket.objects.bulk_create(tickets, batch_size=BULK_BATCH_SIZE)
+    record_tickets_sold(created)
+    return created
+
+
+def bulk_create_invoices(tickets, payment_transaction):
+    """Create an invoice per ticket (priced at its ticket type) with one bulk insert"""
+    from .invoice_utils import calculate_commission
+
+    invoice_numbers = _generate_unique_codes(Invoice, 'invoice_number', len(tickets), _make_invoice_number)
+    invoices = []
+    for ticket, invoice_number in zip(tickets, invoice_numbers):
+        total_price = ticket.ticket_type.price if ticket.ticket_type else Decimal('0.00')
+        attendee_count = ticket.ticket_type.attendees_per_ticket if ticket.ticket_type else 1
+        commission = calculate_commission(ticket.event, total_price, attendee_count)
+        invoices.append(Invoice(
+            ticket=ticket,
+            user=ticket.customer,
+            event=ticket.event,
+            ticket_type=ticket.ticket_type,
+            transaction=payment_transaction,
+            base_price=total_price - commission,
+            commission=commission,
+            total_price=total_price,
+            invoice_number=invoice_number,
+        ))
+    return Invoice.objects.bulk_create(invoices, batch_size=BULK_BATCH_SIZE)
+
+
+def issue_tickets(ticket_type, customer, quantity, status='SOLD', payment_transaction=None,
+                  check_capacity=True, create_invoices=False):
+    """
+    Issue a block of tickets of one type (group, corporate or complimentary orders).
+
+    Everything happens in one transaction: the Event row is locked, capacity is
+    checked (raises CapacityError), ticket numbers are generated in memory and
+    tickets plus optional invoices are inserted with bulk_create.
+    Returns the list of created tickets.
+    """
+    if quantity < 1:
+        raise ValueError('Quantity must be at least 1')
+    if create_invoices and not payment_transaction:
+        raise ValueError('Invoices need a payment transaction')
+
+    attendees_per_ticket = ticket_type.attendees_per_ticket or 1
+    attendees = quantity * attendees_per_ticket
+
+    with transaction.atomic():
+        event = Event.objects.select_for_update().get(pk=ticket_type.event_id)
+        if check_capacity and attendees > event.remaining_attendee_capacity:
+            raise CapacityError(attendees, event.remaining_attendee_capacity)
+
+        now = timezone.now()
+        tickets = bulk_create_tickets([
+            Ticket(
+                event=event,
+                ticket_type=ticket_type,
+                customer=customer,
+                status=status,
+                purchase_date=now,
+                purchase_transaction=payment_transaction,
+                booking_quantity=1,
+                total_admission_count=attendees_per_ticket,
+            )
+            for _ in range(quantity)
+        ])
+
+        if create_invoices:
+            bulk_create_invoices(tickets, payment_transaction)
+
+    logger.info(f"Issued {len(tickets)} {ticket_type.type_name} tickets for event {event.id} to {customer.email if customer else 'no customer'}")
+    return tickets
@@ -0,0 +1,202 @@
+import logging
+import traceback
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import Job, Ticket, Invoice, PaymentTransaction
+
+logger = logging.getLogger(__name__)
+
+# job_type -> callable(payload). Filled in by the @job_handler decorator below.
+JOB_HANDLERS = {}
+
+
+def job_handler(job_type):
+    """Register a function as the handler for a job type"""
+    def decorator(func):
+        JOB_HANDLERS[job_type] = func
+        return func
+    return decorator
+
+
+def enqueue_job(job_type, payload=None, run_after=None, max_attempts=None):
+    """
+    Queue a job for the run_workers command.
+    When called inside a transaction the job is only visible to workers once
+    that transaction commits, so a job never runs against rolled-back rows.
+    """
+    if job_type not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job type: {job_type}")
+
+    job = Job.objects.create(
+        job_type=job_type,
+        payload=payload or {},
+        run_after=run_after or timezone.now(),
+        max_attempts=max_attempts or getattr(settings, 'JOB_MAX_ATTEMPTS', 5),
+    )
+    logger.info(f"Enqueued {job_type} job #{job.id}")
+    return job
+
+
+def enqueue_ticket_notifications(tickets, payment_transaction):
+    """Queue the invoice and the ticket confirmation email for freshly issued tickets"""
+    max_attempts = getattr(settings, 'JOB_MAX_ATTEMPTS', 5)
+    jobs = []
+    for ticket in tickets:
+        jobs.append(Job(
+            job_type='render_invoice',
+            payload={'ticket_id': ticket.id, 'transaction_id': payment_transaction.id},
+            max_attempts=max_attempts,
+        ))
+        jobs.append(Job(
+            job_type='send_email',
+            payload={'template': 'ticket_confirmation', 'ticket_id': ticket.id},
+            max_attempts=max_attempts,
+        ))
+    Job.objects.bulk_create(jobs)
+    logger.info(f"Enqueued {len(jobs)} notification jobs for order {payment_transaction.order_id}")
+
+
+def get_retry_delay(attempts):
+    """Exponential backoff: JOB_RETRY_BASE_SECONDS doubled per failed attempt, capped at JOB_RETRY_MAX_SECONDS"""
+    base = getattr(settings, 'JOB_RETRY_BASE_SECONDS', 30)
+    cap = getattr(settings, 'JOB_RETRY_MAX_SECONDS', 3600)
+    return timedelta(seconds=min(base * (2 ** max(attempts - 1, 0)), cap))
+
+
+def claim_job(worker_id):
+    """
+    Lock and return the next runnable job, or None if the queue is empty.
+    SKIP LOCKED lets several workers poll the table without blocking each other.
+    RUNNING jobs whose lock is older than JOB_LOCK_TIMEOUT_SECONDS are picked up
+    again - their worker died mid-job.
+    """
+    now = timezone.now()
+    lock_timeout = timedelta(seconds=getattr(settings, 'JOB_LOCK_TIMEOUT_SECONDS', 600))
+
+    while True:
+        with transaction.atomic():
+            job = Job.objects.select_for_update(skip_locked=True).filter(
+                Q(status='PENDING', run_after__lte=now) |
+                Q(status='RUNNING', locked_at__lt=now - lock_timeout)
+            ).order_by('run_after', 'id').first()
+            if not job:
+                return None
+
+            if job.status == 'RUNNING' and job.attempts >= job.max_attempts:
+                job.status = 'DEAD'
+                job.last_error = f"Worker {job.locked_by} stopped responding on the final attempt"
+                job.save(update_fields=['status', 'last_error', 'updated_at'])
+                logger.error(f"Job #{job.id} ({job.job_type}) dead-lettered: {job.last_error}")
+                continue
+
+            job.status = 'RUNNING'
+            job.locked_by = worker_id
+            job.locked_at = now
+            job.attempts += 1
+            job.save(update_fields=['status', 'locked_by', 'locked_at', 'attempts', 'updated_at'])
+            return job
+
+
+def run_job(job):
+    """Execute a claimed job and record the outcome. Returns True if the job succeeded"""
+    handler = JOB_HANDLERS.get(job.job_type)
+    try:
+        if handler is None:
+            raise ValueError(f"No handler registered for job type {job.job_type}")
+        handler(job.payload)
+    except Exception as e:
+        job.last_error = traceback.format_exc()
+        job.locked_by = ''
+        job.locked_at = None
+        if handler is None or job.attempts >= job.max_attempts:
+            job.status = 'DEAD'
+            logger.error(f"Job #{job.id} ({job.job_type}) dead-lettered after {job.attempts} attempts: {str(e)}")
+        else:
+            job.status = 'PENDING'
+            job.run_after = timezone.now() + get_retry_delay(job.attempts)
+            logger.warning(f"Job #{job.id} ({job.job_type}) failed on attempt {job.attempts}, retrying at {job.run_after}: {str(e)}")
+        job.save(update_fields=['status', 'run_after', 'last_error', 'locked_by', 'locked_at', 'updated_at'])
+        return False
+
+    job.status = 'DONE'
+    job.locked_by = ''
+    job.locked_at = None
+    job.save(update_fields=['status', 'locked_by', 'locked_at', 'updated_at'])
+    logger.info(f"Job #{job.id} ({job.job_type}) done")
+    return True
+
+
+def run_pending_jobs(worker_id, limit=None):
+    """Drain the queue in the current thread. Returns the number of jobs processed"""
+    processed = 0
+    while limit is None or processed < limit:
+        job = claim_job(worker_id)
+        if not job:
+            break
+        run_job(job)
+        processed += 1
+    return processed
+
+
+def requeue_job(job):
+    """Give a dead-lettered job a fresh set of attempts"""
+    job.status = 'PENDING'
+    job.attempts = 0
+    job.run_after = timezone.now()
+    job.last_error = ''
+    job.locked_by = ''
+    job.locked_at = None
+    job.save()
+
+
+# --- Job handlers ---
+
+@job_handler('render_invoice')
+def render_invoice_job(payload):
+    """Create the invoice for a ticket, store its PDF and queue the email carrying it"""
+    from .invoice_utils import create_invoice_for_ticket, get_invoice_pdf_path
+
+    ticket = Ticket.objects.select_related('event', 'ticket_type', 'customer').get(pk=payload['ticket_id'])
+    payment_transaction = PaymentTransaction.objects.get(pk=payload['transaction_id'])
+
+    with transaction.atomic():
+        invoice = create_invoice_for_ticket(ticket, payment_transaction)
+        if not invoice:
+            raise RuntimeError(f"Could not create invoice for ticket {ticket.ticket_number}")
+        # Rendered here, off the request path, so downloads and the email only read the stored file
+        get_invoice_pdf_path(invoice)
+
+        # A retried job may already have queued the email for this invoice
+        if not Job.objects.filter(job_type='send_email', payload__invoice_id=invoice.id).exists():
+            enqueue_job('send_email', {'template': 'invoice', 'invoice_id': invoice.id})
+
+
+@job_handler('send_email')
+def send_email_job(payload):
+    """Send one of the transactional emails. Raising makes the worker retry with backoff"""
+    template = payload.get('template')
+
+    if template == 'invoice':
+        from .invoice_utils import send_invoice_email
+        invoice = Invoice.objects.select_related('event', 'user', 'ticket').get(pk=payload['invoice_id'])
+        # The queue already guarantees a single successful send, skip the recent-invoice guard
+        sent = send_invoice_email(invoice, force_send=True)
+    elif template == 'ticket_confirmation':
+        from .views import send_ticket_confirmation_email
+        ticket = Ticket.objects.select_related('event', 'customer').get(pk=payload['ticket_id'])
+        sent = send_ticket_confirmation_email(ticket, None)
+    else:
+        raise ValueError(f"Unknown email template: {template}")
+
+    if not sent:
+        raise RuntimeError(f"Sending {template} email failed")
+
+
+@job_handler('process_webhook')
+def process_webhook_job(payload):
+    """Apply a payment webhook stored in the WebhookInbox"""
+    from .payment_utils import process_webhook_delivery
+    process_webhook_delivery(payload['inbox_id'])
@@ -0,0 +1,77 @@
+from django.core.management.base import BaseCommand, CommandError
+from ticketing.invoice_export_utils import filter_invoices, render_missing_invoice_pdfs, stale_invoices, stream_invoice_zip
+
+
+class Command(BaseCommand):
+    help = 'Render missing invoice PDFs in parallel and optionally write them all to one ZIP (e.g. for month-end closing)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--event',
+            type=int,
+            action='append',
+            dest='event_ids',
+            help='Only export invoices of this event ID (can be given multiple times)',
+        )
+        parser.add_argument('--start-date', dest='start_date', help='First invoice date to export (YYYY-MM-DD)')
+        parser.add_argument('--end-date', dest='end_date', help='Last invoice date to export (YYYY-MM-DD)')
+        parser.add_argument('--search', help='Same search as the invoice dashboard')
+        parser.add_argument(
+            '--workers',
+            type=int,
+            help='Render processes (defaults to INVOICE_EXPORT_WORKERS, or one per CPU)',
+        )
+        parser.add_argument('--output', help='Write the PDFs to this ZIP file; without it PDFs are only rendered')
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            dest='dry_run',
+            help='Report how many invoices would be rendered and exported without doing it',
+        )
+
+    def handle(self, *args, **options):
+        invoices, _, errors = filter_invoices({
+            'start_date': options['start_date'],
+            'end_date': options['end_date'],
+            'search': options['search'],
+        })
+        if errors:
+            raise CommandError('; '.join(errors))
+        if options['event_ids']:
+            invoices = invoices.filter(event_id__in=options['event_ids'])
+
+        total = invoices.count()
+        missing = stale_invoices(invoices).count()
+        if options['dry_run']:
+            self.stdout.write(f"Would render {missing} of {total} invoice PDFs")
+            if options['output']:
+                self.stdout.write(f"Would write {total} PDFs to {options['output']}")
+            return
+
+        if missing:
+            self.stdout.write(f"Rendering {missing} of {total} invoice PDFs...")
+            rendered, failed = render_missing_invoice_pdfs(
+                invoices, workers=options['workers'], progress=self._progress('Rendered', missing),
+            )
+            self.stdout.write(self.style.SUCCESS(f"Rendered {rendered} invoice PDFs"))
+            if failed:
+                self.stdout.write(self.style.WARNING(f"{len(failed)} invoices failed to render: {failed}"))
+
+        if not options['output']:
+            return
+
+        with open(options['output'], 'wb') as output:
+            for data in stream_invoice_zip(invoices, progress=self._progress('Written', total)):
+                output.write(data)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {total} invoice PDFs to {options['output']}"))
+
+    def _progress(self, verb, total):
+        """Progress callback printing a line about every 5% (counts can jump by a whole batch)"""
+        step = max(total // 20, 1)
+        reported = [0]
+
+        def report(done):
+            if done - reported[0] >= step or done == total:
+                reported[0] = done
+                self.stdout.write(f"  {verb} {done}/{total}")
+        return report
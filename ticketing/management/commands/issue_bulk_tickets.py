@@ -0,0 +1,81 @@
+import csv
+from django.core.management.base import BaseCommand, CommandError
+from ticketing.capacity_utils import CapacityError
+from ticketing.issuance_utils import issue_tickets
+from ticketing.models import TicketType, User
+
+
+class Command(BaseCommand):
+    help = 'Issue a block of tickets (comp or corporate) in one transaction using bulk inserts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ticket-type', type=int, required=True, help='TicketType ID to issue')
+        parser.add_argument('--customer', required=True, help='Email of the account the tickets are issued to')
+        parser.add_argument('--quantity', type=int, required=True, help='Number of tickets to issue')
+        parser.add_argument(
+            '--status',
+            default='VALID',
+            choices=['SOLD', 'VALID'],
+            help='Status of the issued tickets (default: VALID)',
+        )
+        parser.add_argument(
+            '--ignore-capacity',
+            action='store_true',
+            help='Issue the tickets even if the event does not have enough remaining capacity',
+        )
+        parser.add_argument('--output', help='Write the issued ticket numbers and pass IDs to this CSV file')
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            dest='dry_run',
+            help='Check capacity and show what would be issued without creating tickets',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            ticket_type = TicketType.objects.select_related('event').get(pk=options['ticket_type'])
+        except TicketType.DoesNotExist:
+            raise CommandError(f"Ticket type {options['ticket_type']} does not exist")
+        try:
+            customer = User.objects.get(email=options['customer'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user with email {options['customer']}")
+
+        quantity = options['quantity']
+        if quantity < 1:
+            raise CommandError('--quantity must be at least 1')
+
+        event = ticket_type.event
+        attendees = quantity * (ticket_type.attendees_per_ticket or 1)
+        self.stdout.write(
+            f"{quantity} x {ticket_type.type_name} for {event.title} (ID: {event.id}) -> {customer.email}, "
+            f"{attendees} attendees, {event.remaining_attendee_capacity} capacity remaining"
+        )
+
+        if options['dry_run']:
+            if attendees > event.remaining_attendee_capacity and not options['ignore_capacity']:
+                self.stdout.write(self.style.WARNING('DRY RUN: not enough capacity, nothing would be issued'))
+            else:
+                self.stdout.write(self.style.WARNING('DRY RUN: no tickets were created'))
+            return
+
+        try:
+            tickets = issue_tickets(
+                ticket_type,
+                customer,
+                quantity,
+                status=options['status'],
+                check_capacity=not options['ignore_capacity'],
+            )
+        except CapacityError as e:
+            raise CommandError(f"{e} Use --ignore-capacity to issue anyway.")
+
+        if options['output']:
+            with open(options['output'], 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['Ticket Number', 'Pass ID', 'Ticket Type', 'Attendees'])
+                for ticket in tickets:
+                    writer.writerow([ticket.ticket_number, ticket.unique_id, ticket_type.type_name, ticket.total_admission_count])
+            self.stdout.write(f"Ticket list written to {options['output']}")
+
+        self.stdout.write(self.style.SUCCESS(f'Issued {len(tickets)} tickets'))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from ticketing.models import Event
+from ticketing.occupancy_utils import rebuild_check_in_counters
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the live occupancy check-in counters from the USED tickets'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--event',
+            type=int,
+            action='append',
+            dest='event_ids',
+            help='Only rebuild this event ID (can be given multiple times)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            dest='dry_run',
+            help='Report drifted counters without fixing them',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        drifted = rebuild_check_in_counters(event_ids=options['event_ids'], dry_run=dry_run)
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS('Check-in counters are in sync with the Ticket table'))
+            return
+
+        titles = dict(Event.objects.filter(id__in=drifted).values_list('id', 'title'))
+        for event_id, (counted, expected) in drifted.items():
+            self.stdout.write(f"  - {titles.get(event_id, 'Deleted event')} (ID: {event_id}): checked in {counted} → {expected}")
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING(f"DRY RUN: {len(drifted)} events have drifted counters, nothing was changed"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt check-in counters for {len(drifted)} events"))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from ticketing.capacity_utils import reconcile_capacity
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the Event/TicketType attendees_sold capacity ledger from the Ticket table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--event',
+            type=int,
+            action='append',
+            dest='event_ids',
+            help='Only reconcile this event ID (can be given multiple times)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            dest='dry_run',
+            help='Report drifted counters without fixing them',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        drifted = reconcile_capacity(event_ids=options['event_ids'], dry_run=dry_run)
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS('Capacity ledger is in sync with the Ticket table'))
+            return
+
+        for event, old_value, new_value in drifted:
+            self.stdout.write(f"  - {event.title} (ID: {event.id}): attendees_sold {old_value} → {new_value}")
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING(f"DRY RUN: {len(drifted)} events have drifted counters, nothing was changed"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Reconciled capacity ledger for {len(drifted)} events"))
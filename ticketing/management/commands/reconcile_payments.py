@@ -0,0 +1,91 @@
+import csv
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from ticketing.payment_utils import reconcile_payments
+
+
+class Command(BaseCommand):
+    help = ('Settle CREATED/PENDING payments whose webhook and redirect never arrived, and issue '
+            'missing tickets for paid orders (run every few minutes from cron)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--event',
+            type=int,
+            action='append',
+            dest='event_ids',
+            help='Only reconcile orders for this event ID (can be given multiple times)',
+        )
+        parser.add_argument(
+            '--older-than',
+            type=int,
+            default=getattr(settings, 'PAYMENT_RECONCILE_AFTER_MINUTES', 15),
+            help='Only look at orders created at least this many minutes ago',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Orders loaded per batch',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=getattr(settings, 'PAYMENT_RECONCILE_WORKERS', 4),
+            help='Concurrent Cashfree lookups (default: PAYMENT_RECONCILE_WORKERS setting)',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            help='Stop after this many orders',
+        )
+        parser.add_argument(
+            '--report',
+            help='Also write the per-order report to this CSV file',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            dest='dry_run',
+            help='Ask Cashfree and report what would change without changing anything',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        report = reconcile_payments(
+            older_than=timedelta(minutes=options['older_than']),
+            event_ids=options['event_ids'],
+            batch_size=max(options['batch_size'], 1),
+            workers=max(options['workers'], 1),
+            limit=options['limit'],
+            dry_run=dry_run,
+        )
+
+        totals = {}
+        for row in report:
+            totals[row['action']] = totals.get(row['action'], 0) + 1
+            if row['action'] != 'UNCHANGED':
+                line = f"  - {row['order_id']}: {row['status']} → {row['action']}"
+                if row['gateway_status']:
+                    line += f" (Cashfree: {row['gateway_status']})"
+                if row['tickets']:
+                    line += f", {row['tickets']} tickets"
+                if row['error']:
+                    line += f" - {row['error']}"
+                self.stdout.write(line)
+
+        if options['report']:
+            with open(options['report'], 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=['order_id', 'status', 'gateway_status', 'action', 'tickets', 'error'])
+                writer.writeheader()
+                writer.writerows(report)
+            self.stdout.write(f"Report written to {options['report']}")
+
+        summary = ', '.join(f"{count} {action.lower()}" for action, count in sorted(totals.items())) or 'nothing to do'
+        if dry_run:
+            self.stdout.write(self.style.WARNING(f"DRY RUN: checked {len(report)} orders ({summary}), nothing was changed"))
+        elif totals.get('ERROR') or totals.get('CAPACITY_ERROR'):
+            self.stdout.write(self.style.WARNING(f"Checked {len(report)} orders ({summary})"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Checked {len(report)} orders ({summary})"))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from ticketing.capacity_utils import get_stale_holds, release_expired_holds
+
+
+class Command(BaseCommand):
+    help = 'Release checkout capacity holds that expired or whose payment failed (run every minute from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            dest='dry_run',
+            help='Show how many holds would be released without releasing them',
+        )
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            self.stdout.write(f"Would release {get_stale_holds().count()} capacity holds")
+            return
+
+        released = release_expired_holds()
+        self.stdout.write(self.style.SUCCESS(f'Released {released} capacity holds'))
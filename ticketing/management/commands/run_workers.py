@@ -0,0 +1,74 @@
+import os
+import socket
+import threading
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from ticketing.job_utils import claim_job, run_job, run_pending_jobs
+
+
+class Command(BaseCommand):
+    help = 'Run background job workers (payment webhooks, invoice rendering, transactional emails)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=getattr(settings, 'JOB_WORKERS', 2),
+            help='Number of worker threads (default: JOB_WORKERS setting)',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=5,
+            help='Seconds an idle worker waits before polling the queue again',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Process every job that is due and exit (useful from cron)',
+        )
+
+    def handle(self, *args, **options):
+        worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+
+        if options['once']:
+            processed = run_pending_jobs(f"{worker_prefix}:0")
+            self.stdout.write(self.style.SUCCESS(f'Processed {processed} jobs'))
+            return
+
+        stop_event = threading.Event()
+        threads = []
+        for n in range(max(options['workers'], 1)):
+            thread = threading.Thread(
+                target=self.work,
+                args=(f"{worker_prefix}:{n}", options['poll_interval'], stop_event),
+                name=f"job-worker-{n}",
+                daemon=True,
+            )
+            thread.start()
+            threads.append(thread)
+
+        self.stdout.write(self.style.SUCCESS(f'Started {len(threads)} job workers, press Ctrl+C to stop'))
+        try:
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(timeout=1)
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping workers after their current job...')
+            stop_event.set()
+            for thread in threads:
+                thread.join()
+
+    def work(self, worker_id, poll_interval, stop_event):
+        """Worker thread loop: claim and run jobs until asked to stop"""
+        try:
+            while not stop_event.is_set():
+                close_old_connections()
+                job = claim_job(worker_id)
+                if job:
+                    run_job(job)
+                else:
+                    stop_event.wait(poll_interval)
+        finally:
+            connection.close()
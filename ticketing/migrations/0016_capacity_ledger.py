@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-18 00:20
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def populate_attendees_sold(apps, schema_editor):
+    """Seed the capacity ledger from the tickets sold so far"""
+    Event = apps.get_model('ticketing', 'Event')
+    TicketType = apps.get_model('ticketing', 'TicketType')
+    Ticket = apps.get_model('ticketing', 'Ticket')
+
+    sold_tickets = Ticket.objects.filter(status__in=['SOLD', 'VALID', 'USED'])
+    for row in sold_tickets.values('event_id').annotate(total=Sum('total_admission_count')):
+        Event.objects.filter(pk=row['event_id']).update(attendees_sold=row['total'] or 0)
+    for row in sold_tickets.exclude(ticket_type__isnull=True).values('ticket_type_id').annotate(total=Sum('total_admission_count')):
+        TicketType.objects.filter(pk=row['ticket_type_id']).update(attendees_sold=row['total'] or 0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ticketing', '0015_change_url_fields_to_text'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='attendees_sold',
+            field=models.PositiveIntegerField(default=0, help_text='Attendees admitted by sold tickets (maintained by capacity_utils)'),
+        ),
+        migrations.AddField(
+            model_name='tickettype',
+            name='attendees_sold',
+            field=models.PositiveIntegerField(default=0, help_text='Attendees admitted by sold tickets of this type (maintained by capacity_utils)'),
+        ),
+        migrations.RunPython(populate_attendees_sold, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.5 on 2026-10-18 00:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ticketing', '0019_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CheckInCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('minute', models.DateTimeField()),
+                ('scans', models.PositiveIntegerField(default=0)),
+                ('admissions', models.PositiveIntegerField(default=0)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='check_in_counters', to='ticketing.event')),
+                ('volunteer', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='check_in_counters', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['event', 'minute'], name='ticketing_c_event_i_d1c458_idx')],
+                'unique_together': {('event', 'volunteer', 'minute')},
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.5 on 2026-10-18 00:42
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ticketing', '0020_check_in_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='checkincounter',
+            name='rejected',
+            field=models.PositiveIntegerField(default=0, help_text='Rejected scan attempts, rolled up from the scan log'),
+        ),
+        migrations.AlterField(
+            model_name='checkincounter',
+            name='event',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='check_in_counters', to='ticketing.event'),
+        ),
+        migrations.CreateModel(
+            name='ScanEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('outcome', models.CharField(choices=[('ADMITTED', 'Admitted'), ('REJECTED', 'Rejected')], max_length=10)),
+                ('error_code', models.CharField(blank=True, max_length=30)),
+                ('source', models.CharField(choices=[('SINGLE', 'Single scan'), ('BATCH', 'Batch scan'), ('OFFLINE', 'Offline sync')], default='SINGLE', max_length=10)),
+                ('device', models.CharField(blank=True, max_length=100)),
+                ('latency_ms', models.PositiveIntegerField(default=0)),
+                ('scanned_at', models.DateTimeField()),
+                ('event', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='ticketing.event')),
+                ('ticket', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='ticketing.ticket')),
+                ('volunteer', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['event', 'scanned_at'], name='ticketing_s_event_i_512755_idx'), models.Index(fields=['volunteer', 'scanned_at'], name='ticketing_s_volunte_7f8844_idx')],
+            },
+        ),
+    ]
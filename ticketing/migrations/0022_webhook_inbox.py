@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-18 00:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ticketing', '0021_scan_event_log'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookInbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provider', models.CharField(default='cashfree', max_length=20)),
+                ('event_id', models.CharField(max_length=100)),
+                ('order_id', models.CharField(max_length=100)),
+                ('event_type', models.CharField(blank=True, max_length=50)),
+                ('payload', models.JSONField(default=dict)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('PROCESSED', 'Processed'), ('IGNORED', 'Ignored'), ('FAILED', 'Failed')], default='PENDING', max_length=10)),
+                ('deliveries', models.PositiveIntegerField(default=1)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'received_at'], name='ticketing_w_status_5c3543_idx'), models.Index(fields=['order_id'], name='ticketing_w_order_i_9c8b5a_idx')],
+                'unique_together': {('provider', 'event_id', 'order_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.5 on 2026-10-18 01:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ticketing', '0023_orders'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='max_promo_redemptions',
+            field=models.PositiveIntegerField(default=0, help_text="Discounted orders allowed across all of the event's promo codes (0 means unlimited)"),
+        ),
+        migrations.AddField(
+            model_name='promocode',
+            name='max_uses_per_user',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='PromoRedemption',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('RESERVED', 'Reserved'), ('REDEEMED', 'Redeemed'), ('RELEASED', 'Released')], default='RESERVED', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='promo_redemptions', to='ticketing.order')),
+                ('promo_code', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='redemptions', to='ticketing.promocode')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='promo_redemptions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['promo_code', 'user', 'status'], name='ticketing_p_promo_c_b64ad1_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status__in', ['RESERVED', 'REDEEMED'])), fields=('order',), name='promo_redemption_one_per_order')],
+            },
+        ),
+    ]
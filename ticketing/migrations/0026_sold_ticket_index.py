@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-18 01:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ticketing', '0025_invoice_pdf_artifacts'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='ticket',
+            name='ticket_event_sold_used_idx',
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(condition=models.Q(('status__in', ['SOLD', 'VALID', 'USED'])), fields=['event', 'ticket_type'], name='ticket_event_sold_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.5 on 2026-10-18 02:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, Q, Sum
+
+
+def merge_duplicate_buckets(apps, schema_editor):
+    """Fold counter rows that share a bucket with a NULL event or volunteer into one row"""
+    CheckInCounter = apps.get_model('ticketing', 'CheckInCounter')
+
+    duplicates = CheckInCounter.objects.filter(Q(event__isnull=True) | Q(volunteer__isnull=True)).values(
+        'event_id', 'volunteer_id', 'minute',
+    ).annotate(
+        rows=Count('id'), keep=Min('id'), scans_total=Sum('scans'), admissions_total=Sum('admissions'), rejected_total=Sum('rejected'),
+    ).filter(rows__gt=1)
+    for row in duplicates:
+        bucket = CheckInCounter.objects.filter(event_id=row['event_id'], volunteer_id=row['volunteer_id'], minute=row['minute'])
+        bucket.exclude(pk=row['keep']).delete()
+        bucket.update(scans=row['scans_total'], admissions=row['admissions_total'], rejected=row['rejected_total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ticketing', '0026_sold_ticket_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_buckets, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='checkincounter',
+            name='volunteer',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='check_in_counters', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='checkincounter',
+            constraint=models.UniqueConstraint(condition=models.Q(('event__isnull', True)), fields=('volunteer', 'minute'), name='checkin_counter_no_event_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='checkincounter',
+            constraint=models.UniqueConstraint(condition=models.Q(('volunteer__isnull', True)), fields=('event', 'minute'), name='checkin_counter_no_volunteer_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='checkincounter',
+            constraint=models.UniqueConstraint(condition=models.Q(('event__isnull', True), ('volunteer__isnull', True)), fields=('minute',), name='checkin_counter_no_keys_uniq'),
+        ),
+    ]
@@ -52,6 +52,20 @@ class User(AbstractUser):
 
 from django.utils.text import slugify
 
+def ledger_safe_update_fields(instance, ledger_fields, kwargs):
+    """
+    Leave the capacity ledger columns out of a full-row save of an existing row, so
+    an edit never writes back counters that F() updates changed since it was loaded.
+    The ledger is only written through capacity_utils; explicit update_fields are kept.
+    """
+    if instance._state.adding or kwargs.get('force_insert') or kwargs.get('update_fields') is not None:
+        return
+    kwargs['update_fields'] = [
+        field.name for field in instance._meta.concrete_fields
+        if not field.primary_key and field.name not in ledger_fields
+    ]
+
+
 class Event(models.Model):
     EVENT_STATUS = (
         ('DRAFT', 'Draft'),
@@ -80,6 +94,9 @@ class Event(models.Model):
     banner_image_id = models.CharField(max_length=200, blank=True, help_text="Extracted Google Drive file ID")
     banner_image = models.ImageField(upload_to='event_banners/', null=True, blank=True)  # Keep for backward compatibility
     featured = models.BooleanField(default=False)
+    attendees_sold = models.PositiveIntegerField(default=0, help_text="Attendees admitted by sold tickets (maintained by capacity_utils)")
+    attendees_held = models.PositiveIntegerField(default=0, help_text="Attendees reserved by active checkout holds (maintained by capacity_utils)")
+    max_promo_redemptions = models.PositiveIntegerField(default=0, help_text="Discounted orders allowed across all of the event's promo codes (0 means unlimited)")
     venue_terms = models.TextField(blank=True)
     event_terms = models.TextField(blank=True)
     restrictions = models.TextField(blank=True)
@@ -92,6 +109,7 @@ class Event(models.Model):
         # Extract Google Drive ID from banner URL if provided
         if self.banner_image_url and not self.banner_image_id:
             self.banner_image_id = extract_google_drive_id(self.banner_image_url)
+        ledger_safe_update_fields(self, ('attendees_sold', 'attendees_held'), kwargs)
         super().save(*args, **kwargs)
     
     def get_banner_image_url(self):
@@ -115,12 +133,11 @@ class Event(models.Model):
         
     @property
     def total_attendees_registered(self):
-        sold_tickets = self.tickets.filter(status='SOLD').select_related('ticket_type')
-        return sum(ticket.ticket_type.attendees_per_ticket for ticket in sold_tickets)
+        return self.attendees_sold
     
     @property
     def remaining_attendee_capacity(self):
-        return self.capacity - self.total_attendees_registered
+        return max(0, self.capacity - self.attendees_sold - self.attendees_held)
     
     @property
     def tickets_are_live(self):
@@ -178,6 +195,11 @@ class TicketType(models.Model):
     quantity = models.PositiveIntegerField(default=0)
     description = models.TextField(blank=True)
     attendees_per_ticket = models.PositiveIntegerField(default=1, help_text="Number of attendees allowed per ticket (e.g., 2 for couple tickets)")
+    attendees_sold = models.PositiveIntegerField(default=0, help_text="Attendees admitted by sold tickets of this type (maintained by capacity_utils)")
+    
+    def save(self, *args, **kwargs):
+        ledger_safe_update_fields(self, ('attendees_sold',), kwargs)
+        super().save(*args, **kwargs)
     
     def __str__(self):
         return f"{self.type_name} - {self.event.title}"
@@ -210,10 +232,85 @@ class Ticket(models.Model):
     # New fields for consolidated tickets
     total_admission_count = models.IntegerField(default=1, help_text="Total number of people this ticket admits")
     booking_quantity = models.IntegerField(default=1, help_text="Number of tickets booked to create this consolidated ticket")
-    
+
+    class Meta:
+        indexes = [
+            # Sales and check-in counts per event, a customer's tickets, a volunteer's scans
+            models.Index(fields=['event', 'status'], name='ticket_event_status_idx'),
+            models.Index(fields=['customer', 'status'], name='ticket_customer_status_idx'),
+            models.Index(fields=['validated_by', 'used_at'], name='ticket_validator_used_idx'),
+            # The capacity ledger and dashboards only aggregate sold, valid or checked-in
+            # tickets of an event (capacity_utils.SOLD_STATUSES)
+            models.Index(
+                fields=['event', 'ticket_type'],
+                condition=models.Q(status__in=['SOLD', 'VALID', 'USED']),
+                name='ticket_event_sold_idx',
+            ),
+            models.Index(
+                fields=['event', 'used_at'],
+                condition=models.Q(status='USED'),
+                name='ticket_event_checkin_idx',
+            ),
+        ]
+
     def __str__(self):
         return f"{self.ticket_number} - {self.event.title}"
 
+class Order(models.Model):
+    """
+    A customer's ticket selection, from booking through payment.
+    Prices, attendees and the discount are snapshotted when the order is built,
+    so issuing tickets never depends on the session or on later price edits.
+    """
+    ORDER_STATUS_CHOICES = (
+        ('OPEN', 'Open'),
+        ('PAID', 'Paid'),
+    )
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders')
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='orders')
+    status = models.CharField(max_length=10, choices=ORDER_STATUS_CHOICES, default='OPEN')
+    subtotal = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    discount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    total = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    total_attendees = models.PositiveIntegerField(default=0)
+    promo_code = models.CharField(max_length=20, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'status']),
+        ]
+
+    def __str__(self):
+        return f"Order #{self.id} - {self.event.title} ({self.get_status_display()})"
+
+
+class OrderLine(models.Model):
+    """One ticket type in an Order, priced at the time of booking"""
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='lines')
+    ticket_type = models.ForeignKey(TicketType, on_delete=models.CASCADE, related_name='order_lines')
+    type_name = models.CharField(max_length=100)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    quantity = models.PositiveIntegerField()
+    attendees_per_ticket = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        unique_together = ['order', 'ticket_type']
+
+    @property
+    def subtotal(self):
+        return self.price * self.quantity
+
+    @property
+    def total_attendees(self):
+        return self.quantity * self.attendees_per_ticket
+
+    def __str__(self):
+        return f"{self.quantity} x {self.type_name}"
+
+
 class PaymentTransaction(models.Model):
     PAYMENT_STATUS_CHOICES = (
         ('CREATED', 'Created'),
@@ -233,6 +330,7 @@ class PaymentTransaction(models.Model):
     payment_status = models.CharField(max_length=20, default='Pending')  # For webhook compatibility
     event = models.ForeignKey(Event, on_delete=models.CASCADE, null=True, blank=True)  # Associated event
     quantity = models.PositiveIntegerField(default=1)  # Number of tickets
+    purchase_order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True, related_name='transactions')
     response_data = models.JSONField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -241,6 +339,36 @@ class PaymentTransaction(models.Model):
         return f"{self.order_id} - {self.get_status_display()}"
 
 
+class CapacityHold(models.Model):
+    """Seats reserved for a checkout while the customer is paying"""
+    HOLD_STATUS_CHOICES = (
+        ('ACTIVE', 'Active'),
+        ('CONSUMED', 'Consumed'),
+        ('RELEASED', 'Released'),
+    )
+
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='capacity_holds')
+    transaction = models.OneToOneField(PaymentTransaction, on_delete=models.CASCADE, related_name='capacity_hold')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='capacity_holds')
+    attendees = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=HOLD_STATUS_CHOICES, default='ACTIVE')
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'expires_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.attendees} attendees for {self.event.title} ({self.get_status_display()})"
+
+    @property
+    def is_expired(self):
+        return self.expires_at <= timezone.now()
+
+
 class PromoCode(models.Model):
     DISCOUNT_TYPE = (
         ('PERCENTAGE', 'Percentage'),
@@ -254,7 +382,8 @@ class PromoCode(models.Model):
     valid_from = models.DateTimeField()
     valid_until = models.DateTimeField()
     max_uses = models.PositiveIntegerField(default=0)  # 0 means unlimited
-    current_uses = models.PositiveIntegerField(default=0)
+    max_uses_per_user = models.PositiveIntegerField(default=0)  # 0 means unlimited
+    current_uses = models.PositiveIntegerField(default=0)  # Reserved and redeemed slots (maintained by promo_utils)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
@@ -263,10 +392,7 @@ class PromoCode(models.Model):
         
     @property
     def is_valid(self):
-        import logging
-        from django.utils import timezone
         now = timezone.now()
-        logging.debug(f"PromoCode.is_valid check: is_active={self.is_active}, valid_from={self.valid_from}, valid_until={self.valid_until}, now={now}, max_uses={self.max_uses}, current_uses={self.current_uses}")
         return (
             self.is_active and
             self.valid_from <= now <= self.valid_until and
@@ -321,14 +447,7 @@ class PromoCode(models.Model):
         )
         result = successful_usages.aggregate(avg=Avg('order_total'))
         return result['avg'] or 0
-    
-    def sync_current_uses(self):
-        """Sync current_uses to match actual successful, non-sandbox usages"""
-        actual_uses = self.total_tickets_booked()  # This now counts only successful transactions
-        if self.current_uses != actual_uses:
-            self.current_uses = actual_uses
-            self.save(update_fields=['current_uses'])
-        return actual_uses
+
 
 class PromoCodeUsage(models.Model):
     """Track usage of promo codes for analytics"""
@@ -342,6 +461,41 @@ class PromoCodeUsage(models.Model):
     def __str__(self):
         return f"{self.promo_code.code} used by {self.user.email}"
 
+
+class PromoRedemption(models.Model):
+    """
+    A promo code slot taken by an order. Checkout reserves it together with the
+    current_uses increment, a successful payment redeems it and a failed payment
+    releases it again.
+    """
+    STATUS_CHOICES = (
+        ('RESERVED', 'Reserved'),
+        ('REDEEMED', 'Redeemed'),
+        ('RELEASED', 'Released'),
+    )
+
+    promo_code = models.ForeignKey(PromoCode, on_delete=models.CASCADE, related_name='redemptions')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='promo_redemptions')
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='promo_redemptions')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='RESERVED')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['promo_code', 'user', 'status']),
+        ]
+        constraints = [
+            # An order holds at most one live slot
+            models.UniqueConstraint(
+                fields=['order'], condition=models.Q(status__in=['RESERVED', 'REDEEMED']),
+                name='promo_redemption_one_per_order',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.promo_code.code} for order #{self.order_id} ({self.get_status_display()})"
+
 class EventStaff(models.Model):
     STAFF_ROLE = (
         ('VOLUNTEER', 'Volunteer'),
@@ -416,9 +570,19 @@ class Invoice(models.Model):
     invoice_number = models.CharField(max_length=50, unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    # Rendered PDF in the invoice storage (maintained by invoice_utils.get_invoice_pdf_path)
+    pdf_path = models.CharField(max_length=255, blank=True)
+    pdf_version = models.PositiveSmallIntegerField(default=0)
+    pdf_rendered_at = models.DateTimeField(null=True, blank=True)
+    
     class Meta:
         # Ensure each ticket can only have one invoice
         unique_together = ['ticket', 'transaction']
+        indexes = [
+            # Invoice dashboard / analytics filter and sort by creation time, optionally per event
+            models.Index(fields=['created_at'], name='invoice_created_idx'),
+            models.Index(fields=['event', 'created_at'], name='invoice_event_created_idx'),
+        ]
     
     def __str__(self):
         return f"Invoice #{self.invoice_number} - {self.ticket.ticket_number}"
@@ -428,4 +592,144 @@ class Invoice(models.Model):
         if not self.invoice_number:
             import uuid
             self.invoice_number = f"INV-{uuid.uuid4().hex[:8].upper()}"
-        super().save(*args, **kwargs)
\ No newline at end of file
+        super().save(*args, **kwargs)
+
+class CheckInCounter(models.Model):
+    """Admitted scans per event, volunteer and minute, incremented at check-in time (see occupancy_utils)"""
+    # Rejected scans of unknown tickets have no event. Counters keep the id of a deleted
+    # volunteer: nulling it could merge two buckets into one and break the constraints below.
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, null=True, blank=True, related_name='check_in_counters')
+    volunteer = models.ForeignKey(
+        User, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, related_name='check_in_counters',
+    )
+    minute = models.DateTimeField()
+    scans = models.PositiveIntegerField(default=0)
+    admissions = models.PositiveIntegerField(default=0)
+    rejected = models.PositiveIntegerField(default=0, help_text="Rejected scan attempts, rolled up from the scan log")
+
+    class Meta:
+        unique_together = ['event', 'volunteer', 'minute']
+        indexes = [
+            models.Index(fields=['event', 'minute']),
+        ]
+        constraints = [
+            # unique_together never matches NULLs, so buckets without an event or volunteer
+            # need their own partial constraints for the create fallback in occupancy_utils
+            models.UniqueConstraint(
+                fields=['volunteer', 'minute'], condition=models.Q(event__isnull=True),
+                name='checkin_counter_no_event_uniq',
+            ),
+            models.UniqueConstraint(
+                fields=['event', 'minute'], condition=models.Q(volunteer__isnull=True),
+                name='checkin_counter_no_volunteer_uniq',
+            ),
+            models.UniqueConstraint(
+                fields=['minute'], condition=models.Q(event__isnull=True, volunteer__isnull=True),
+                name='checkin_counter_no_keys_uniq',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.event.title if self.event else 'Unknown event'} {self.minute:%H:%M}: {self.admissions} admitted"
+
+
+class ScanEvent(models.Model):
+    """
+    Append-only log of every scan attempt, written by scanlog_utils.
+    Foreign keys are not enforced by the database so inserts stay cheap and
+    attempts with unknown ticket IDs can still be logged.
+    """
+    OUTCOME_CHOICES = (
+        ('ADMITTED', 'Admitted'),
+        ('REJECTED', 'Rejected'),
+    )
+    SOURCE_CHOICES = (
+        ('SINGLE', 'Single scan'),
+        ('BATCH', 'Batch scan'),
+        ('OFFLINE', 'Offline sync'),
+    )
+
+    event = models.ForeignKey(Event, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, related_name='+')
+    ticket = models.ForeignKey('Ticket', on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, related_name='+')
+    volunteer = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, related_name='+')
+    outcome = models.CharField(max_length=10, choices=OUTCOME_CHOICES)
+    error_code = models.CharField(max_length=30, blank=True)
+    source = models.CharField(max_length=10, choices=SOURCE_CHOICES, default='SINGLE')
+    device = models.CharField(max_length=100, blank=True)
+    latency_ms = models.PositiveIntegerField(default=0)
+    scanned_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['event', 'scanned_at']),
+            models.Index(fields=['volunteer', 'scanned_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_outcome_display()} scan of ticket {self.ticket_id} at {self.scanned_at}"
+
+
+class Job(models.Model):
+    """Background job stored in the database and executed by the run_workers command"""
+    JOB_STATUS_CHOICES = (
+        ('PENDING', 'Pending'),
+        ('RUNNING', 'Running'),
+        ('DONE', 'Done'),
+        ('DEAD', 'Dead'),
+    )
+
+    job_type = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=JOB_STATUS_CHOICES, default='PENDING')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+        ]
+
+    def __str__(self):
+        return f"{self.job_type} #{self.id} ({self.get_status_display()})"
+
+
+class WebhookInbox(models.Model):
+    """
+    Payment gateway webhook delivery, stored as received before it is processed.
+    One row per (provider, event id, order): retried deliveries of the same event
+    collapse onto the existing row and are never processed twice.
+    """
+    INBOX_STATUS_CHOICES = (
+        ('PENDING', 'Pending'),
+        ('PROCESSED', 'Processed'),
+        ('IGNORED', 'Ignored'),
+        ('FAILED', 'Failed'),
+    )
+
+    provider = models.CharField(max_length=20, default='cashfree')
+    event_id = models.CharField(max_length=100)
+    order_id = models.CharField(max_length=100)
+    event_type = models.CharField(max_length=50, blank=True)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=INBOX_STATUS_CHOICES, default='PENDING')
+    deliveries = models.PositiveIntegerField(default=1)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ['provider', 'event_id', 'order_id']
+        indexes = [
+            models.Index(fields=['status', 'received_at']),
+            models.Index(fields=['order_id']),
+        ]
+
+    def __str__(self):
+        return f"{self.provider} {self.event_type or 'webhook'} for {self.order_id} ({self.get_status_display()})"
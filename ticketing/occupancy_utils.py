@@ -0,0 +1,167 @@
+import logging
+from collections import defaultdict
+from datetime import timedelta
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Sum
+from django.db.models.functions import TruncMinute
+from django.utils import timezone
+from .models import CheckInCounter, Ticket
+
+logger = logging.getLogger(__name__)
+
+
+def _minute(at):
+    return at.replace(second=0, microsecond=0)
+
+
+def _increment_counters(buckets):
+    """Apply {(event_id, volunteer_id, minute): {field: amount}} to the CheckInCounter rows"""
+    for (event_id, volunteer_id, minute), amounts in buckets.items():
+        counter = CheckInCounter.objects.filter(event_id=event_id, volunteer_id=volunteer_id, minute=minute)
+        increments = {field: F(field) + amount for field, amount in amounts.items()}
+        if counter.update(**increments):
+            continue
+        try:
+            with transaction.atomic():
+                CheckInCounter.objects.create(event_id=event_id, volunteer_id=volunteer_id, minute=minute, **amounts)
+        except IntegrityError:
+            # Another gate created this minute's row first
+            counter.update(**increments)
+
+
+def record_check_ins(check_ins):
+    """
+    Add admitted scans to the per-minute CheckInCounter rows.
+    check_ins is an iterable of (event_id, volunteer_id, admissions, checked_in_at);
+    one UPDATE (or INSERT for a new minute) is issued per event, volunteer and minute.
+    """
+    buckets = defaultdict(lambda: {'scans': 0, 'admissions': 0})
+    for event_id, volunteer_id, admissions, checked_in_at in check_ins:
+        bucket = buckets[(event_id, volunteer_id, _minute(checked_in_at))]
+        bucket['scans'] += 1
+        bucket['admissions'] += admissions or 1
+    _increment_counters(buckets)
+
+
+def record_rejected_scans(rejections):
+    """Add rejected scan attempts, given as (event_id, volunteer_id, scanned_at), to the counters"""
+    buckets = defaultdict(lambda: {'rejected': 0})
+    for event_id, volunteer_id, scanned_at in rejections:
+        buckets[(event_id, volunteer_id, _minute(scanned_at))]['rejected'] += 1
+    _increment_counters(buckets)
+
+
+def move_check_in(event_id, admissions, previous, current):
+    """
+    Move one admitted scan between counter rows when a check-in is attributed to an
+    earlier scan (see checkin_utils.apply_offline_checkins).
+    previous and current are (volunteer_id, checked_in_at).
+    """
+    admissions = admissions or 1
+    CheckInCounter.objects.filter(
+        event_id=event_id, volunteer_id=previous[0], minute=_minute(previous[1]),
+        scans__gt=0, admissions__gte=admissions,
+    ).update(scans=F('scans') - 1, admissions=F('admissions') - admissions)
+    record_check_ins([(event_id, current[0], admissions, current[1])])
+
+
+def record_check_in(ticket, volunteer, checked_in_at):
+    record_check_ins([(ticket.event_id, volunteer.id if volunteer else None, ticket.total_admission_count, checked_in_at)])
+
+
+def get_occupancy(event, window_minutes=15):
+    """
+    Live gate figures for an event, read from the check-in counters only:
+    admissions so far, scans per minute, a per-minute timeline and a per-volunteer breakdown.
+    """
+    now = timezone.now()
+    counters = CheckInCounter.objects.filter(event=event)
+    totals = counters.aggregate(scans=Sum('scans'), admissions=Sum('admissions'), rejected=Sum('rejected'))
+    window_start = _minute(now) - timedelta(minutes=window_minutes - 1)
+
+    timeline = {
+        row['minute']: row
+        for row in counters.filter(minute__gte=window_start).values('minute').annotate(
+            scans=Sum('scans'), admissions=Sum('admissions'), rejected=Sum('rejected'),
+        )
+    }
+    minutes = [window_start + timedelta(minutes=i) for i in range(window_minutes)]
+    # The rate covers the last five complete minutes, the current one is still filling up
+    last_five = sum(timeline[minute]['scans'] for minute in minutes[-6:-1] if minute in timeline)
+
+    volunteers = counters.values(
+        'volunteer_id', 'volunteer__email', 'volunteer__first_name', 'volunteer__last_name',
+    ).annotate(
+        scans=Sum('scans'), admissions=Sum('admissions'), rejected=Sum('rejected'), last_minute=Max('minute'),
+    ).order_by('-scans')
+
+    admissions = totals['admissions'] or 0
+    return {
+        'event_id': event.id,
+        'capacity': event.capacity,
+        'checked_in': admissions,
+        'tickets_scanned': totals['scans'] or 0,
+        'rejected_scans': totals['rejected'] or 0,
+        'occupancy_percent': round(admissions / event.capacity * 100, 1) if event.capacity else None,
+        'scans_per_minute': round(last_five / 5, 1),
+        'timeline': [
+            {
+                'minute': timezone.localtime(minute).strftime('%H:%M'),
+                'scans': timeline[minute]['scans'] if minute in timeline else 0,
+                'admissions': timeline[minute]['admissions'] if minute in timeline else 0,
+                'rejected': timeline[minute]['rejected'] if minute in timeline else 0,
+            }
+            for minute in minutes
+        ],
+        'volunteers': [
+            {
+                'name': f"{row['volunteer__first_name']} {row['volunteer__last_name']}".strip() or row['volunteer__email'] or 'Unknown',
+                'scans': row['scans'],
+                'admissions': row['admissions'],
+                'rejected': row['rejected'],
+                'last_scan': timezone.localtime(row['last_minute']).strftime('%H:%M'),
+            }
+            for row in volunteers
+        ],
+        'updated_at': now.isoformat(),
+    }
+
+
+def rebuild_check_in_counters(event_ids=None, dry_run=False):
+    """
+    Recreate the admitted scan counts in CheckInCounter from the USED tickets (used_at, validated_by).
+    Needed after tickets are marked used outside the scanner, e.g. from the admin.
+    Returns {event_id: (counted admissions, admissions from tickets)} for drifted events.
+    """
+    tickets = Ticket.objects.filter(status='USED', used_at__isnull=False)
+    counters = CheckInCounter.objects.all()
+    if event_ids:
+        tickets = tickets.filter(event_id__in=event_ids)
+        counters = counters.filter(event_id__in=event_ids)
+
+    rows = list(tickets.annotate(minute=TruncMinute('used_at')).values('event_id', 'validated_by_id', 'minute').annotate(
+        scans=Count('id'), admissions=Sum('total_admission_count'),
+    ))
+    expected = defaultdict(int)
+    for row in rows:
+        expected[row['event_id']] += row['admissions'] or 0
+    counted = dict(counters.values('event_id').annotate(total=Sum('admissions')).values_list('event_id', 'total'))
+
+    drifted = {
+        event_id: (counted.get(event_id) or 0, expected.get(event_id, 0))
+        for event_id in set(expected) | set(counted)
+        if (counted.get(event_id) or 0) != expected.get(event_id, 0)
+    }
+    if dry_run or not drifted:
+        return drifted
+
+    with transaction.atomic():
+        # Rejected counts come from the scan log, not from tickets, so rows are reset rather than deleted
+        counters.filter(event_id__in=drifted).update(scans=0, admissions=0)
+        _increment_counters({
+            (row['event_id'], row['validated_by_id'], row['minute']): {'scans': row['scans'], 'admissions': row['admissions'] or 0}
+            for row in rows if row['event_id'] in drifted
+        })
+        counters.filter(event_id__in=drifted, scans=0, rejected=0).delete()
+    logger.info(f"Rebuilt check-in counters for {len(drifted)} events")
+    return drifted
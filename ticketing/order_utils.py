@@ -0,0 +1,82 @@
+import logging
+from decimal import Decimal, ROUND_HALF_UP
+from django.db import transaction
+from .models import Order, OrderLine
+
+logger = logging.getLogger(__name__)
+
+# The only thing checkout keeps in the session
+SESSION_ORDER_KEY = 'order_id'
+CENT = Decimal('0.01')
+
+
+def build_order(user, event, quantities):
+    """
+    Create an OPEN order from {TicketType: quantity}, snapshotting each type's
+    name, price and attendees per ticket. Lines are inserted with one bulk_create.
+    """
+    lines = [
+        OrderLine(
+            ticket_type=ticket_type,
+            type_name=ticket_type.type_name,
+            price=ticket_type.price,
+            quantity=quantity,
+            attendees_per_ticket=ticket_type.attendees_per_ticket or 1,
+        )
+        for ticket_type, quantity in quantities.items()
+        if quantity > 0
+    ]
+    subtotal = sum((line.subtotal for line in lines), Decimal('0.00'))
+
+    with transaction.atomic():
+        order = Order.objects.create(
+            user=user,
+            event=event,
+            subtotal=subtotal,
+            total=subtotal,
+            total_attendees=sum(line.total_attendees for line in lines),
+        )
+        for line in lines:
+            line.order = order
+        OrderLine.objects.bulk_create(lines)
+
+    logger.info(f"Created order #{order.id} for {user.email}: {len(lines)} ticket types, {order.total_attendees} attendees")
+    return order
+
+
+def remember_order(request, order):
+    request.session[SESSION_ORDER_KEY] = order.id
+
+
+def forget_order(request):
+    request.session.pop(SESSION_ORDER_KEY, None)
+
+
+def get_session_order(request, event_id=None):
+    """The signed-in user's OPEN order referenced by the session, or None"""
+    order_id = request.session.get(SESSION_ORDER_KEY)
+    if not order_id or not request.user.is_authenticated:
+        return None
+    orders = Order.objects.select_related('event').filter(pk=order_id, user=request.user, status='OPEN')
+    if event_id is not None:
+        orders = orders.filter(event_id=event_id)
+    return orders.first()
+
+
+def calculate_discount(promo, subtotal):
+    """Discount a promo code gives on subtotal, never more than the subtotal"""
+    subtotal = Decimal(subtotal)
+    if promo.discount_type == 'PERCENTAGE':
+        discount = (promo.discount_value / 100 * subtotal).quantize(CENT, rounding=ROUND_HALF_UP)
+    else:
+        discount = promo.discount_value
+    return min(discount, subtotal)
+
+
+def apply_promo_code(order, promo):
+    """Snapshot a promo code's discount on the order (promo=None removes it)"""
+    order.promo_code = promo.code if promo else ''
+    order.discount = calculate_discount(promo, order.subtotal) if promo else Decimal('0.00')
+    order.total = max(order.subtotal - order.discount, Decimal('0.00'))
+    order.save(update_fields=['promo_code', 'discount', 'total', 'updated_at'])
+    return order
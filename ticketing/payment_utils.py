@@ -0,0 +1,430 @@
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Exists, F, OuterRef, Q
+from django.utils import timezone
+from .models import Order, PaymentTransaction, Ticket, PromoCode, PromoCodeUsage, WebhookInbox
+from .capacity_utils import claim_capacity, release_hold, CapacityError
+from .gateway_utils import get_cashfree_gateway, GatewayError
+from .issuance_utils import bulk_create_tickets
+from .job_utils import enqueue_job, enqueue_ticket_notifications
+from .promo_utils import invalidate_promo_index, redeem_promo_code, release_promo_code
+
+logger = logging.getLogger(__name__)
+
+# Outcomes understood by apply_payment_outcome
+FAILED_OUTCOMES = ('FAILED', 'CANCELLED')
+# Cashfree payment_status values in webhook payloads, mapped to outcomes
+CASHFREE_OUTCOMES = {
+    'SUCCESS': 'SUCCESS',
+    'FAILED': 'FAILED',
+    'USER_DROPPED': 'FAILED',
+    'CANCELLED': 'CANCELLED',
+}
+# Cashfree order_status values, mapped to outcomes. ACTIVE orders are still payable and left alone
+CASHFREE_ORDER_OUTCOMES = {
+    'PAID': 'SUCCESS',
+    'EXPIRED': 'FAILED',
+    'TERMINATED': 'CANCELLED',
+}
+
+
+def _ticket_type_quantities(ticket_order):
+    """{ticket_type_id: quantity} from a ticket order, which stores ticket_types as a list or a dict"""
+    ticket_types = ticket_order.get('ticket_types', {})
+    if isinstance(ticket_types, list):
+        return {
+            entry['id']: entry['quantity']
+            for entry in ticket_types
+            if isinstance(entry, dict) and 'id' in entry and 'quantity' in entry
+        }
+    if isinstance(ticket_types, dict):
+        return ticket_types
+    logger.error(f"ticket_types is not a dict or list: {type(ticket_types)}")
+    return {}
+
+
+def _record_promo_usage(payment_transaction, ticket_order, event, tickets):
+    promo_code_str = ticket_order.get('promo_code')
+    if not promo_code_str or not tickets:
+        return
+    try:
+        # Check if promo code usage already exists for this transaction to avoid duplicates
+        if PromoCodeUsage.objects.filter(
+            promo_code__code=promo_code_str,
+            user=payment_transaction.user,
+            ticket__purchase_transaction=payment_transaction,
+        ).exists():
+            logger.info(f"Promo code usage already recorded for transaction {payment_transaction.order_id}")
+            return
+
+        promo_code = PromoCode.objects.get(code=promo_code_str, event=event)
+        if payment_transaction.purchase_order_id:
+            # The slot was taken at checkout, the payment redeems it
+            redeem_promo_code(payment_transaction.purchase_order, promo_code)
+        else:
+            PromoCode.objects.filter(pk=promo_code.pk).update(current_uses=F('current_uses') + 1)
+            invalidate_promo_index(event.id)
+        PromoCodeUsage.objects.create(
+            promo_code=promo_code,
+            user=payment_transaction.user,
+            ticket=tickets[0],  # Link to first ticket
+            order_total=ticket_order.get('subtotal', 0),
+            discount_amount=ticket_order.get('discount', 0),
+        )
+        logger.info(f"Promo code {promo_code_str} applied successfully for transaction {payment_transaction.order_id}")
+    except PromoCode.DoesNotExist:
+        logger.error(f"Promo code {promo_code_str} does not exist for event {event.id}")
+
+
+def _ticket_order_for(payment_transaction):
+    """
+    The selection a transaction pays for, in the ticket order dict shape. Comes
+    from its Order when it has one, else from the JSON ticket order that
+    checkouts placed before Order existed stored in response_data.
+    """
+    order = payment_transaction.purchase_order
+    if order is None:
+        return (payment_transaction.response_data or {}).get('ticket_order', {})
+    return {
+        'event_id': order.event_id,
+        'ticket_types': {line.ticket_type_id: line.quantity for line in order.lines.all()},
+        'total_attendees': order.total_attendees,
+        'promo_code': order.promo_code,
+        'subtotal': order.subtotal,
+        'discount': order.discount,
+    }
+
+
+def create_tickets_for_payment(payment_transaction):
+    """
+    Create tickets for a successful PaymentTransaction.
+
+    Idempotent: tickets that already exist for the transaction are returned instead.
+    Callers hold the PaymentTransaction row lock (see apply_payment_outcome), so two
+    processes can never both find no tickets and issue the order twice.
+    The tickets follow the transaction's Order (see _ticket_order_for), which is marked PAID.
+    Raises CapacityError if the event sold out and the order had no capacity hold.
+    """
+    if payment_transaction.status != 'SUCCESS':
+        raise ValueError('Transaction must be marked as SUCCESS before creating tickets.')
+
+    existing_tickets = list(Ticket.objects.filter(purchase_transaction=payment_transaction))
+    if existing_tickets:
+        return existing_tickets
+
+    ticket_order = _ticket_order_for(payment_transaction)
+    if not ticket_order:
+        raise ValueError('No ticket order found for transaction.')
+    event_id = ticket_order.get('event_id')
+    if not event_id:
+        raise ValueError('No event_id found in ticket order data.')
+
+    with transaction.atomic():
+        # Secure capacity: consume the checkout hold, or re-check under the Event row lock
+        event = claim_capacity(event_id, ticket_order.get('total_attendees', 1), payment_transaction)
+        ticket_types = event.ticket_types.in_bulk()
+
+        now = timezone.now()
+        tickets = []
+        for ticket_type_id, quantity in _ticket_type_quantities(ticket_order).items():
+            quantity = int(quantity)
+            if quantity <= 0:
+                continue
+            ticket_type = ticket_types.get(int(ticket_type_id))
+            if ticket_type is None:
+                raise ValueError(f"Ticket type {ticket_type_id} does not belong to event {event.id}")
+
+            # One consolidated ticket per ticket type, admitting every attendee booked on it
+            tickets.append(Ticket(
+                purchase_transaction=payment_transaction,
+                event=event,
+                ticket_type=ticket_type,
+                customer=payment_transaction.user,
+                status='SOLD',
+                purchase_date=now,
+                booking_quantity=quantity,
+                total_admission_count=quantity * (ticket_type.attendees_per_ticket or 1),
+            ))
+
+        # One INSERT for all ticket types; also updates the capacity ledger in the same transaction
+        tickets = bulk_create_tickets(tickets)
+        _record_promo_usage(payment_transaction, ticket_order, event, tickets)
+
+        if payment_transaction.purchase_order_id is not None:
+            Order.objects.filter(pk=payment_transaction.purchase_order_id).update(status='PAID', updated_at=now)
+        payment_transaction.response_data = {
+            **(payment_transaction.response_data or {}),
+            'tickets_created': [ticket.id for ticket in tickets],
+            'ticket_count': len(tickets),
+            'ticket_creation_timestamp': now.isoformat(),
+        }
+        payment_transaction.save(update_fields=['response_data', 'updated_at'])
+
+        # Invoices and confirmation emails are sent by the run_workers job queue,
+        # so neither the webhook nor the redirect waits on PDF rendering or SMTP
+        enqueue_ticket_notifications(tickets, payment_transaction)
+
+    logger.info(f"Created {len(tickets)} tickets for transaction {payment_transaction.order_id}")
+    return tickets
+
+
+def release_reservations(payment_transaction):
+    """Give back the seats and the promo code slot held for an unpaid checkout"""
+    release_hold(payment_transaction)
+    if payment_transaction.purchase_order_id:
+        release_promo_code(payment_transaction.purchase_order)
+
+
+def apply_payment_outcome(order_id, outcome, cf_payment_id=None, transaction_id=None, source=''):
+    """
+    Move a PaymentTransaction to a final state and issue its tickets.
+
+    The single state machine used by the webhook processor, the payment_status
+    redirect and the reconcile_payments command. It runs under select_for_update on the transaction row, so a webhook
+    and a redirect (or two webhook deliveries) for the same order are serialized:
+    the first one issues the tickets and the others find them.
+
+    outcome is 'SUCCESS', 'FAILED' or 'CANCELLED'. A failure reported after the
+    order succeeded is ignored. Returns (payment_transaction, tickets); tickets is
+    empty for failed orders. Raises PaymentTransaction.DoesNotExist for unknown
+    orders and CapacityError (after recording it) if a paid order cannot be issued.
+    """
+    capacity_error = None
+    tickets = []
+    with transaction.atomic():
+        payment_transaction = PaymentTransaction.objects.select_for_update().get(order_id=order_id)
+
+        if outcome == 'SUCCESS':
+            if payment_transaction.status != 'SUCCESS':
+                payment_transaction.status = 'SUCCESS'
+                payment_transaction.payment_status = 'Paid'
+            if cf_payment_id:
+                payment_transaction.cf_payment_id = cf_payment_id
+            if transaction_id and not payment_transaction.transaction_id:
+                payment_transaction.transaction_id = transaction_id
+            payment_transaction.save(update_fields=['status', 'payment_status', 'cf_payment_id', 'transaction_id', 'updated_at'])
+
+            try:
+                with transaction.atomic():
+                    tickets = create_tickets_for_payment(payment_transaction)
+            except CapacityError as e:
+                # The customer paid: keep the order SUCCESS and flag it for a refund
+                payment_transaction.payment_status = 'Error - Capacity'
+                payment_transaction.save(update_fields=['payment_status', 'updated_at'])
+                if payment_transaction.purchase_order_id:
+                    release_promo_code(payment_transaction.purchase_order)
+                capacity_error = e
+
+        elif outcome in FAILED_OUTCOMES:
+            if payment_transaction.status == 'SUCCESS':
+                logger.warning(f"Ignoring {outcome} from {source or 'unknown source'} for already successful order {order_id}")
+            else:
+                payment_transaction.status = outcome
+                payment_transaction.payment_status = 'Failed'
+                payment_transaction.save(update_fields=['status', 'payment_status', 'updated_at'])
+                release_reservations(payment_transaction)
+        else:
+            raise ValueError(f"Unknown payment outcome: {outcome}")
+
+    if capacity_error:
+        logger.error(f"Paid order {order_id} could not be issued: {capacity_error}")
+        raise capacity_error
+    logger.info(f"Applied {outcome} from {source or 'unknown source'} to order {order_id}, {len(tickets)} tickets")
+    return payment_transaction, tickets
+
+
+def get_webhook_event_id(data, headers, raw_payload):
+    """
+    Identity of a Cashfree webhook event, the same for every retry of it.
+    Uses the x-idempotency-key header when Cashfree sends one, otherwise the
+    event type and payment id, otherwise a hash of the payload.
+    """
+    idempotency_key = headers.get('x-idempotency-key')
+    if idempotency_key:
+        return idempotency_key[:100]
+    cf_payment_id = data.get('data', {}).get('payment', {}).get('cf_payment_id')
+    if cf_payment_id:
+        return f"{data.get('type', '')}:{cf_payment_id}"[:100]
+    return hashlib.sha256(raw_payload.encode()).hexdigest()
+
+
+def record_webhook_delivery(data, headers, raw_payload):
+    """
+    Store a verified webhook delivery in the inbox and queue it for processing.
+    A retried delivery only bumps the existing row's delivery count and queues
+    nothing, so the cost per delivery is constant however often Cashfree retries.
+    Returns (inbox, created).
+    """
+    order_id = data.get('data', {}).get('order', {}).get('order_id') or ''
+    event_id = get_webhook_event_id(data, headers, raw_payload)
+    try:
+        with transaction.atomic():
+            inbox = WebhookInbox.objects.create(
+                provider='cashfree',
+                event_id=event_id,
+                order_id=order_id,
+                event_type=(data.get('type') or '')[:50],
+                payload=data,
+            )
+            enqueue_job('process_webhook', {'inbox_id': inbox.id})
+    except IntegrityError:
+        WebhookInbox.objects.filter(provider='cashfree', event_id=event_id, order_id=order_id).update(
+            deliveries=F('deliveries') + 1
+        )
+        logger.info(f"Duplicate webhook delivery {event_id} for order {order_id}")
+        return None, False
+    return inbox, True
+
+
+def process_webhook_delivery(inbox_id):
+    """
+    Apply one inbox row to its PaymentTransaction. The row is locked while it is
+    processed and only PENDING rows are handled, so each delivery is applied once.
+    Unexpected errors are recorded on the row and re-raised for the job queue to retry.
+    """
+    try:
+        with transaction.atomic():
+            inbox = WebhookInbox.objects.select_for_update().get(pk=inbox_id)
+            if inbox.status != 'PENDING':
+                return inbox
+
+            payment = inbox.payload.get('data', {}).get('payment', {})
+            outcome = CASHFREE_OUTCOMES.get((payment.get('payment_status') or '').upper())
+            inbox.attempts += 1
+            inbox.processed_at = timezone.now()
+            if outcome is None:
+                inbox.status = 'IGNORED'
+                inbox.last_error = f"Unhandled payment status {payment.get('payment_status')!r}"
+            else:
+                try:
+                    apply_payment_outcome(inbox.order_id, outcome, cf_payment_id=payment.get('cf_payment_id'), source='webhook')
+                    inbox.status = 'PROCESSED'
+                except PaymentTransaction.DoesNotExist:
+                    inbox.status = 'IGNORED'
+                    inbox.last_error = 'Unknown order'
+                except CapacityError as e:
+                    inbox.status = 'FAILED'
+                    inbox.last_error = str(e)
+            inbox.save(update_fields=['status', 'attempts', 'last_error', 'processed_at'])
+    except Exception as e:
+        WebhookInbox.objects.filter(pk=inbox_id).update(attempts=F('attempts') + 1, last_error=str(e))
+        raise
+
+    logger.info(f"Webhook {inbox.event_id} for order {inbox.order_id}: {inbox.get_status_display()}")
+    return inbox
+
+
+# --- Reconciliation of orders whose webhook and redirect never arrived ---
+
+def get_stale_transactions(older_than=None, event_ids=None):
+    """
+    Orders the reconciliation should look at: CREATED/PENDING orders older than
+    older_than (default PAYMENT_RECONCILE_AFTER_MINUTES), and SUCCESS orders that
+    have no tickets (issuance failed after the payment was recorded).
+    """
+    older_than = older_than or timedelta(minutes=getattr(settings, 'PAYMENT_RECONCILE_AFTER_MINUTES', 15))
+    has_tickets = Exists(Ticket.objects.filter(purchase_transaction=OuterRef('pk')))
+    stale = PaymentTransaction.objects.filter(created_at__lte=timezone.now() - older_than).filter(
+        Q(status__in=('CREATED', 'PENDING')) |
+        # Sold-out orders already failed issuance for capacity and are left for a refund
+        (Q(status='SUCCESS') & ~has_tickets & ~Q(payment_status='Error - Capacity'))
+    )
+    if event_ids:
+        stale = stale.filter(event_id__in=event_ids)
+    return stale
+
+
+def reconcile_transaction(payment_transaction, dry_run=False, gateway=None):
+    """
+    Settle one stale order from the status Cashfree reports for it, through the
+    same apply_payment_outcome state machine as the webhook. SUCCESS orders
+    without tickets are re-issued without asking the gateway.
+    Returns a report row: {'order_id', 'status', 'gateway_status', 'action', 'tickets', 'error'}.
+    """
+    row = {
+        'order_id': payment_transaction.order_id,
+        'status': payment_transaction.status,
+        'gateway_status': '',
+        'action': 'UNCHANGED',
+        'tickets': 0,
+        'error': '',
+    }
+    cf_payment_id = None
+    if payment_transaction.status == 'SUCCESS':
+        outcome = 'SUCCESS'
+    else:
+        gateway = gateway or get_cashfree_gateway()
+        try:
+            order = gateway.get_order(payment_transaction.order_id)
+            row['gateway_status'] = (order.get('order_status') or '').upper()
+            outcome = CASHFREE_ORDER_OUTCOMES.get(row['gateway_status'])
+            if outcome == 'SUCCESS':
+                payments = gateway.get_order_payments(payment_transaction.order_id)
+                cf_payment_id = next(
+                    (str(p.get('cf_payment_id')) for p in payments or [] if p.get('payment_status') == 'SUCCESS'), None,
+                )
+        except GatewayError as e:
+            row['action'] = 'ERROR'
+            row['error'] = str(e)
+            return row
+
+    if outcome is None:
+        return row
+    row['action'] = 'ISSUED' if outcome == 'SUCCESS' else outcome
+    if dry_run:
+        return row
+
+    try:
+        _, tickets = apply_payment_outcome(
+            payment_transaction.order_id, outcome, cf_payment_id=cf_payment_id, source='reconciliation',
+        )
+        row['tickets'] = len(tickets)
+    except CapacityError as e:
+        row['action'] = 'CAPACITY_ERROR'
+        row['error'] = str(e)
+    except Exception as e:
+        logger.exception(f"Reconciliation of order {payment_transaction.order_id} failed")
+        row['action'] = 'ERROR'
+        row['error'] = str(e)
+    return row
+
+
+def reconcile_payments(older_than=None, event_ids=None, batch_size=100, workers=None, limit=None, dry_run=False):
+    """
+    Reconcile stale orders in id order, batch_size at a time. Gateway lookups in a
+    batch run on a pool of `workers` threads (default PAYMENT_RECONCILE_WORKERS),
+    which bounds the concurrency towards Cashfree. Stops early once the gateway
+    circuit breaker opens. Returns the report rows.
+    """
+    workers = workers or getattr(settings, 'PAYMENT_RECONCILE_WORKERS', 4)
+    gateway = get_cashfree_gateway()
+    stale = get_stale_transactions(older_than, event_ids).order_by('id')
+
+    def reconcile(payment_transaction):
+        try:
+            return reconcile_transaction(payment_transaction, dry_run=dry_run, gateway=gateway)
+        finally:
+            # Each pool thread has its own database connection
+            connection.close()
+
+    report = []
+    last_id = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='payment-reconcile') as pool:
+        while limit is None or len(report) < limit:
+            size = batch_size if limit is None else min(batch_size, limit - len(report))
+            batch = list(stale.filter(id__gt=last_id)[:size])
+            if not batch:
+                break
+            last_id = batch[-1].id
+            report.extend(pool.map(reconcile, batch))
+            if gateway.breaker.state == 'open':
+                logger.error("Stopping payment reconciliation: the Cashfree circuit breaker is open")
+                break
+
+    settled = sum(1 for row in report if row['action'] not in ('UNCHANGED', 'ERROR'))
+    logger.info(f"Payment reconciliation{' (dry run)' if dry_run else ''}: {len(report)} orders checked, {settled} settled")
+    return report
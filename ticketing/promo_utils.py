@@ -0,0 +1,291 @@
+import logging
+import threading
+import time
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import transaction
+from django.db.models import Avg, Count, F, Q, Sum
+from django.utils import timezone
+from .models import Event, PromoCode, PromoCodeUsage, PromoRedemption
+
+logger = logging.getLogger(__name__)
+
+# Promo analytics only count usages on paid, non-sandbox transactions
+SUCCESSFUL_USAGE = Q(ticket__purchase_transaction__status='SUCCESS') & ~Q(ticket__purchase_transaction__payment_gateway='SANDBOX')
+
+# Redemptions that occupy a slot
+LIVE_REDEMPTION = ('RESERVED', 'REDEEMED')
+
+EMPTY_STATS = {
+    'usage_count': 0,
+    'amount_saved': Decimal('0.00'),
+    'revenue_generated': Decimal('0.00'),
+    'average_order_value': Decimal('0.00'),
+}
+
+
+def get_promo_code_stats(promo_code_ids):
+    """
+    Usage, discount and revenue per promo code in one query grouped by promo_code_id.
+    Returns {promo_code_id: {'usage_count', 'amount_saved', 'revenue_generated', 'average_order_value'}};
+    codes without successful usages are left out.
+    """
+    rows = PromoCodeUsage.objects.filter(SUCCESSFUL_USAGE, promo_code_id__in=promo_code_ids).values('promo_code_id').annotate(
+        usage_count=Count('id'),
+        amount_saved=Sum('discount_amount'),
+        revenue_generated=Sum('order_total'),
+        average_order_value=Avg('order_total'),
+    ).order_by()
+    return {
+        row['promo_code_id']: {
+            'usage_count': row['usage_count'],
+            'amount_saved': row['amount_saved'] or Decimal('0.00'),
+            'revenue_generated': row['revenue_generated'] or Decimal('0.00'),
+            'average_order_value': row['average_order_value'] or Decimal('0.00'),
+        }
+        for row in rows
+    }
+
+
+def redemption_rate(usage_count, max_uses):
+    """Share of max_uses redeemed as a percentage; unlimited codes count as 100"""
+    if max_uses == 0:
+        return 100
+    return usage_count / max_uses * 100
+
+
+def with_promo_code_stats(promo_codes):
+    """
+    Evaluate promo_codes (with their events) and set the analytics attributes the
+    templates read on each code: usage_count, tickets_booked, amount_saved,
+    revenue_generated, average_order_value and redemption_rate.
+    Two queries however many codes there are.
+    """
+    promo_codes = list(promo_codes.select_related('event'))
+    stats = get_promo_code_stats([promo_code.id for promo_code in promo_codes])
+    for promo_code in promo_codes:
+        code_stats = stats.get(promo_code.id, EMPTY_STATS)
+        promo_code.usage_count = code_stats['usage_count']
+        # Every usage is one successful booking
+        promo_code.tickets_booked = code_stats['usage_count']
+        promo_code.amount_saved = code_stats['amount_saved']
+        promo_code.revenue_generated = code_stats['revenue_generated']
+        promo_code.average_order_value = code_stats['average_order_value']
+        promo_code.redemption_rate = redemption_rate(code_stats['usage_count'], promo_code.max_uses)
+    return promo_codes
+
+
+def get_promo_totals(promo_codes):
+    """Organizer-level totals over codes already passed through with_promo_code_stats"""
+    limited = [promo_code for promo_code in promo_codes if promo_code.max_uses > 0]
+    total_max_uses = sum(promo_code.max_uses for promo_code in limited)
+    total_redemptions = sum(promo_code.usage_count for promo_code in promo_codes)
+    return {
+        'total_active_promos': sum(1 for promo_code in promo_codes if promo_code.is_active and promo_code.is_valid),
+        'total_saved': sum(float(promo_code.amount_saved) for promo_code in promo_codes),
+        'total_revenue': sum(float(promo_code.revenue_generated) for promo_code in promo_codes),
+        'avg_redemption_rate': total_redemptions / total_max_uses * 100 if total_max_uses else 0,
+    }
+
+
+# Per-event promo code indexes held by this process: {event_id: (version, loaded_at, index)}
+_local_indexes = {}
+_local_lock = threading.Lock()
+
+
+def _index_version_key(event_id):
+    return f"promo_index:{event_id}:version"
+
+
+def _index_version(event_id):
+    version = cache.get(_index_version_key(event_id))
+    if version is None:
+        # Not 1: after a cache flush a process must not mistake its old copy for the current one
+        cache.add(_index_version_key(event_id), time.time_ns(), None)
+        version = cache.get(_index_version_key(event_id))
+    return version
+
+
+def build_promo_index(event_id):
+    """{code: entry} for every promo code of the event, with what validation needs to know"""
+    return {
+        promo['code']: promo
+        for promo in PromoCode.objects.filter(event_id=event_id).values(
+            'id', 'code', 'discount_type', 'discount_value', 'valid_from', 'valid_until',
+            'is_active', 'max_uses', 'current_uses', 'max_uses_per_user',
+        )
+    }
+
+
+def get_promo_index(event_id):
+    """
+    The event's promo code index. Kept in this process and in the Django cache
+    under a version number; invalidate_promo_index bumps the version, and every
+    process rebuilds its copy the next time it is asked for one. Copies are also
+    dropped after PROMO_INDEX_CACHE_TIMEOUT, which bounds staleness when the
+    cache itself is per-process.
+    """
+    timeout = getattr(settings, 'PROMO_INDEX_CACHE_TIMEOUT', 60)
+    version = _index_version(event_id)
+    now = time.monotonic()
+    local = _local_indexes.get(event_id)
+    if local is not None and local[0] == version and now - local[1] < timeout:
+        return local[2]
+
+    key = f"promo_index:{event_id}:v{version}"
+    index = cache.get(key)
+    if index is None:
+        index = build_promo_index(event_id)
+        cache.set(key, index, timeout)
+    with _local_lock:
+        _local_indexes[event_id] = (version, now, index)
+    return index
+
+
+def invalidate_promo_index(event_id):
+    """Start a new index version for the event; old cached copies simply expire"""
+    try:
+        cache.incr(_index_version_key(event_id))
+    except ValueError:
+        cache.set(_index_version_key(event_id), time.time_ns(), None)
+
+
+def lookup_promo_code(event_id, code):
+    """The cached index entry for code on the event, or None for an unknown code"""
+    return get_promo_index(event_id).get(code)
+
+
+def promo_entry_problem(entry, now=None):
+    """Why a cached promo code entry cannot be applied right now, or None if it can"""
+    now = now or timezone.now()
+    if not entry['is_active']:
+        return 'This promo code is inactive'
+    if entry['valid_from'] > now:
+        return 'This promo code is not yet valid'
+    if entry['valid_until'] < now:
+        return 'This promo code has expired'
+    if entry['max_uses'] and entry['current_uses'] >= entry['max_uses']:
+        return 'This promo code has reached its maximum usage limit'
+    return None
+
+
+def _guess_key(client_ip):
+    return f"promo_guesses:{client_ip}"
+
+
+def _guess_cache():
+    # Only shared across processes when PROMO_GUESS_CACHE_ALIAS points at a shared backend
+    return caches[getattr(settings, 'PROMO_GUESS_CACHE_ALIAS', 'default')]
+
+
+def record_promo_guess(client_ip):
+    """Count an unknown promo code tried from client_ip during the current window"""
+    window = getattr(settings, 'PROMO_GUESS_WINDOW_SECONDS', 600)
+    guesses = _guess_cache()
+    if not guesses.add(_guess_key(client_ip), 1, window):
+        try:
+            guesses.incr(_guess_key(client_ip))
+        except ValueError:
+            guesses.set(_guess_key(client_ip), 1, window)
+
+
+def promo_guesses_exceeded(client_ip):
+    """
+    Whether client_ip tried PROMO_GUESS_LIMIT unknown codes within the window.
+    Such addresses cannot validate codes until the window expires, which stops
+    brute-force guessing of codes.
+    """
+    return (_guess_cache().get(_guess_key(client_ip)) or 0) >= getattr(settings, 'PROMO_GUESS_LIMIT', 20)
+
+
+class PromoUnavailable(Exception):
+    """The promo code cannot be redeemed on this order"""
+
+
+def _release(redemption):
+    PromoRedemption.objects.filter(pk=redemption.pk).update(status='RELEASED', updated_at=timezone.now())
+    PromoCode.objects.filter(pk=redemption.promo_code_id, current_uses__gt=0).update(current_uses=F('current_uses') - 1)
+    invalidate_promo_index(redemption.order.event_id)
+
+
+def user_can_redeem(promo, user):
+    """Whether user is below the code's per-user cap; reserve_promo_code enforces it for real"""
+    if not promo.max_uses_per_user:
+        return True
+    return promo.redemptions.filter(user=user, status__in=LIVE_REDEMPTION).count() < promo.max_uses_per_user
+
+
+def reserve_promo_code(order):
+    """
+    Take a slot of the order's promo code before the customer pays.
+
+    The event row and then the promo code row are locked before any cap is
+    counted: max_uses, the code's max_uses_per_user for this user and the event's
+    max_promo_redemptions. Concurrent checkouts queue on those locks and each one
+    counts the slots the previous ones committed, so no cap can be overshot.
+    Reserving again for the same code is a no-op; a slot held for a different
+    code is released first.
+    Returns the PromoRedemption (None without a promo code), raises PromoUnavailable.
+    """
+    with transaction.atomic():
+        # Event before promo code, the same lock order as the hold and payment paths
+        event_cap = Event.objects.select_for_update().values_list('max_promo_redemptions', flat=True).get(pk=order.event_id)
+        live = order.promo_redemptions.select_for_update().filter(status__in=LIVE_REDEMPTION).first()
+        if live is not None and live.promo_code.code == order.promo_code:
+            return live
+        if live is not None:
+            _release(live)
+        if not order.promo_code:
+            return None
+
+        promo = PromoCode.objects.select_for_update().filter(code=order.promo_code, event_id=order.event_id).first()
+        if promo is None:
+            raise PromoUnavailable('Invalid promo code')
+
+        now = timezone.now()
+        live_redemptions = PromoRedemption.objects.filter(status__in=LIVE_REDEMPTION)
+        if (
+            not promo.is_active or not promo.valid_from <= now <= promo.valid_until
+            or (promo.max_uses and promo.current_uses >= promo.max_uses)
+            or (promo.max_uses_per_user and live_redemptions.filter(
+                promo_code_id=promo.id, user_id=order.user_id,
+            ).count() >= promo.max_uses_per_user)
+            or (event_cap and live_redemptions.filter(promo_code__event_id=order.event_id).count() >= event_cap)
+        ):
+            raise PromoUnavailable(f"Promo code {promo.code} is no longer available")
+
+        PromoCode.objects.filter(pk=promo.pk).update(current_uses=F('current_uses') + 1)
+        redemption = PromoRedemption.objects.create(promo_code=promo, user_id=order.user_id, order=order)
+    # current_uses changed through update(), which sends no save signal
+    invalidate_promo_index(order.event_id)
+    logger.info(f"Reserved promo code {promo.code} for order #{order.id}")
+    return redemption
+
+
+def release_promo_code(order):
+    """Give back the order's reserved slot, e.g. when its payment failed. Redeemed slots are kept"""
+    with transaction.atomic():
+        reserved = order.promo_redemptions.select_for_update().filter(status='RESERVED').first()
+        if reserved is None:
+            return False
+        _release(reserved)
+    logger.info(f"Released promo code slot {reserved.id} of order #{order.id}")
+    return True
+
+
+def redeem_promo_code(order, promo_code):
+    """
+    Turn the order's reservation into a redemption once it is paid. A payment that
+    lands after its slot was released takes a slot again without the caps: the
+    customer has already paid the discounted price.
+    """
+    if PromoRedemption.objects.filter(order=order, promo_code=promo_code, status='RESERVED').update(
+        status='REDEEMED', updated_at=timezone.now(),
+    ):
+        return
+    if PromoRedemption.objects.filter(order=order, status='REDEEMED').exists():
+        return
+    PromoCode.objects.filter(pk=promo_code.pk).update(current_uses=F('current_uses') + 1)
+    PromoRedemption.objects.create(promo_code=promo_code, user_id=order.user_id, order=order, status='REDEEMED')
+    invalidate_promo_index(promo_code.event_id)
@@ -0,0 +1,161 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from functools import lru_cache
+from io import BytesIO
+from django.conf import settings
+from PIL import Image, ImageFont
+
+logger = logging.getLogger(__name__)
+
+SPONSOR_LOGO_SIZE = (60, 60)
+
+# (sponsor_id, url digest) -> decoded 60x60 RGBA logo, shared by every render in this process
+_logo_memory = {}
+_logo_lock = threading.Lock()
+_pending_downloads = set()
+# (sponsor_id, url digest) -> time of the last failed download, so a broken link is not retried on every render
+_failed_downloads = {}
+LOGO_RETRY_SECONDS = 300
+
+
+@lru_cache(maxsize=None)
+def get_font(size, bold=False):
+    """TrueType font for the pass renderer, parsed once per process per (size, weight)"""
+    try:
+        if bold:
+            return ImageFont.truetype("arialbd.ttf", size)
+        return ImageFont.truetype("arial.ttf", size)
+    except OSError:
+        return ImageFont.load_default()
+
+
+def get_logo_cache_dir():
+    return getattr(settings, 'SPONSOR_LOGO_CACHE_DIR', '') or os.path.join(tempfile.gettempdir(), 'tapnex_sponsor_logos')
+
+
+def _logo_digest(url):
+    return hashlib.sha256(url.encode()).hexdigest()[:16]
+
+
+def _logo_path(sponsor_id, digest):
+    return os.path.join(get_logo_cache_dir(), f"{sponsor_id}-{digest}.png")
+
+
+def _remember_logo(sponsor_id, digest, logo):
+    with _logo_lock:
+        # Forget older versions of this sponsor's logo
+        for key in [key for key in _logo_memory if key[0] == sponsor_id and key[1] != digest]:
+            del _logo_memory[key]
+        _logo_memory[(sponsor_id, digest)] = logo
+
+
+def get_cached_sponsor_logo(sponsor):
+    """
+    The sponsor's logo decoded and resized to 60x60 RGBA, or None if it has not been downloaded yet.
+    Never touches the network: a missing logo is queued for a background download instead.
+    """
+    url = sponsor.get_logo_url()
+    if not url:
+        return None
+
+    digest = _logo_digest(url)
+    logo = _logo_memory.get((sponsor.id, digest))
+    if logo is not None:
+        return logo
+
+    path = _logo_path(sponsor.id, digest)
+    if os.path.exists(path):
+        try:
+            with Image.open(path) as stored:
+                logo = stored.convert('RGBA')
+            _remember_logo(sponsor.id, digest, logo)
+            return logo
+        except OSError as e:
+            logger.warning(f"Discarding unreadable cached logo {path}: {e}")
+
+    refresh_sponsor_logo_async(sponsor.id, url)
+    return None
+
+
+def fetch_sponsor_logo(sponsor_id, url):
+    """Download, decode and resize a sponsor logo, then store it on disk and in memory"""
+    import requests
+
+    digest = _logo_digest(url)
+    try:
+        resp = requests.get(url, timeout=10)
+        resp.raise_for_status()
+        logo = Image.open(BytesIO(resp.content)).convert('RGBA').resize(SPONSOR_LOGO_SIZE)
+    except Exception as e:
+        logger.warning(f"Could not download logo for sponsor {sponsor_id}: {e}")
+        _failed_downloads[(sponsor_id, digest)] = time.monotonic()
+        return None
+
+    cache_dir = get_logo_cache_dir()
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            logo.save(f, format='PNG')
+        os.replace(tmp_path, _logo_path(sponsor_id, digest))
+        # Remove files left over from the sponsor's previous logo
+        for name in os.listdir(cache_dir):
+            if name.startswith(f"{sponsor_id}-") and name != f"{sponsor_id}-{digest}.png":
+                os.remove(os.path.join(cache_dir, name))
+    except OSError as e:
+        logger.warning(f"Could not store logo for sponsor {sponsor_id} on disk: {e}")
+
+    _remember_logo(sponsor_id, digest, logo)
+    _failed_downloads.pop((sponsor_id, digest), None)
+    logger.info(f"Cached logo for sponsor {sponsor_id}")
+    return logo
+
+
+def refresh_sponsor_logo_async(sponsor_id, url, force=False):
+    """
+    Download a sponsor logo in a background thread (one download per logo at a time).
+    Logos that failed recently are skipped unless force is set.
+    """
+    key = (sponsor_id, _logo_digest(url))
+    with _logo_lock:
+        if key in _pending_downloads:
+            return
+        failed_at = _failed_downloads.get(key)
+        if failed_at and not force and time.monotonic() - failed_at < LOGO_RETRY_SECONDS:
+            return
+        _pending_downloads.add(key)
+
+    def download():
+        try:
+            fetch_sponsor_logo(sponsor_id, url)
+        finally:
+            with _logo_lock:
+                _pending_downloads.discard(key)
+
+    threading.Thread(target=download, name=f"sponsor-logo-{sponsor_id}", daemon=True).start()
+
+
+def get_sponsor_logos(event, limit=3):
+    """Logos already in the cache for the event's first sponsors, as a list of (sponsor, logo)"""
+    sponsors = [sponsor for sponsor in event.sponsors.all() if sponsor.get_logo_url()][:limit]
+    logos = []
+    for sponsor in sponsors:
+        logo = get_cached_sponsor_logo(sponsor)
+        if logo is not None:
+            logos.append((sponsor, logo))
+    return logos
+
+
+def get_sponsor_logos_fingerprint(event, limit=3):
+    """
+    Identifies which sponsor logos a pass rendered right now would contain.
+    Part of the pass render cache key, so passes drawn before a logo finished
+    downloading are re-rendered once it is available.
+    """
+    return ','.join(
+        f"{sponsor.id}-{_logo_digest(sponsor.get_logo_url())}" for sponsor, _ in get_sponsor_logos(event, limit)
+    )
@@ -0,0 +1,186 @@
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, HttpResponseNotModified
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the QR or pass image design changes so old renders are never served
+PASS_RENDER_VERSION = 1
+
+
+class FileSystemRenderCache:
+    """
+    Rendered images on local disk, one directory per ticket.
+    Reads touch the file's mtime; once the store holds more than max_entries files
+    the least recently used ones are deleted.
+    """
+    # Trimming walks the whole store, so it only runs every this many writes
+    EVICT_EVERY = 50
+
+    def __init__(self, location, max_entries=5000):
+        self.location = location
+        self.max_entries = max_entries
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def _path(self, ticket_id, digest):
+        return os.path.join(self.location, str(ticket_id), f"{digest}.png")
+
+    def get(self, ticket_id, digest):
+        path = self._path(ticket_id, digest)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+            return data
+        except OSError:
+            return None
+
+    def set(self, ticket_id, digest, data):
+        path = self._path(ticket_id, digest)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename so a concurrent reader never sees a half-written file
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write render cache entry {path}: {e}")
+            return
+
+        with self._lock:
+            self._writes += 1
+            evict = self._writes % self.EVICT_EVERY == 0
+        if evict:
+            self.evict()
+
+    def invalidate(self, ticket_id):
+        shutil.rmtree(os.path.join(self.location, str(ticket_id)), ignore_errors=True)
+
+    def evict(self):
+        """Delete the least recently used files beyond max_entries"""
+        entries = []
+        try:
+            for ticket_dir in os.scandir(self.location):
+                if not ticket_dir.is_dir():
+                    continue
+                for entry in os.scandir(ticket_dir.path):
+                    if entry.name.endswith('.png'):
+                        entries.append((entry.stat().st_mtime, entry.path))
+        except OSError:
+            return
+
+        excess = len(entries) - self.max_entries
+        if excess <= 0:
+            return
+        entries.sort()
+        for _, path in entries[:excess]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        logger.info(f"Evicted {excess} entries from the render cache")
+
+
+class DjangoCacheRenderCache:
+    """
+    Rendered images in a Django cache (Redis, Memcached, LocMem...).
+    Eviction is left to the cache itself, which culls least recently used keys when full.
+    """
+    def __init__(self, alias='default', timeout=None):
+        self.alias = alias
+        self.timeout = timeout
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _index_key(self, ticket_id):
+        return f"render:ticket:{ticket_id}"
+
+    def get(self, ticket_id, digest):
+        return self.cache.get(f"render:{digest}")
+
+    def set(self, ticket_id, digest, data):
+        self.cache.set(f"render:{digest}", data, self.timeout)
+        # Remember the ticket's keys so they can be dropped when its token changes
+        index_key = self._index_key(ticket_id)
+        digests = set(self.cache.get(index_key) or [])
+        digests.add(digest)
+        self.cache.set(index_key, list(digests), self.timeout)
+
+    def invalidate(self, ticket_id):
+        index_key = self._index_key(ticket_id)
+        digests = self.cache.get(index_key) or []
+        self.cache.delete_many([f"render:{digest}" for digest in digests] + [index_key])
+
+
+_render_cache = None
+
+
+def get_render_cache():
+    """The configured render cache backend (settings.PASS_RENDER_CACHE), created once per process"""
+    global _render_cache
+    if _render_cache is None:
+        config = getattr(settings, 'PASS_RENDER_CACHE', {})
+        if config.get('BACKEND', 'filesystem') == 'django':
+            _render_cache = DjangoCacheRenderCache(
+                alias=config.get('CACHE_ALIAS', 'default'),
+                timeout=config.get('TIMEOUT'),
+            )
+        else:
+            _render_cache = FileSystemRenderCache(
+                location=config.get('LOCATION') or os.path.join(tempfile.gettempdir(), 'tapnex_render_cache'),
+                max_entries=config.get('MAX_ENTRIES', 5000),
+            )
+    return _render_cache
+
+
+def get_render_digest(ticket, kind, *extra):
+    """Cache key for one rendering of a ticket: (kind, ticket id, secure token, render version, extra)"""
+    parts = [kind, ticket.id, ticket.unique_secure_token, PASS_RENDER_VERSION, *extra]
+    return hashlib.sha256(':'.join(str(part) for part in parts).encode()).hexdigest()[:32]
+
+
+def get_or_render(ticket, kind, render, *extra):
+    """
+    Return (png_bytes, etag) for a ticket rendering, calling render() only on a cache miss.
+    The secure token is part of the key, so a regenerated token never serves an old QR code.
+    """
+    digest = get_render_digest(ticket, kind, *extra)
+    backend = get_render_cache()
+
+    data = backend.get(ticket.id, digest)
+    if data is None:
+        data = render()
+        backend.set(ticket.id, digest, data)
+    return data, f'"{digest}"'
+
+
+def invalidate_ticket_renders(ticket_id):
+    """Drop every cached rendering of a ticket (called when its secure token changes)"""
+    get_render_cache().invalidate(ticket_id)
+
+
+def serve_cached_png(request, ticket, kind, render, *extra, max_age=86400):
+    """
+    Serve a ticket rendering with ETag/Cache-Control headers.
+    A client that already holds the current version gets a 304 without the cache being read.
+    """
+    etag = f'"{get_render_digest(ticket, kind, *extra)}"'
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+    else:
+        data, etag = get_or_render(ticket, kind, render, *extra)
+        response = HttpResponse(data, content_type='image/png')
+    response['ETag'] = etag
+    # Passes are personal, so only the attendee's browser may keep a copy
+    response['Cache-Control'] = f'private, max-age={max_age}'
+    return response
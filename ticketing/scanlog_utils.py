@@ -0,0 +1,110 @@
+import functools
+import json
+import logging
+import time
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+from .models import ScanEvent, Ticket
+from .occupancy_utils import record_rejected_scans
+
+logger = logging.getLogger(__name__)
+
+
+def get_scan_device(request, payload=None):
+    """Scanner identifier sent in the payload ("device") or the X-Scanner-Device header"""
+    device = (payload or {}).get('device') or request.headers.get('X-Scanner-Device') or ''
+    return str(device)[:100]
+
+
+def scan_event(volunteer, ticket_id, outcome, error_code='', device='', latency_ms=0, source='SINGLE',
+               event_id=None, scanned_at=None):
+    """An unsaved ScanEvent for one scan attempt, to be passed to write_scan_log"""
+    try:
+        ticket_id = int(ticket_id) if ticket_id else None
+    except (TypeError, ValueError):
+        ticket_id = None
+
+    return ScanEvent(
+        event_id=event_id,
+        ticket_id=ticket_id,
+        volunteer_id=volunteer.id if volunteer else None,
+        outcome=outcome,
+        error_code=error_code or '',
+        source=source,
+        device=device,
+        latency_ms=max(0, int(latency_ms)),
+        scanned_at=scanned_at or timezone.now(),
+    )
+
+
+def write_scan_log(entries):
+    """
+    Insert scan attempts with one bulk_create and roll rejected attempts up into the
+    per-minute CheckInCounter rows. Returns the number of attempts written.
+
+    The write happens before the response goes out: on the serverless runtime the
+    instance can be frozen as soon as a response is sent, so nothing is left for a
+    background thread or an exit hook. Batch endpoints pass all their attempts at once.
+    """
+    if not entries:
+        return 0
+
+    try:
+        # A savepoint, so a failed write cannot break a surrounding transaction
+        with transaction.atomic():
+            unresolved = {entry.ticket_id for entry in entries if entry.ticket_id and not entry.event_id}
+            if unresolved:
+                events = dict(Ticket.objects.filter(id__in=unresolved).values_list('id', 'event_id'))
+                for entry in entries:
+                    if entry.ticket_id and not entry.event_id:
+                        entry.event_id = events.get(entry.ticket_id)
+
+            ScanEvent.objects.bulk_create(entries, batch_size=500)
+            record_rejected_scans(
+                (entry.event_id, entry.volunteer_id, entry.scanned_at)
+                for entry in entries if entry.outcome == 'REJECTED'
+            )
+    except DatabaseError as e:
+        # The log is analytics only: losing a batch must never affect scanning
+        logger.error(f"Could not write {len(entries)} scan log entries: {e}")
+        return 0
+    return len(entries)
+
+
+def log_scan(volunteer, ticket_id, outcome, **kwargs):
+    """Write one scan attempt to the ScanEvent log; kwargs as for scan_event"""
+    return write_scan_log([scan_event(volunteer, ticket_id, outcome, **kwargs)])
+
+
+def log_scan_attempt(view):
+    """
+    Decorator for single-scan JSON views: records each request as a ScanEvent using
+    the response's success flag and error_code and the time the view took.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        started = time.monotonic()
+        response = view(request, *args, **kwargs)
+        latency_ms = (time.monotonic() - started) * 1000
+
+        try:
+            payload = json.loads(request.body)
+            if not isinstance(payload, dict):
+                payload = {}
+        except ValueError:
+            payload = {}
+        try:
+            result = json.loads(response.content)
+        except ValueError:
+            result = {}
+
+        log_scan(
+            request.user,
+            payload.get('tid') or payload.get('ticket_id'),
+            'ADMITTED' if result.get('success') else 'REJECTED',
+            error_code=result.get('error_code', '' if result.get('success') else 'ERROR'),
+            device=get_scan_device(request, payload),
+            latency_ms=latency_ms,
+        )
+        return response
+    return wrapper
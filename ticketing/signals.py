@@ -0,0 +1,49 @@
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+from .models import Event, Ticket, TicketType, EventSponsor, PromoCode
+from .catalogue_utils import invalidate_event_catalogue
+from .render_cache_utils import invalidate_ticket_renders
+from .render_assets_utils import refresh_sponsor_logo_async
+from .promo_utils import invalidate_promo_index
+
+
+@receiver(post_init, sender=Ticket)
+def remember_ticket_token(sender, instance, **kwargs):
+    instance._loaded_secure_token = instance.unique_secure_token
+
+
+@receiver(post_save, sender=Ticket)
+def invalidate_renders_on_token_change(sender, instance, created, **kwargs):
+    """Cached QR codes and passes embed the secure token, drop them once it is regenerated"""
+    if not created and instance.unique_secure_token != instance._loaded_secure_token:
+        invalidate_ticket_renders(instance.id)
+    instance._loaded_secure_token = instance.unique_secure_token
+
+
+@receiver(post_init, sender=EventSponsor)
+def remember_sponsor_logo(sender, instance, **kwargs):
+    instance._loaded_logo_url = instance.logo_url
+
+
+@receiver(post_save, sender=EventSponsor)
+def refresh_logo_on_change(sender, instance, created, **kwargs):
+    """Download a new or changed sponsor logo now, so pass rendering never has to"""
+    if created or instance.logo_url != instance._loaded_logo_url:
+        url = instance.get_logo_url()
+        if url:
+            refresh_sponsor_logo_async(instance.id, url, force=True)
+    instance._loaded_logo_url = instance.logo_url
+
+
+@receiver([post_save, post_delete], sender=Event)
+@receiver([post_save, post_delete], sender=TicketType)
+@receiver([post_save, post_delete], sender=EventSponsor)
+def invalidate_catalogue_on_change(sender, **kwargs):
+    """Events, their prices and sponsors feed the cached home page / event list catalogue"""
+    invalidate_event_catalogue()
+
+
+@receiver([post_save, post_delete], sender=PromoCode)
+def invalidate_promo_index_on_change(sender, instance, **kwargs):
+    """validate_promo_code answers from the cached per-event promo code index"""
+    invalidate_promo_index(instance.event_id)
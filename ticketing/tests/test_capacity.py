@@ -0,0 +1,56 @@
+"""Capacity ledger tests"""
+from datetime import timedelta
+from decimal import Decimal
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from ticketing.capacity_utils import add_sold_attendees
+from ticketing.models import Event, TicketType, Ticket, User
+
+
+class CapacityLedgerTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(email='admin@example.com', role='ADMIN', is_staff=True, is_superuser=True)
+        self.customer = User.objects.create_user(email='customer@example.com', role='CUSTOMER')
+        now = timezone.now()
+        self.event = Event.objects.create(
+            title='Ledger test', description='Capacity', event_type='Concert',
+            date=now.date() + timedelta(days=1), time=now.time(), venue='Hall',
+            capacity=100, organizer=self.admin, status='PUBLISHED',
+        )
+        self.ticket_type = TicketType.objects.create(
+            event=self.event, type_name='General', price=Decimal('100.00'), attendees_per_ticket=2,
+        )
+
+    def test_stale_saves_keep_the_ledger(self):
+        event = Event.objects.get(pk=self.event.pk)
+        ticket_type = TicketType.objects.get(pk=self.ticket_type.pk)
+        # A sale lands while the edit forms are open
+        add_sold_attendees(self.event.id, self.ticket_type.id, 2)
+
+        event.venue = 'Arena'
+        event.save()
+        ticket_type.price = Decimal('120.00')
+        ticket_type.save()
+
+        event.refresh_from_db()
+        ticket_type.refresh_from_db()
+        self.assertEqual((event.venue, event.attendees_sold), ('Arena', 2))
+        self.assertEqual((ticket_type.price, ticket_type.attendees_sold), (Decimal('120.00'), 2))
+
+    def test_admin_ticket_delete_releases_capacity(self):
+        ticket = Ticket.objects.create(
+            event=self.event, ticket_type=self.ticket_type, customer=self.customer,
+            ticket_number='LEDGER01', status='SOLD', total_admission_count=2,
+        )
+        add_sold_attendees(self.event.id, self.ticket_type.id, 2)
+        self.client.force_login(self.admin)
+
+        self.client.post(reverse('admin:ticketing_ticket_changelist'), {
+            'action': 'delete_selected', '_selected_action': [ticket.pk], 'post': 'yes',
+        })
+
+        self.assertFalse(Ticket.objects.filter(pk=ticket.pk).exists())
+        self.event.refresh_from_db()
+        self.ticket_type.refresh_from_db()
+        self.assertEqual((self.event.attendees_sold, self.ticket_type.attendees_sold), (0, 0))
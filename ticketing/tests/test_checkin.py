@@ -0,0 +1,224 @@
+"""Concurrency and offline sync tests for ticket check-in"""
+import json
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from django.db import IntegrityError, connection, transaction
+from django.test import Client, TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.urls import reverse
+from django.utils import timezone
+from ticketing.checkin_utils import apply_offline_checkins, manifest_digest
+from ticketing.models import Event, TicketType, Ticket, User, CheckInCounter, ScanEvent
+
+SCANNERS = 8
+
+
+class ConcurrentCheckInTests(TransactionTestCase):
+    def setUp(self):
+        organizer = User.objects.create_user(email='organizer@example.com', role='ORGANIZER')
+        customer = User.objects.create_user(email='customer@example.com', role='CUSTOMER')
+        self.volunteers = [
+            User.objects.create_user(email=f'volunteer{i}@example.com', role='VOLUNTEER')
+            for i in range(SCANNERS)
+        ]
+        now = timezone.now()
+        event = Event.objects.create(
+            title='Gate test', description='Concurrent scans', event_type='Concert',
+            date=now.date() + timedelta(days=1), time=now.time(), venue='Hall',
+            capacity=100, organizer=organizer, status='PUBLISHED',
+        )
+        ticket_type = TicketType.objects.create(event=event, type_name='General', price=Decimal('100.00'))
+        self.ticket = Ticket.objects.create(
+            event=event, ticket_type=ticket_type, customer=customer, ticket_number='GATE0001',
+            status='SOLD', purchase_date=now, unique_secure_token='gate-token',
+        )
+
+    def scan_in_parallel(self, url, make_body):
+        """POST one scan of the ticket per volunteer, all released at the same instant"""
+        clients = []
+        for volunteer in self.volunteers:
+            client = Client()
+            client.force_login(volunteer)
+            clients.append(client)
+        barrier = threading.Barrier(SCANNERS)
+        responses = [None] * SCANNERS
+
+        def scan(index):
+            try:
+                barrier.wait(timeout=30)
+                responses[index] = clients[index].post(url, json.dumps(make_body()), content_type='application/json')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=scan, args=(i,)) for i in range(SCANNERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return responses
+
+    # SQLite's shared in-memory test database fails concurrent writers with "table is locked"
+    # instead of making them wait, so the parallel tests only run on PostgreSQL
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_parallel_scans_admit_exactly_once(self):
+        responses = self.scan_in_parallel(
+            reverse('api_validate_ticket'),
+            lambda: {'tid': self.ticket.id, 'tok': 'gate-token'},
+        )
+        results = [response.json() for response in responses]
+
+        self.assertEqual([response.status_code for response in responses], [200] * SCANNERS)
+        self.assertEqual(sum(1 for result in results if result['success']), 1)
+        self.assertEqual(sum(1 for result in results if result.get('error_code') == 'ALREADY_USED'), SCANNERS - 1)
+
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.ticket.status, 'USED')
+        winner = self.volunteers[next(i for i, result in enumerate(results) if result['success'])]
+        self.assertEqual(self.ticket.validated_by, winner)
+
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_parallel_batches_admit_exactly_once(self):
+        responses = self.scan_in_parallel(
+            reverse('api_validate_tickets_batch'),
+            lambda: {'scans': [{'tid': self.ticket.id, 'tok': 'gate-token'}]},
+        )
+        results = [response.json()['results'][0] for response in responses]
+        self.assertEqual(sum(1 for result in results if result['success']), 1)
+
+    def test_sequential_scans(self):
+        client = Client()
+        client.force_login(self.volunteers[0])
+        url = reverse('api_validate_ticket')
+
+        wrong = client.post(url, json.dumps({'tid': self.ticket.id, 'tok': 'forged'}), content_type='application/json')
+        self.assertEqual(wrong.status_code, 403)
+
+        first = client.post(url, json.dumps({'tid': self.ticket.id, 'tok': 'gate-token'}), content_type='application/json')
+        self.assertTrue(first.json()['success'])
+
+        second = client.post(url, json.dumps({'tid': self.ticket.id, 'tok': 'gate-token'}), content_type='application/json')
+        self.assertEqual(second.json()['error_code'], 'ALREADY_USED')
+        self.assertEqual(second.json()['validated_by'], 'volunteer0@example.com')
+
+        # Every attempt is in the scan log by the time its response is returned
+        self.assertEqual(
+            list(ScanEvent.objects.order_by('id').values_list('outcome', 'error_code')),
+            [('REJECTED', 'INVALID_TOKEN'), ('ADMITTED', ''), ('REJECTED', 'ALREADY_USED')],
+        )
+        self.assertEqual(CheckInCounter.objects.get(volunteer=self.volunteers[0]).rejected, 2)
+
+    def test_malformed_batches_are_rejected(self):
+        client = Client()
+        client.force_login(self.volunteers[0])
+        for body in ([], 'x', {'scans': 'x'}):
+            response = client.post(reverse('api_validate_tickets_batch'), json.dumps(body), content_type='application/json')
+            self.assertEqual(response.status_code, 400, body)
+
+
+class OfflineCheckInTests(TestCase):
+    def setUp(self):
+        organizer = User.objects.create_user(email='organizer@example.com', role='ORGANIZER')
+        customer = User.objects.create_user(email='customer@example.com', role='CUSTOMER')
+        self.online, self.offline = [
+            User.objects.create_user(email=f'volunteer{i}@example.com', role='VOLUNTEER') for i in range(2)
+        ]
+        now = timezone.now()
+        self.event = Event.objects.create(
+            title='Offline test', description='Offline scans', event_type='Concert',
+            date=now.date() + timedelta(days=1), time=now.time(), venue='Hall',
+            capacity=100, organizer=organizer, status='PUBLISHED',
+        )
+        ticket_type = TicketType.objects.create(event=self.event, type_name='Couple', price=Decimal('100.00'), attendees_per_ticket=2)
+        self.ticket = Ticket.objects.create(
+            event=self.event, ticket_type=ticket_type, customer=customer, ticket_number='OFFL0001',
+            status='SOLD', purchase_date=now, unique_secure_token='offline-token', total_admission_count=2,
+        )
+
+    def counters(self):
+        rows = CheckInCounter.objects.filter(event=self.event).values_list('volunteer_id', 'scans', 'admissions')
+        return {volunteer_id: (scans, admissions) for volunteer_id, scans, admissions in rows if scans}
+
+    def test_earlier_offline_scan_takes_over_the_check_in_counter(self):
+        self.client.force_login(self.online)
+        response = self.client.post(
+            reverse('api_validate_ticket'), json.dumps({'tid': self.ticket.id, 'tok': 'offline-token'}),
+            content_type='application/json',
+        )
+        self.assertTrue(response.json()['success'])
+        self.assertEqual(self.counters(), {self.online.id: (1, 2)})
+
+        scanned_at = timezone.now() - timedelta(minutes=10)
+        results = apply_offline_checkins(self.event, [
+            {'tid': self.ticket.id, 'tok': 'offline-token', 'scanned_at': int(scanned_at.timestamp() * 1000)},
+        ], self.offline)
+
+        self.assertEqual(results[0]['result'], 'ADMITTED')
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.ticket.validated_by, self.offline)
+        self.assertEqual(self.ticket.used_at.replace(microsecond=0), scanned_at.replace(microsecond=0))
+        self.assertEqual(self.counters(), {self.offline.id: (1, 2)})
+        minute = CheckInCounter.objects.get(event=self.event, volunteer=self.offline).minute
+        self.assertEqual(minute, self.ticket.used_at.replace(second=0, microsecond=0))
+
+    def test_backdated_offline_scan_cannot_take_over_a_check_in(self):
+        checked_in_at = timezone.now() - timedelta(minutes=5)
+        Ticket.objects.filter(pk=self.ticket.pk).update(status='USED', used_at=checked_in_at, validated_by=self.online)
+        manifest_generated_at = timezone.now() - timedelta(minutes=1)
+
+        results = apply_offline_checkins(self.event, [
+            {'tid': self.ticket.id, 'tok': 'offline-token', 'scanned_at': 1000},
+        ], self.offline, not_before=manifest_generated_at)
+
+        self.assertEqual(results[0]['result'], 'DUPLICATE')
+        self.ticket.refresh_from_db()
+        self.assertEqual((self.ticket.used_at, self.ticket.validated_by), (checked_in_at, self.online))
+
+    def test_counter_buckets_without_a_volunteer_are_unique(self):
+        minute = timezone.now().replace(second=0, microsecond=0)
+        CheckInCounter.objects.create(event=self.event, volunteer=None, minute=minute, rejected=1)
+        for event in (self.event, None):
+            if event is None:
+                CheckInCounter.objects.create(event=None, volunteer=None, minute=minute, rejected=1)
+            with self.assertRaises(IntegrityError), transaction.atomic():
+                CheckInCounter.objects.create(event=event, volunteer=None, minute=minute, rejected=1)
+
+        # Deleting a volunteer leaves their buckets alone instead of merging them into the NULL one
+        CheckInCounter.objects.create(event=self.event, volunteer=self.online, minute=minute, scans=1, admissions=2)
+        self.online.delete()
+        self.assertEqual(CheckInCounter.objects.filter(event=self.event, minute=minute).count(), 2)
+
+    def test_malformed_sync_uploads_are_rejected(self):
+        self.client.force_login(self.offline)
+        scans = [{'tid': self.ticket.id, 'tok': 'offline-token', 'scanned_at': 0}]
+        for body in ([], 'x', {'event_id': 'abc', 'scans': scans}, {'event_id': [1], 'scans': scans}):
+            response = self.client.post(reverse('api_bulk_checkin'), json.dumps(body), content_type='application/json')
+            self.assertEqual(response.status_code, 400, body)
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.ticket.status, 'SOLD')
+
+    def test_manifest_stamp_is_checked_by_the_server(self):
+        self.client.force_login(self.offline)
+        data = self.client.get(reverse('api_checkin_manifest', args=[self.event.id])).json()
+        stamp = {
+            'generated_at': data['manifest']['generated_at'],
+            'digest': manifest_digest(data['manifest']['tickets']),
+            'signature': data['signature'],
+        }
+        verify_url = reverse('api_verify_checkin_manifest', args=[self.event.id])
+        self.assertTrue(self.client.post(verify_url, json.dumps(stamp), content_type='application/json').json()['valid'])
+        tampered = {**stamp, 'digest': manifest_digest(data['manifest']['tickets'] + [[999, 'x', 1, 'SOLD']])}
+        self.assertFalse(self.client.post(verify_url, json.dumps(tampered), content_type='application/json').json()['valid'])
+
+        scans = [{'tid': self.ticket.id, 'tok': 'offline-token', 'scanned_at': int(timezone.now().timestamp() * 1000)}]
+        for manifest in (None, tampered):
+            response = self.client.post(reverse('api_bulk_checkin'), json.dumps({
+                'event_id': self.event.id, 'manifest': manifest, 'scans': scans,
+            }), content_type='application/json')
+            self.assertEqual(response.json()['error_code'], 'INVALID_MANIFEST')
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.ticket.status, 'SOLD')
+
+        response = self.client.post(reverse('api_bulk_checkin'), json.dumps({
+            'event_id': self.event.id, 'manifest': stamp, 'scans': scans,
+        }), content_type='application/json')
+        self.assertEqual(response.json()['results'][0]['result'], 'ADMITTED')
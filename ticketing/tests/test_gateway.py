@@ -0,0 +1,112 @@
+"""Cashfree gateway client tests against a local stub server"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+import requests
+from django.test import SimpleTestCase
+from ticketing.gateway_utils import CashfreeGateway, CircuitBreaker, GatewayError, GatewayUnavailable
+
+
+class StubCashfreeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.command, self.path, self.client_address[1]))
+        status, body = server.responses.pop(0) if server.responses else (200, {'order_status': 'PAID'})
+        self.reply(status, body)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.server.bodies.append((json.loads(self.rfile.read(length)), self.headers.get('x-idempotency-key')))
+        self.do_GET()
+
+    def reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class CashfreeGatewayTests(SimpleTestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubCashfreeHandler)
+        self.server.requests = []
+        self.server.bodies = []
+        self.server.responses = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.gateway = CashfreeGateway(
+            base_url=f"http://127.0.0.1:{self.server.server_port}/pg",
+            client_id='id', client_secret='secret', backoff_seconds=0.01,
+            breaker=CircuitBreaker(failure_threshold=2, reset_seconds=60),
+        )
+
+    def tearDown(self):
+        self.gateway.session.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connections_are_kept_alive(self):
+        for _ in range(3):
+            self.assertEqual(self.gateway.get_order('order_1')['order_status'], 'PAID')
+        client_ports = {port for _, _, port in self.server.requests}
+        self.assertEqual(len(client_ports), 1)
+
+    def test_server_errors_are_retried(self):
+        self.server.responses = [(503, {}), (502, {})]
+        self.assertEqual(self.gateway.get_order('order_1')['order_status'], 'PAID')
+        self.assertEqual(len(self.server.requests), 3)
+        metrics = self.gateway.get_metrics()['endpoints']['get_order']
+        self.assertEqual((metrics['calls'], metrics['retries'], metrics['errors']), (1, 2, 0))
+
+    def test_create_order_sends_idempotency_key(self):
+        self.server.responses = [(500, {}), (200, {'payment_session_id': 'session'})]
+        response = self.gateway.create_order({'order_id': 'order_9', 'order_amount': 10})
+        self.assertEqual(response['payment_session_id'], 'session')
+        self.assertEqual([key for _, key in self.server.bodies], ['order_9', 'order_9'])
+
+    def test_client_errors_are_not_retried(self):
+        self.server.responses = [(404, {'message': 'order not found'})]
+        with self.assertRaises(GatewayError) as raised:
+            self.gateway.get_order('order_missing')
+        self.assertNotIsInstance(raised.exception, GatewayUnavailable)
+        self.assertEqual(raised.exception.status_code, 404)
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(self.gateway.breaker.state, 'closed')
+
+    def test_circuit_opens_after_repeated_failures(self):
+        self.server.responses = [(503, {})] * 6
+        for _ in range(2):
+            with self.assertRaises(GatewayUnavailable):
+                self.gateway.get_order('order_1')
+        self.assertEqual(self.gateway.breaker.state, 'open')
+
+        calls = len(self.server.requests)
+        with self.assertRaises(GatewayUnavailable):
+            self.gateway.get_order('order_1')
+        # Failed fast without touching the gateway
+        self.assertEqual(len(self.server.requests), calls)
+
+    def test_failed_half_open_trial_reopens_the_circuit(self):
+        breaker = self.gateway.breaker
+        breaker.failures = breaker.failure_threshold
+        breaker.opened_at = time.monotonic() - breaker.reset_seconds
+        self.assertEqual(breaker.state, 'half-open')
+
+        broken = requests.exceptions.ChunkedEncodingError('connection broken mid-body')
+        with mock.patch.object(self.gateway.session, 'request', side_effect=broken):
+            with self.assertRaises(GatewayUnavailable):
+                self.gateway.get_order('order_1')
+        self.assertEqual(breaker.state, 'open')
+
+        # The next trial after the reset window goes through and closes the circuit
+        breaker.opened_at = time.monotonic() - breaker.reset_seconds
+        self.assertEqual(self.gateway.get_order('order_1')['order_status'], 'PAID')
+        self.assertEqual(breaker.state, 'closed')
@@ -0,0 +1,107 @@
+"""Stored invoice PDF and bulk export tests"""
+import io
+import os
+import shutil
+import tempfile
+import zipfile
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from ticketing import invoice_export_utils, invoice_utils
+from ticketing.models import Event, TicketType, Ticket, User, PaymentTransaction, Invoice
+
+
+class InvoiceTestCase(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(email='admin@example.com', role='ADMIN')
+        customer = User.objects.create_user(email='customer@example.com', role='CUSTOMER')
+        now = timezone.now()
+        event = Event.objects.create(
+            title='Invoice test', description='Invoices', event_type='Concert',
+            date=now.date() + timedelta(days=1), time=now.time(), venue='Hall',
+            capacity=100, organizer=self.admin, status='PUBLISHED',
+        )
+        ticket_type = TicketType.objects.create(event=event, type_name='General', price=Decimal('100.00'))
+        payment = PaymentTransaction.objects.create(
+            user=customer, order_id='order_invoice_1', amount=Decimal('100.00'), status='SUCCESS', event=event,
+        )
+        ticket = Ticket.objects.create(
+            event=event, ticket_type=ticket_type, customer=customer, status='SOLD', purchase_transaction=payment,
+        )
+        self.invoice = Invoice.objects.create(
+            ticket=ticket, user=customer, event=event, ticket_type=ticket_type, transaction=payment,
+            base_price=Decimal('90.00'), commission=Decimal('10.00'), total_price=Decimal('100.00'),
+        )
+
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        patcher = mock.patch.object(invoice_utils, '_invoice_storage', FileSystemStorage(location=location))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.render = mock.patch.object(invoice_utils, 'generate_invoice_pdf', wraps=invoice_utils.generate_invoice_pdf)
+
+
+class InvoicePdfTests(InvoiceTestCase):
+    def test_pdf_is_rendered_once(self):
+        with self.render as render:
+            path = invoice_utils.get_invoice_pdf_path(self.invoice)
+            invoice = Invoice.objects.get(pk=self.invoice.pk)
+            self.assertEqual(invoice_utils.get_invoice_pdf_path(invoice), path)
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual((invoice.pdf_path, invoice.pdf_version), (path, invoice_utils.INVOICE_TEMPLATE_VERSION))
+
+    def test_template_version_bump_renders_again(self):
+        path = invoice_utils.get_invoice_pdf_path(self.invoice)
+        with self.render as render, mock.patch.object(invoice_utils, 'INVOICE_TEMPLATE_VERSION', 99):
+            # Rendering is deterministic, so unchanged content lands on the same artifact
+            self.assertEqual(invoice_utils.get_invoice_pdf_path(self.invoice), path)
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(Invoice.objects.get(pk=self.invoice.pk).pdf_version, 99)
+
+    def test_download_streams_the_stored_file(self):
+        invoice_utils.get_invoice_pdf_path(self.invoice)
+        self.client.force_login(self.admin)
+        with self.render as render:
+            response = self.client.get(reverse('admin_download_invoice_pdf', args=[self.invoice.id]))
+        self.assertEqual(render.call_count, 0)
+        self.assertTrue(response.streaming)
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+        self.assertIn(f'Invoice-{self.invoice.invoice_number}.pdf', response['Content-Disposition'])
+
+
+class InvoiceExportTests(InvoiceTestCase):
+    def test_render_missing_renders_only_stale_invoices(self):
+        invoices, _, _ = invoice_export_utils.filter_invoices({})
+        progress = mock.Mock()
+        self.assertEqual(invoice_export_utils.render_missing_invoice_pdfs(invoices, workers=1, progress=progress), (1, []))
+        progress.assert_called_once_with(1)
+        with self.render as render:
+            self.assertEqual(invoice_export_utils.render_missing_invoice_pdfs(invoices, workers=1), (0, []))
+        self.assertEqual(render.call_count, 0)
+
+    def test_zip_download_uses_dashboard_filters(self):
+        invoice_utils.get_invoice_pdf_path(self.invoice)
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('export_invoices_zip'), {'event': self.invoice.event_id})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        name = f'Invoice-{self.invoice.invoice_number}.pdf'
+        self.assertEqual(archive.namelist(), [name])
+        self.assertTrue(archive.read(name).startswith(b'%PDF'))
+
+        response = self.client.get(reverse('export_invoices_zip'), {'event': self.invoice.event_id + 1})
+        self.assertEqual(zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content))).namelist(), [])
+
+    def test_command_renders_and_writes_zip(self):
+        output = os.path.join(tempfile.mkdtemp(), 'invoices.zip')
+        self.addCleanup(shutil.rmtree, os.path.dirname(output), ignore_errors=True)
+        call_command('export_invoice_pdfs', workers=1, output=output, event_ids=[self.invoice.event_id], stdout=io.StringIO())
+        self.assertTrue(Invoice.objects.get(pk=self.invoice.pk).pdf_path)
+        with zipfile.ZipFile(output) as archive:
+            self.assertEqual(archive.namelist(), [f'Invoice-{self.invoice.invoice_number}.pdf'])
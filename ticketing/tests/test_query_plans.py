@@ -0,0 +1,244 @@
+"""
+Query plan regression suite for the ticket hot paths.
+
+Each test requests a view against a seeded database, records every SELECT it runs
+and EXPLAINs them. A test fails when a query falls back to a full scan of one of
+the large tables, or when the view runs more queries than its budget.
+On PostgreSQL sequential scans are disabled for the EXPLAIN, so a Seq Scan in the
+plan means no index can serve the query rather than the planner preferring a scan
+of a small test table.
+"""
+import json
+import re
+from datetime import timedelta
+from decimal import Decimal
+from django.db import DatabaseError, connection, transaction
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from ticketing.capacity_utils import reconcile_capacity
+from ticketing.models import Event, TicketType, Ticket, PaymentTransaction, Invoice, User, PromoCode, PromoCodeUsage
+
+# Tables that grow with sales and must never be read end to end
+HOT_TABLES = {'ticketing_ticket', 'ticketing_invoice', 'ticketing_paymenttransaction'}
+
+POSTGRES_SCAN = re.compile(r'Seq Scan on (\w+)')
+# "SCAN ticketing_ticket" is a full scan, "SCAN ... USING INDEX" an ordered index walk
+SQLITE_SCAN = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+
+
+class QueryRecorder:
+    """execute_wrapper that keeps the SQL and parameters of every SELECT"""
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.lstrip().upper().startswith('SELECT'):
+            self.queries.append((sql, params))
+        return execute(sql, params, many, context)
+
+
+def explain(sql, params):
+    """Plan lines for a query on the current database"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute(f'EXPLAIN {sql}', params)
+            return [row[0] for row in cursor.fetchall()]
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+class ForcedRollback(Exception):
+    pass
+
+
+def explain_with_index(sql, params, table, index):
+    """
+    Plan lines for a query when the planner may only use index on table, or None when
+    the index cannot serve the query (e.g. its partial condition does not cover it).
+    SQLite is told INDEXED BY, with the parameters inlined as PostgreSQL sees them
+    (SQLite cannot match a partial index against bound parameters); on PostgreSQL
+    the table's other indexes are dropped in a savepoint that is rolled back afterwards.
+    """
+    if connection.vendor != 'postgresql':
+        quote = connection.schema_editor().quote_value
+        sql = sql.replace(f'FROM "{table}"', f'FROM "{table}" INDEXED BY "{index}"', 1) % tuple(quote(p) for p in params)
+        try:
+            return explain(sql, ())
+        except DatabaseError:
+            return None
+
+    plan = None
+    try:
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT indexname FROM pg_indexes WHERE tablename = %s AND indexname != %s AND indexdef NOT LIKE 'CREATE UNIQUE%%'",
+                    [table, index],
+                )
+                for (name,) in cursor.fetchall():
+                    cursor.execute(f'DROP INDEX "{name}"')
+            plan = explain(sql, params)
+            raise ForcedRollback
+    except ForcedRollback:
+        pass
+    if not any(index in line for line in plan):
+        return None
+    return plan
+
+
+def full_scans(plan):
+    """Hot tables read with a full scan in an EXPLAIN plan"""
+    pattern = POSTGRES_SCAN if connection.vendor == 'postgresql' else SQLITE_SCAN
+    scanned = set()
+    for line in plan:
+        match = pattern.search(line.strip())
+        if match and match.group(1) in HOT_TABLES:
+            scanned.add(match.group(1))
+    return scanned
+
+
+class HotPathQueryPlanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(email='admin@example.com', role='ADMIN')
+        cls.organizer = User.objects.create_user(email='organizer@example.com', role='ORGANIZER')
+        cls.customer = User.objects.create_user(email='customer@example.com', role='CUSTOMER')
+        cls.volunteers = [
+            User.objects.create_user(email=f'volunteer{i}@example.com', role='VOLUNTEER')
+            for i in range(3)
+        ]
+
+        now = timezone.now()
+        cls.events = []
+        for i in range(2):
+            event = Event.objects.create(
+                title=f'Event {i}', description='Seeded event', event_type='Concert',
+                date=now.date() + timedelta(days=7), time=now.time(), venue='Hall',
+                capacity=500, organizer=cls.organizer, status='PUBLISHED',
+            )
+            ticket_types = [
+                TicketType.objects.create(event=event, type_name='General', price=Decimal('100.00')),
+                TicketType.objects.create(event=event, type_name='VIP', price=Decimal('250.00'), attendees_per_ticket=2),
+            ]
+            cls.events.append(event)
+
+            payment = PaymentTransaction.objects.create(
+                user=cls.customer, order_id=f'order-{i}', amount=Decimal('1000.00'),
+                status='SUCCESS', event=event,
+            )
+            for n in range(40):
+                used = n % 4 == 0
+                ticket = Ticket.objects.create(
+                    event=event,
+                    ticket_type=ticket_types[n % 2],
+                    customer=cls.customer,
+                    ticket_number=f'T{i}{n:04d}',
+                    status='USED' if used else 'SOLD',
+                    purchase_date=now - timedelta(days=n % 10),
+                    unique_secure_token=f'token-{i}-{n}',
+                    used_at=now if used else None,
+                    validated_by=cls.volunteers[n % 3] if used else None,
+                    purchase_transaction=payment,
+                )
+                Invoice.objects.create(
+                    ticket=ticket, user=cls.customer, event=event, ticket_type=ticket.ticket_type,
+                    transaction=payment, base_price=Decimal('90.00'), commission=Decimal('10.00'),
+                    total_price=Decimal('100.00'), invoice_number=f'INV-{i}{n:04d}',
+                )
+
+            promo_codes = [
+                PromoCode.objects.create(
+                    code=f'SAVE{i}{n}', event=event, discount_type='FIXED', discount_value=Decimal('10.00'),
+                    valid_from=now - timedelta(days=1), valid_until=now + timedelta(days=30), max_uses=n * 10,
+                )
+                for n in range(3)
+            ]
+            for n, ticket in enumerate(event.tickets.all()[:12]):
+                PromoCodeUsage.objects.create(
+                    promo_code=promo_codes[n % 3], user=cls.customer, ticket=ticket,
+                    order_total=Decimal('100.00'), discount_amount=Decimal('10.00'),
+                )
+
+    def assertIndexedQueries(self, user, method, url, max_queries, **kwargs):
+        """Request url as user, then check the query budget and every recorded plan"""
+        self.client.force_login(user)
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = getattr(self.client, method)(url, **kwargs)
+        self.assertLess(response.status_code, 400, f'{url} returned {response.status_code}')
+
+        self.assertLessEqual(
+            len(recorder.queries), max_queries,
+            f'{url} ran {len(recorder.queries)} SELECTs, budget is {max_queries}',
+        )
+        for sql, params in recorder.queries:
+            plan = explain(sql, params)
+            scanned = full_scans(plan)
+            self.assertFalse(scanned, f'Full scan of {", ".join(sorted(scanned))} in:\n{sql}\n' + '\n'.join(plan))
+        return response
+
+    def test_organizer_dashboard(self):
+        self.assertIndexedQueries(self.organizer, 'get', reverse('dashboard'), max_queries=10)
+
+    def test_customer_dashboard(self):
+        self.assertIndexedQueries(self.customer, 'get', reverse('dashboard'), max_queries=8)
+
+    def test_my_tickets(self):
+        self.assertIndexedQueries(self.customer, 'get', reverse('my_tickets'), max_queries=8)
+
+    def test_api_validate_ticket(self):
+        ticket = Ticket.objects.filter(status='SOLD').first()
+        response = self.assertIndexedQueries(
+            self.volunteers[0], 'post', reverse('api_validate_ticket'), max_queries=10,
+            data=json.dumps({'tid': ticket.id, 'tok': ticket.unique_secure_token}),
+            content_type='application/json',
+        )
+        self.assertTrue(response.json()['success'])
+
+    def test_invoice_dashboard(self):
+        today = timezone.localdate()
+        self.assertIndexedQueries(
+            self.admin, 'get', reverse('invoice_dashboard'), max_queries=10,
+            data={'start_date': (today - timedelta(days=7)).isoformat(), 'end_date': today.isoformat()},
+        )
+
+    def test_invoice_dashboard_for_event(self):
+        self.assertIndexedQueries(
+            self.admin, 'get', reverse('invoice_dashboard'), max_queries=10,
+            data={'event': self.events[0].id},
+        )
+
+    def test_admin_volunteer_statistics(self):
+        # Grouped aggregates: the count must not grow with the number of volunteers or scans
+        self.assertIndexedQueries(
+            self.admin, 'get', reverse('admin_volunteer_statistics'), max_queries=10,
+            data={'date_filter': 'today'},
+        )
+
+    def test_promo_code_analytics(self):
+        # One grouped query for all codes, however many there are
+        response = self.assertIndexedQueries(self.admin, 'get', reverse('admin_promo_code_analytics'), max_queries=4)
+        codes = {code.code: code for code in response.context['promo_codes']}
+        self.assertEqual(len(codes), 6)
+        self.assertEqual((codes['SAVE01'].usage_count, codes['SAVE01'].amount_saved), (4, Decimal('40.00')))
+        self.assertEqual((codes['SAVE01'].redemption_rate, codes['SAVE00'].redemption_rate), (40, 100))
+
+    def test_organizer_promo_code_analytics(self):
+        response = self.assertIndexedQueries(self.organizer, 'get', reverse('organizer_promo_code_analytics'), max_queries=5)
+        self.assertEqual(response.context['total_saved'], 240.0)
+        self.assertEqual(response.context['total_revenue'], 2400.0)
+
+    def test_capacity_ledger_uses_sold_index(self):
+        # The ledger rebuild counts SOLD, VALID and USED tickets: the partial index must cover all three
+        Ticket.objects.filter(pk=Ticket.objects.filter(status='SOLD').first().pk).update(status='VALID')
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            reconcile_capacity(event_ids=[self.events[0].id], dry_run=True)
+        ledger_queries = [(sql, params) for sql, params in recorder.queries if 'SUM(' in sql and '"ticketing_ticket"' in sql]
+        self.assertEqual(len(ledger_queries), 2)
+        for sql, params in ledger_queries:
+            plan = explain_with_index(sql, params, 'ticketing_ticket', 'ticket_event_sold_idx')
+            self.assertIsNotNone(plan, f'ticket_event_sold_idx cannot serve:\n{sql}')
+            self.assertFalse(full_scans(plan), '\n'.join(plan))
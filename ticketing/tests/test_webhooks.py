@@ -0,0 +1,364 @@
+"""Tests for orders, Cashfree webhook ingestion and payment reconciliation"""
+import base64
+import hashlib
+import hmac
+import json
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+from django.core.cache import cache
+from django.core.files.storage import FileSystemStorage
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.urls import reverse
+from django.utils import timezone
+from ticketing import invoice_utils
+from ticketing.capacity_utils import place_hold, release_expired_holds
+from ticketing.job_utils import run_pending_jobs
+from ticketing.models import Event, TicketType, Ticket, User, PaymentTransaction, PromoCode, PromoCodeUsage, WebhookInbox
+from ticketing.order_utils import apply_promo_code, build_order
+from ticketing.payment_utils import apply_payment_outcome, get_stale_transactions, reconcile_transaction
+from ticketing.promo_utils import PromoUnavailable, reserve_promo_code
+
+WEBHOOK_SECRET = 'webhook-test-secret'
+
+
+class PaymentTestCase(TestCase):
+    def setUp(self):
+        # Paid orders run the render_invoice job: keep its PDFs out of MEDIA_ROOT
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        patcher = mock.patch.object(invoice_utils, '_invoice_storage', FileSystemStorage(location=location))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        organizer = User.objects.create_user(email='organizer@example.com', role='ORGANIZER')
+        customer = User.objects.create_user(email='customer@example.com', role='CUSTOMER')
+        now = timezone.now()
+        self.event = Event.objects.create(
+            title='Webhook test', description='Payments', event_type='Concert',
+            date=now.date() + timedelta(days=1), time=now.time(), venue='Hall',
+            capacity=100, organizer=organizer, status='PUBLISHED',
+        )
+        self.ticket_type = TicketType.objects.create(
+            event=self.event, type_name='General', price=Decimal('100.00'), attendees_per_ticket=2,
+        )
+        self.order = build_order(customer, self.event, {self.ticket_type: 1})
+        self.payment = PaymentTransaction.objects.create(
+            user=customer, order_id='order_webhook_1', amount=self.order.total, event=self.event,
+            purchase_order=self.order,
+        )
+
+
+class OrderTests(PaymentTestCase):
+    def test_booking_keeps_only_the_order_id_in_the_session(self):
+        self.client.force_login(self.order.user)
+        response = self.client.post(reverse('book_ticket', args=[self.event.id]), {f'ticket_{self.ticket_type.id}': '3'})
+        self.assertRedirects(response, reverse('checkout', args=[self.event.id]), fetch_redirect_response=False)
+
+        order = self.event.orders.latest('id')
+        self.assertEqual(self.client.session['order_id'], order.id)
+        self.assertNotIn('ticket_order', self.client.session)
+        self.assertEqual((order.subtotal, order.total_attendees), (Decimal('300.00'), 6))
+
+        # Later price changes do not touch the order already placed
+        TicketType.objects.filter(pk=self.ticket_type.pk).update(price=Decimal('150.00'))
+        response = self.client.get(reverse('checkout', args=[self.event.id]))
+        self.assertEqual(response.context['total'], Decimal('300.00'))
+
+    def test_paid_order_is_marked_paid(self):
+        apply_payment_outcome(self.payment.order_id, 'SUCCESS', source='redirect')
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'PAID')
+        ticket = Ticket.objects.get(purchase_transaction=self.payment)
+        self.assertEqual((ticket.booking_quantity, ticket.total_admission_count), (1, 2))
+
+    def test_legacy_session_order_is_still_issued(self):
+        legacy = PaymentTransaction.objects.create(
+            user=self.order.user, order_id='order_legacy_1', amount=Decimal('200.00'), event=self.event,
+            response_data={'ticket_order': {
+                'event_id': self.event.id,
+                'ticket_types': [{'id': self.ticket_type.id, 'quantity': 1}],
+                'total_attendees': 2,
+            }},
+        )
+        _, tickets = apply_payment_outcome(legacy.order_id, 'SUCCESS', source='redirect')
+        self.assertEqual([ticket.total_admission_count for ticket in tickets], [2])
+
+
+class PromoRedemptionTests(PaymentTestCase):
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        self.promo = PromoCode.objects.create(
+            code='FIRST10', event=self.event, discount_type='FIXED', discount_value=Decimal('10.00'),
+            valid_from=now - timedelta(days=1), valid_until=now + timedelta(days=1), max_uses=1,
+        )
+        apply_promo_code(self.order, self.promo)
+
+    def order_for(self, email):
+        order = build_order(User.objects.create_user(email=email, role='CUSTOMER'), self.event, {self.ticket_type: 1})
+        return apply_promo_code(order, self.promo)
+
+    def test_last_slot_goes_to_one_order(self):
+        reserve_promo_code(self.order)
+        # Reserving again for the same order keeps its slot
+        reserve_promo_code(self.order)
+        with self.assertRaises(PromoUnavailable):
+            reserve_promo_code(self.order_for('other@example.com'))
+        self.promo.refresh_from_db()
+        self.assertEqual(self.promo.current_uses, 1)
+
+    def test_failed_payment_releases_the_slot(self):
+        reserve_promo_code(self.order)
+        apply_payment_outcome(self.payment.order_id, 'FAILED', source='webhook')
+        self.promo.refresh_from_db()
+        self.assertEqual(self.promo.current_uses, 0)
+        self.assertEqual(reserve_promo_code(self.order_for('other@example.com')).status, 'RESERVED')
+
+    def test_abandoned_checkout_releases_the_slot(self):
+        PromoCode.objects.filter(pk=self.promo.pk).update(max_uses_per_user=1)
+        reserve_promo_code(self.order)
+        place_hold(self.event.id, self.order.total_attendees, self.payment)
+        # Nobody pays: the checkout times out and the sweeper closes the hold
+        self.assertEqual(release_expired_holds(now=timezone.now() + timedelta(days=1)), 1)
+
+        self.promo.refresh_from_db()
+        self.assertEqual(self.promo.current_uses, 0)
+        self.assertEqual(self.order.promo_redemptions.get().status, 'RELEASED')
+        # The same customer can use the code on a new checkout
+        retry = apply_promo_code(build_order(self.order.user, self.event, {self.ticket_type: 1}), self.promo)
+        self.assertEqual(reserve_promo_code(retry).status, 'RESERVED')
+
+    def test_paid_order_redeems_its_slot(self):
+        redemption = reserve_promo_code(self.order)
+        apply_payment_outcome(self.payment.order_id, 'SUCCESS', source='webhook')
+        redemption.refresh_from_db()
+        self.promo.refresh_from_db()
+        self.assertEqual((redemption.status, self.promo.current_uses), ('REDEEMED', 1))
+        self.assertEqual(PromoCodeUsage.objects.get().discount_amount, Decimal('10.00'))
+
+    def test_per_user_and_per_event_caps(self):
+        PromoCode.objects.filter(pk=self.promo.pk).update(max_uses=0, max_uses_per_user=1)
+        reserve_promo_code(self.order)
+        with self.assertRaises(PromoUnavailable):
+            reserve_promo_code(apply_promo_code(build_order(self.order.user, self.event, {self.ticket_type: 1}), self.promo))
+        reserve_promo_code(self.order_for('second@example.com'))
+
+        Event.objects.filter(pk=self.event.pk).update(max_promo_redemptions=2)
+        with self.assertRaises(PromoUnavailable):
+            reserve_promo_code(self.order_for('third@example.com'))
+
+
+class ConcurrentPromoRedemptionTests(TransactionTestCase):
+    def setUp(self):
+        organizer = User.objects.create_user(email='organizer@example.com', role='ORGANIZER')
+        self.customer = User.objects.create_user(email='customer@example.com', role='CUSTOMER')
+        now = timezone.now()
+        self.event = Event.objects.create(
+            title='Promo race', description='Concurrent checkouts', event_type='Concert',
+            date=now.date() + timedelta(days=1), time=now.time(), venue='Hall',
+            capacity=100, organizer=organizer, status='PUBLISHED',
+        )
+        ticket_type = TicketType.objects.create(event=self.event, type_name='General', price=Decimal('100.00'))
+        self.promo = PromoCode.objects.create(
+            code='ONCEEACH', event=self.event, discount_type='FIXED', discount_value=Decimal('10.00'),
+            valid_from=now - timedelta(days=1), valid_until=now + timedelta(days=1), max_uses=0, max_uses_per_user=1,
+        )
+        self.orders = [
+            apply_promo_code(build_order(self.customer, self.event, {ticket_type: 1}), self.promo) for _ in range(4)
+        ]
+
+    # SQLite cannot run concurrent writers, see test_checkin
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_parallel_checkouts_respect_the_per_user_cap(self):
+        barrier = threading.Barrier(len(self.orders))
+        outcomes = [None] * len(self.orders)
+
+        def checkout(index):
+            try:
+                barrier.wait(timeout=30)
+                reserve_promo_code(self.orders[index])
+                outcomes[index] = 'RESERVED'
+            except PromoUnavailable:
+                outcomes[index] = 'UNAVAILABLE'
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=checkout, args=(i,)) for i in range(len(self.orders))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(outcomes.count('RESERVED'), 1)
+        self.promo.refresh_from_db()
+        self.assertEqual(self.promo.current_uses, 1)
+
+
+@override_settings(PROMO_GUESS_LIMIT=3)
+class PromoLookupTests(PaymentTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        now = timezone.now()
+        self.promo = PromoCode.objects.create(
+            code='SAVE10', event=self.event, discount_type='PERCENTAGE', discount_value=Decimal('10.00'),
+            valid_from=now - timedelta(days=1), valid_until=now + timedelta(days=1),
+        )
+
+    def validate(self, code, **extra):
+        return self.client.get(reverse('validate_promo_code', args=[code]), {'event_id': self.event.id}, **extra)
+
+    def test_unknown_codes_are_rejected_from_the_cache(self):
+        self.validate('WARMUP')
+        with self.assertNumQueries(0):
+            self.assertFalse(self.validate('GUESS1').json()['valid'])
+
+    def test_saving_a_code_refreshes_the_index(self):
+        self.client.force_login(self.order.user)
+        session = self.client.session
+        session['order_id'] = self.order.id
+        session.save()
+        self.assertEqual(self.validate('SAVE10').json()['final_total'], 90.0)
+
+        self.promo.is_active = False
+        self.promo.save()
+        self.assertEqual(self.validate('SAVE10').json()['message'], 'This promo code is inactive')
+
+    def test_guessing_is_rate_limited_per_ip(self):
+        for code in ('A1', 'A2', 'A3'):
+            self.assertEqual(self.validate(code).status_code, 200)
+        self.assertEqual(self.validate('SAVE10').status_code, 429)
+        self.assertEqual(self.validate('SAVE10', REMOTE_ADDR='10.0.0.2').status_code, 200)
+
+    @override_settings(TRUSTED_PROXY_COUNT=1)
+    def test_forwarded_for_cannot_be_rotated_past_the_limit(self):
+        # The proxy appends the real client; whatever the client sent is further left
+        for n in range(3):
+            self.validate(f'A{n}', HTTP_X_FORWARDED_FOR=f'198.51.100.{n}, 203.0.113.9')
+        self.assertEqual(self.validate('SAVE10', HTTP_X_FORWARDED_FOR='198.51.100.99, 203.0.113.9').status_code, 429)
+        self.assertEqual(self.validate('SAVE10', HTTP_X_FORWARDED_FOR='203.0.113.10').status_code, 200)
+
+
+@override_settings(CASHFREE_CLIENT_SECRET=WEBHOOK_SECRET)
+class WebhookInboxTests(PaymentTestCase):
+    def deliver(self, payment_status='SUCCESS', cf_payment_id='cf_1'):
+        body = json.dumps({
+            'type': 'PAYMENT_SUCCESS_WEBHOOK' if payment_status == 'SUCCESS' else 'PAYMENT_FAILED_WEBHOOK',
+            'data': {
+                'order': {'order_id': self.payment.order_id},
+                'payment': {'payment_status': payment_status, 'cf_payment_id': cf_payment_id},
+            },
+        })
+        timestamp = str(int(timezone.now().timestamp()))
+        digest = hmac.new(WEBHOOK_SECRET.encode(), (timestamp + body).encode(), hashlib.sha256).digest()
+        return self.client.post(
+            reverse('cashfree_webhook'), body, content_type='application/json',
+            HTTP_X_WEBHOOK_SIGNATURE=base64.b64encode(digest).decode(),
+            HTTP_X_WEBHOOK_TIMESTAMP=timestamp,
+        )
+
+    def test_retried_delivery_is_stored_once(self):
+        for _ in range(3):
+            self.assertEqual(self.deliver().status_code, 200)
+
+        inbox = WebhookInbox.objects.get()
+        self.assertEqual(inbox.deliveries, 3)
+        self.assertEqual(inbox.status, 'PENDING')
+        # Nothing touches the order until the processor runs
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'CREATED')
+
+        run_pending_jobs('test')
+        inbox.refresh_from_db()
+        self.payment.refresh_from_db()
+        self.assertEqual(inbox.status, 'PROCESSED')
+        self.assertEqual(self.payment.status, 'SUCCESS')
+        self.assertEqual(Ticket.objects.filter(purchase_transaction=self.payment).count(), 1)
+
+    def test_webhook_and_redirect_issue_tickets_once(self):
+        _, redirect_tickets = apply_payment_outcome(self.payment.order_id, 'SUCCESS', source='redirect')
+        self.deliver()
+        run_pending_jobs('test')
+
+        tickets = Ticket.objects.filter(purchase_transaction=self.payment)
+        self.assertEqual([ticket.id for ticket in tickets], [ticket.id for ticket in redirect_tickets])
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.attendees_sold, 2)
+
+    def test_late_failure_does_not_undo_success(self):
+        self.deliver()
+        self.deliver('FAILED', cf_payment_id='cf_2')
+        run_pending_jobs('test')
+
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'SUCCESS')
+        self.assertEqual(WebhookInbox.objects.filter(status='PROCESSED').count(), 2)
+
+    def test_bad_signature_is_rejected(self):
+        response = self.client.post(
+            reverse('cashfree_webhook'), '{}', content_type='application/json',
+            HTTP_X_WEBHOOK_SIGNATURE='forged', HTTP_X_WEBHOOK_TIMESTAMP='1',
+        )
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(WebhookInbox.objects.exists())
+
+
+class StubGateway:
+    """Answers order lookups with a fixed Cashfree order status"""
+    def __init__(self, order_status):
+        self.order_status = order_status
+        self.lookups = 0
+
+    def get_order(self, order_id):
+        self.lookups += 1
+        return {'order_id': order_id, 'order_status': self.order_status}
+
+    def get_order_payments(self, order_id):
+        return [{'cf_payment_id': 42, 'payment_status': 'SUCCESS'}]
+
+
+class PaymentReconciliationTests(PaymentTestCase):
+    def make_stale(self):
+        PaymentTransaction.objects.filter(pk=self.payment.pk).update(created_at=timezone.now() - timedelta(hours=1))
+
+    def test_only_old_unsettled_orders_are_stale(self):
+        self.assertFalse(get_stale_transactions().exists())
+        self.make_stale()
+        self.assertEqual(list(get_stale_transactions()), [self.payment])
+
+    def test_paid_order_is_issued_once(self):
+        self.make_stale()
+        row = reconcile_transaction(self.payment, gateway=StubGateway('PAID'))
+        self.assertEqual((row['action'], row['tickets']), ('ISSUED', 1))
+        self.payment.refresh_from_db()
+        self.assertEqual((self.payment.status, self.payment.cf_payment_id), ('SUCCESS', '42'))
+        self.assertFalse(get_stale_transactions().exists())
+
+        # Running again (or a late webhook) finds the existing ticket
+        apply_payment_outcome(self.payment.order_id, 'SUCCESS', source='webhook')
+        self.assertEqual(Ticket.objects.filter(purchase_transaction=self.payment).count(), 1)
+
+    def test_dry_run_changes_nothing(self):
+        row = reconcile_transaction(self.payment, dry_run=True, gateway=StubGateway('PAID'))
+        self.assertEqual(row['action'], 'ISSUED')
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'CREATED')
+        self.assertFalse(Ticket.objects.exists())
+
+    def test_unpaid_and_expired_orders(self):
+        self.assertEqual(reconcile_transaction(self.payment, gateway=StubGateway('ACTIVE'))['action'], 'UNCHANGED')
+        self.assertEqual(reconcile_transaction(self.payment, gateway=StubGateway('EXPIRED'))['action'], 'FAILED')
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'FAILED')
+
+    def test_ticketless_paid_order_is_reissued_without_gateway(self):
+        PaymentTransaction.objects.filter(pk=self.payment.pk).update(status='SUCCESS')
+        self.payment.refresh_from_db()
+        gateway = StubGateway('PAID')
+        row = reconcile_transaction(self.payment, gateway=gateway)
+        self.assertEqual((row['action'], row['tickets'], gateway.lookups), ('ISSUED', 1, 0))
@@ -2,6 +2,7 @@ from django.contrib.auth import views as auth_views
 from django.urls import path
 from . import views
 from . import admin_views
+from . import invoice_views
 from . import volunteer_views
 
 urlpatterns = [
@@ -20,6 +21,7 @@ urlpatterns = [
     
     # Online Pass URL
     path('pass/<uuid:unique_id>/', views.view_online_ticket, name='view_online_ticket'),
+    path('pass/<uuid:unique_id>/qr.png', views.online_ticket_qr, name='online_ticket_qr'),
 
     # Test static files
     path('test-static/', views.test_static_files, name='test_static_files'),
@@ -32,6 +34,7 @@ urlpatterns = [
     path('events/create/', views.create_event, name='create_event'),
     path('events/<int:event_id>/', views.event_detail, name='event_detail'),
     path('events/<int:event_id>/dashboard/', views.event_dashboard, name='event_dashboard'),
+    path('events/<int:event_id>/occupancy/', views.api_event_occupancy, name='api_event_occupancy'),
     path('events/<int:event_id>/checkout/', views.checkout, name='checkout'),
     path('events/<int:event_id>/purchase/', views.purchase_ticket, name='purchase_ticket'),
     path('api/event/<int:event_id>/ticket-types/', views.get_event_ticket_types, name='get_event_ticket_types'),
@@ -55,11 +58,16 @@ urlpatterns = [
     path('api/checkout/ticket/', views.api_checkout_ticket, name='api_checkout_ticket'),
     path('api/ticket/download/<int:ticket_id>/', views.api_download_ticket, name='api_download_ticket'),
     path('ticket/<int:ticket_id>/event-pass/', views.event_pass, name='event_pass'),
+    path('ticket/<int:ticket_id>/pass.png', views.download_ticket_pass, name='download_ticket_pass'),
 
     # Volunteer ticket scanning
     path('volunteer/dashboard/', volunteer_views.volunteer_dashboard, name='volunteer_dashboard'),
     path('volunteer/scan/', volunteer_views.volunteer_scan_tickets, name='volunteer_scan_tickets'),
     path('api/validate-ticket/', volunteer_views.api_validate_ticket, name='api_validate_ticket'),
+    path('api/validate-tickets/', volunteer_views.api_validate_tickets_batch, name='api_validate_tickets_batch'),
+    path('api/checkin/manifest/<int:event_id>/', volunteer_views.api_checkin_manifest, name='api_checkin_manifest'),
+    path('api/checkin/manifest/<int:event_id>/verify/', volunteer_views.api_verify_checkin_manifest, name='api_verify_checkin_manifest'),
+    path('api/checkin/bulk/', volunteer_views.api_bulk_checkin, name='api_bulk_checkin'),
 
     # Password reset URLs
     path('password_reset/', auth_views.PasswordResetView.as_view(
@@ -124,6 +132,9 @@ urlpatterns = [
     # Volunteer Statistics
     path('admin-panel/volunteer-statistics/', admin_views.admin_volunteer_statistics, name='admin_volunteer_statistics'),
 
+    # Payment gateway client metrics
+    path('admin-panel/gateway-metrics/', admin_views.admin_gateway_metrics, name='admin_gateway_metrics'),
+
     # Ticket Type Management
     path('admin-panel/ticket-types/', admin_views.admin_ticket_type_list, name='admin_ticket_type_list'),
     path('admin-panel/ticket-types/create/', admin_views.admin_create_ticket_type, name='admin_create_ticket_type'),
@@ -139,7 +150,9 @@ urlpatterns = [
     # Invoice System URLs
     path('admin-panel/invoices/', admin_views.invoice_dashboard, name='invoice_dashboard'),
     path('admin-panel/invoices/export-csv/', admin_views.export_invoices_csv, name='export_invoices_csv'),
+    path('admin-panel/invoices/export-zip/', admin_views.export_invoices_zip, name='export_invoices_zip'),
     path('admin-panel/invoices/<int:invoice_id>/', admin_views.invoice_detail, name='invoice_detail'),
+    path('admin-panel/invoices/<int:invoice_id>/pdf/', invoice_views.admin_download_invoice_pdf, name='admin_download_invoice_pdf'),
     path('admin-panel/invoices/analytics/', admin_views.invoice_analytics, name='invoice_analytics'),
     path('admin-panel/commission/', admin_views.event_commission_management, name='event_commission_management'),
 
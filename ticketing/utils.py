@@ -5,9 +5,11 @@ import io
 import secrets
 import string
 import time
+from django.db import transaction
 from django.utils import timezone
 from .models import Ticket, TicketType, User
-import uuid
+from .issuance_utils import bulk_create_tickets
+from functools import lru_cache
 from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
@@ -297,26 +299,25 @@ def generate_tickets_for_purchase(user, ticket_type, quantity=1):
     Generate tickets for a user and ticket type.
     Returns a list of created Ticket objects.
     """
-    tickets = []
     event = ticket_type.event
-    for _ in range(quantity):
-        ticket_number = str(uuid.uuid4())[:8].upper()
-        ticket = Ticket.objects.create(
-            event=event,
-            ticket_type=ticket_type,
-            customer=user,
-            ticket_number=ticket_number,
-            status='VALID',
-            purchase_date=timezone.now(),
-            unique_secure_token=str(uuid.uuid4()),
-            unique_id=uuid.uuid4()  # Ensure unique_id is set
-        )
-        tickets.append(ticket)
+    now = timezone.now()
+    with transaction.atomic():
+        tickets = bulk_create_tickets([
+            Ticket(
+                event=event,
+                ticket_type=ticket_type,
+                customer=user,
+                status='VALID',
+                purchase_date=now,
+            )
+            for _ in range(quantity)
+        ])
     return tickets
 
+@lru_cache(maxsize=None)
 def get_logo_base64():
     """
-    Get the TapNex logo as base64 encoded string for email templates
+    Get the TapNex logo as base64 encoded string for email templates (read once per process)
     """
     # Try multiple possible paths for the logo
     possible_paths = [
@@ -338,9 +339,10 @@ def get_logo_base64():
     # Fallback to a simple colored div if logo is not found
     return None
 
+@lru_cache(maxsize=None)
 def get_nexgen_logo_base64():
     """
-    Get the NexGen FC logo as base64 encoded string for email templates
+    Get the NexGen FC logo as base64 encoded string for email templates (read once per process)
     """
     possible_paths = [
         os.path.join(settings.BASE_DIR, 'ticketing', 'static', 'images', 'logos', 'LOGO_NEXGEN_FC.png'),
@@ -358,4 +360,18 @@ def get_nexgen_logo_base64():
         except (FileNotFoundError, IOError):
             continue
     
-    return None
\ No newline at end of file
+    return None
+
+
+def get_client_ip(request):
+    """
+    The client address, e.g. for rate limiting. Clients can put anything at the left
+    of X-Forwarded-For, so the header is read from the right: each of the
+    TRUSTED_PROXY_COUNT proxies in front of the app appends the address it was
+    connected from. Without trusted proxies REMOTE_ADDR is used.
+    """
+    trusted_proxies = getattr(settings, 'TRUSTED_PROXY_COUNT', 0)
+    forwarded_for = [hop.strip() for hop in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if hop.strip()]
+    if trusted_proxies and forwarded_for:
+        return forwarded_for[-min(trusted_proxies, len(forwarded_for))]
+    return request.META.get('REMOTE_ADDR', '')
@@ -8,17 +8,16 @@ import qrcode
 import traceback as traceback_module
 import time
 import tempfile
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw
 from io import BytesIO, StringIO
 import base64
 import hmac
 import hashlib
 import os
 import re  # Import the regular expression module
-import csv
 import datetime
-from datetime import datetime as dt
 from django.db import transaction
+from django.db.models import Q, OuterRef, Subquery
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth import login
@@ -38,15 +37,24 @@ from .forms import (
     PromoCodeForm, EventStaffForm, OTPForm
 )
 from .models import User, Event, Ticket, PromoCode, EventStaff, TicketType, PromoCodeUsage, PaymentTransaction
-from .utils import generate_otp, send_otp_email
+from .utils import generate_otp, send_otp_email, get_client_ip
+from .capacity_utils import place_hold, CapacityError
+from .payment_utils import apply_payment_outcome, record_webhook_delivery, release_reservations
+from .promo_utils import (
+    reserve_promo_code, release_promo_code, user_can_redeem, PromoUnavailable,
+    lookup_promo_code, promo_entry_problem, record_promo_guess, promo_guesses_exceeded,
+)
+from .order_utils import build_order, remember_order, forget_order, get_session_order, apply_promo_code
+from .gateway_utils import get_cashfree_gateway, GatewayUnavailable
+from .catalogue_utils import get_event_catalogue, get_upcoming_event_catalogue
+from .occupancy_utils import get_occupancy
+from .analytics_utils import get_organizer_dashboard_stats, get_event_dashboard_stats
+from .export_utils import csv_streaming_response, iterate_in_chunks
+from .render_cache_utils import get_or_render, serve_cached_png
+from .render_assets_utils import get_font, get_sponsor_logos, get_sponsor_logos_fingerprint
 # Removed: from weasyprint import HTML, CSS
 # Removed: import imgkit
 
-# cashfree
-from cashfree_pg.models.create_order_request import CreateOrderRequest
-from cashfree_pg.models.order_meta import OrderMeta
-from cashfree_pg.models.customer_details import CustomerDetails
-from ticketing.cashfree_config import CashfreeSafe as Cashfree
 # Add these imports at the top of ticketing/views.py
 import hmac
 import hashlib
@@ -77,19 +85,13 @@ logger.info(f"Cashfree Environment: {getattr(settings, 'CASHFREE_ENVIRONMENT', '
 logger.info(f"Client ID configured: {bool(settings.CASHFREE_CLIENT_ID)}")
 logger.info(f"Client Secret configured: {bool(settings.CASHFREE_CLIENT_SECRET)}")
 
-Cashfree.XClientId = settings.CASHFREE_CLIENT_ID
-Cashfree.XClientSecret = settings.CASHFREE_CLIENT_SECRET
-
-# Enforce PRODUCTION mode for deployment
+# Cashfree API calls go through gateway_utils.get_cashfree_gateway(), which picks
+# the sandbox in DEBUG and production otherwise
 if settings.DEBUG:
-    Cashfree.XEnvironment = Cashfree.SANDBOX
     logger.warning("Using Cashfree SANDBOX environment (Debug mode)")
 else:
-    Cashfree.XEnvironment = Cashfree.PRODUCTION
     logger.info("Using Cashfree PRODUCTION environment")
 
-CASHFREE_API_VERSION = "2023-08-01"
-
 def is_admin(user):
     return user.is_authenticated and user.role == 'ADMIN'
 
@@ -169,19 +171,7 @@ def my_tickets(request):
 # Verification function removed
 
 def get_event_data():
-    events = Event.objects.filter(status='PUBLISHED').order_by('-created_at').prefetch_related('ticket_types')
-    events_with_prices = []
-    for event in events:
-        min_price = float('inf')
-        for ticket_type in event.ticket_types.all():
-            if ticket_type.price < min_price:
-                min_price = ticket_type.price
-        events_with_prices.append({
-            'event': event,
-            'min_price': min_price if min_price != float('inf') else None,
-            'tickets_are_live': event.tickets_are_live
-        })
-    return events_with_prices
+    return get_event_catalogue()
 
 def home(request):
     events_with_prices = get_event_data()
@@ -292,39 +282,21 @@ def book_ticket(request, event_id):
         ticket_types_with_availability.append(ticket_type)
     
     if request.method == 'POST':
-        selected_tickets = []
-        total_amount = 0
+        event_ticket_types = {str(ticket_type.id): ticket_type for ticket_type in ticket_types_with_availability}
+        quantities = {}
         total_attendees_requested = 0
         
         for key, value in request.POST.items():
             if key.startswith('ticket_') and value.isdigit() and int(value) > 0:
-                ticket_type_id = key.split('_')[1]
-                quantity = int(value)
-                
-                try:
-                    ticket_type = TicketType.objects.get(id=ticket_type_id, event=event)
-                    
-                    attendees_per_ticket = ticket_type.attendees_per_ticket or 1
-                    attendees_for_this_type = quantity * attendees_per_ticket
-                    total_attendees_requested += attendees_for_this_type
-                    
-                    subtotal = float(ticket_type.price) * quantity
-                        
-                    selected_tickets.append({
-                        'id': ticket_type.id,
-                        'type_name': ticket_type.type_name,
-                        'price': float(ticket_type.price),
-                        'quantity': quantity,
-                        'attendees_per_ticket': attendees_per_ticket,
-                        'subtotal': subtotal,
-                        'total_attendees': attendees_for_this_type
-                    })
-                    total_amount += subtotal
-                except TicketType.DoesNotExist:
+                ticket_type = event_ticket_types.get(key.split('_')[1])
+                if ticket_type is None:
                     messages.error(request, 'Invalid ticket type selected.')
                     return redirect('book_ticket', event_id=event_id)
+                
+                quantities[ticket_type] = int(value)
+                total_attendees_requested += int(value) * (ticket_type.attendees_per_ticket or 1)
         
-        if not selected_tickets:
+        if not quantities:
             messages.error(request, 'Please select at least one ticket.')
             return redirect('book_ticket', event_id=event_id)
         
@@ -332,13 +304,9 @@ def book_ticket(request, event_id):
             messages.error(request, f'Not enough capacity. Only {event.remaining_attendee_capacity} attendees can be registered.')
             return redirect('book_ticket', event_id=event_id)
         
-        request.session['ticket_order'] = {
-            'event_id': event_id,
-            'ticket_types': selected_tickets,
-            'subtotal': total_amount,
-            'total': total_amount,
-            'total_attendees': total_attendees_requested
-        }
+        # Prices are snapshotted on the order; the session only keeps its id
+        order = build_order(request.user, event, quantities)
+        remember_order(request, order)
         
         return redirect('checkout', event_id=event_id)
     
@@ -432,46 +400,13 @@ def dashboard(request):
     
     elif request.user.role == 'ORGANIZER':
         # Get all events organized by this user (both direct ownership and through EventStaff model)
-        direct_events = list(Event.objects.filter(organizer=request.user).prefetch_related('ticket_types'))
-        staff_events = list(Event.objects.filter(staff__user=request.user, staff__role='ORGANIZER').prefetch_related('ticket_types'))
-        
-        # Combine both sets of events (removing duplicates by ID)
-        event_ids = set()
-        events = []
-        for event in direct_events + staff_events:
-            if event.id not in event_ids:
-                events.append(event)
-                event_ids.add(event.id)
-        
+        events = list(
+            Event.objects.filter(
+                Q(organizer=request.user) | Q(staff__user=request.user, staff__role='ORGANIZER')
+            ).distinct().prefetch_related('ticket_types')
+        )
         context['events'] = events
         
-        # Calculate total revenue, tickets sold, and total attendees
-        total_revenue = 0
-        total_tickets_sold = 0
-        total_attendees = 0
-        
-        # Data for charts
-        revenue_by_date = {}
-        tickets_by_type = {}
-        event_names = []
-        total_tickets_list = []
-        checked_in_tickets_list = []
-        
-        # Additional data structures for enhanced dashboard
-        event_revenues = {}
-        event_checkins = {}
-        
-        # Get date range for comparison metrics
-        today = timezone.now().date()
-        one_week_ago = today - timedelta(days=7)
-        one_month_ago = today - timedelta(days=30)
-        
-        # Metrics for comparison (last week/month)
-        tickets_last_week = 0
-        tickets_this_week = 0
-        revenue_last_month = 0
-        revenue_this_month = 0
-        
         # Activity log for recent activities (would be from a real activity model in production)
         recent_activities = [
             {
@@ -488,121 +423,9 @@ def dashboard(request):
             }
         ]
         
-        for event in events:
-            # Get sold tickets for this event
-            sold_tickets = Ticket.objects.filter(event=event, status='SOLD').select_related('ticket_type')
-            event_revenue = sum(ticket.ticket_type.price for ticket in sold_tickets if ticket.ticket_type)
-            total_revenue += event_revenue
-            
-            # Store revenue per event for the table
-            event_revenues[event.id] = event_revenue
-            
-            # Count tickets and attendees
-            event_tickets_sold = sold_tickets.count()
-            total_tickets_sold += event_tickets_sold
-            
-            # Calculate total attendees (based on ticket types)
-            event_attendees = 0
-            for ticket in sold_tickets:
-                if ticket.ticket_type and ticket.ticket_type.attendees_per_ticket:
-                    event_attendees += ticket.ticket_type.attendees_per_ticket
-                else:
-                    event_attendees += 1  # Default to 1 if not specified
-                
-                # Calculate comparative metrics
-                if ticket.purchase_date:
-                    purchase_date = ticket.purchase_date.date()
-                    # For weekly comparison
-                    if one_week_ago <= purchase_date < today:
-                        tickets_this_week += 1
-                    elif purchase_date < one_week_ago:
-                        tickets_last_week += 1
-                    
-                    # For monthly revenue comparison
-                    if one_month_ago <= purchase_date < today and ticket.ticket_type:
-                        revenue_this_month += float(ticket.ticket_type.price)
-                    elif purchase_date < one_month_ago and ticket.ticket_type:
-                        revenue_last_month += float(ticket.ticket_type.price)
-            
-            total_attendees += event_attendees
-            
-            # Process ticket data for charts
-            for ticket in sold_tickets:
-                # For sales over time
-                purchase_date = ticket.purchase_date.date() if ticket.purchase_date else timezone.now().date()
-                date_str = purchase_date.strftime('%Y-%m-%d')
-                if date_str not in revenue_by_date:
-                    revenue_by_date[date_str] = 0
-                if ticket.ticket_type:
-                    revenue_by_date[date_str] += float(ticket.ticket_type.price)
-                
-                # For ticket type breakdown
-                if ticket.ticket_type:
-                    type_id = ticket.ticket_type.id
-                    type_name = ticket.ticket_type.type_name
-                    if type_id not in tickets_by_type:
-                        tickets_by_type[type_id] = {
-                            'name': type_name,
-                            'count': 0
-                        }
-                    tickets_by_type[type_id]['count'] += 1
-            
-            # For attendance chart
-            event_names.append(event.title)
-            total_tickets_list.append(event_tickets_sold)
-            checked_in = Ticket.objects.filter(event=event, status='USED').count()
-            checked_in_tickets_list.append(checked_in)
-            
-            # Store check-ins per event for the check-in progress section
-            event_checkins[event.id] = checked_in
-        
-        # Sort and format date data for revenue chart
-        revenue_dates = sorted(revenue_by_date.keys())
-        revenue_amounts = [revenue_by_date[date] for date in revenue_dates]
-        
-        # Format dates for display
-        formatted_dates = []
-        for date_str in revenue_dates:
-            try:
-                date_obj = dt.strptime(date_str, '%Y-%m-%d')
-                formatted_dates.append(date_obj.strftime('%b %d'))
-            except ValueError:
-                # In case of invalid date string, use a placeholder
-                formatted_dates.append('Unknown')
-        
-        # Calculate percentage changes for comparative metrics
-        tickets_change = 0
-        if tickets_last_week > 0:
-            tickets_change = round((tickets_this_week - tickets_last_week) / tickets_last_week * 100)
-            
-        revenue_change = 0
-        if revenue_last_month > 0:
-            revenue_change = round((revenue_this_month - revenue_last_month) / revenue_last_month * 100)
-            
-        # Calculate check-in percentage
-        checked_in_percentage = None
-        if total_tickets_sold > 0:
-            checked_in_percentage = round(sum(checked_in_tickets_list) / total_tickets_sold * 100)
-        
-        # Add chart data and new metrics to context
-        context.update({
-            'total_revenue': total_revenue,
-            'total_tickets_sold': total_tickets_sold,
-            'total_attendees': total_attendees,
-            'revenue_dates': formatted_dates,
-            'revenue_amounts': revenue_amounts,
-            'ticket_types_data': list(tickets_by_type.values()),
-            'event_names': event_names,
-            'total_tickets': total_tickets_list,
-            'checked_in_tickets': checked_in_tickets_list,
-            # New context variables for enhanced dashboard
-            'event_revenues': event_revenues,
-            'event_checkins': event_checkins,
-            'tickets_change': tickets_change,
-            'revenue_change': revenue_change,
-            'checked_in_percentage': checked_in_percentage,
-            'recent_activities': recent_activities
-        })
+        # Revenue, attendance, comparisons and chart series come from grouped queries
+        context.update(get_organizer_dashboard_stats(events))
+        context['recent_activities'] = recent_activities
         
         template = 'core/organizer_dashboard.html'
     
@@ -616,25 +439,7 @@ def dashboard(request):
             status='SOLD'
         ).select_related('event', 'ticket_type').order_by('-purchase_date')
         
-        today = timezone.now().date()
-        events = Event.objects.filter(
-            status='PUBLISHED', 
-            date__gte=today
-        ).prefetch_related('ticket_types').order_by('date')
-        events_with_prices = []
-        
-        for event in events:
-            min_price = float('inf')
-            for ticket_type in event.ticket_types.all():
-                if ticket_type.price < min_price:
-                    min_price = ticket_type.price
-            events_with_prices.append({
-                'event': event,
-                'min_price': min_price if min_price != float('inf') else None,
-                'tickets_are_live': event.tickets_are_live
-            })
-            
-        context['events'] = events_with_prices
+        context['events'] = get_upcoming_event_catalogue()
         template = 'core/customer_dashboard.html'
     else:
         template = 'core/dashboard.html'
@@ -684,65 +489,37 @@ def event_detail(request, event_id):
 def checkout(request, event_id):
     event = get_object_or_404(Event, id=event_id)
     
-    ticket_order = request.session.get('ticket_order', {})
+    order = get_session_order(request, event_id)
     
-    if not ticket_order or ticket_order.get('event_id') != event_id:
+    if not order:
         messages.error(request, 'No ticket order found. Please select tickets first.')
         return redirect('event_detail', event_id=event_id)
     
-    selected_tickets = ticket_order.get('ticket_types', [])
-    subtotal = ticket_order.get('subtotal', 0)
-    
     if request.method == 'POST':
         applied_promo_code = request.POST.get('promo_code', '').strip()
-        total = subtotal
-        discount = 0
+        promo = None
 
         if applied_promo_code:
             try:
                 promo = PromoCode.objects.get(code=applied_promo_code, event=event)
-                if promo.is_valid:
-                    if promo.discount_type == 'PERCENTAGE':
-                        discount = (float(promo.discount_value) / 100) * subtotal
-                    else:
-                        discount = min(float(promo.discount_value), subtotal)
-                    
-                    total = subtotal - discount
-                    request.session['ticket_order']['discount'] = float(discount)
-                    request.session['ticket_order']['promo_code'] = applied_promo_code
-                else:
+                if not promo.is_valid:
                     messages.error(request, 'The promo code is no longer valid.')
-                    request.session['ticket_order']['discount'] = 0
-                    request.session['ticket_order']['promo_code'] = ''
+                    promo = None
             except PromoCode.DoesNotExist:
                 messages.error(request, 'Invalid promo code entered.')
-                request.session['ticket_order']['discount'] = 0
-                request.session['ticket_order']['promo_code'] = ''
-        else:
-            request.session['ticket_order']['discount'] = 0
-            request.session['ticket_order']['promo_code'] = ''
-            
-        request.session['ticket_order']['total'] = total
-        request.session.modified = True
-        
-    discount = request.session.get('ticket_order', {}).get('discount', 0)
-    promo_code = request.session.get('ticket_order', {}).get('promo_code', '')
-    total = request.session.get('ticket_order', {}).get('total', subtotal)
-    
-        
 
-    
-    total_attendees = ticket_order.get('total_attendees', 0)
+        apply_promo_code(order, promo)
 
     context = {
         'event': event,
-        'ticket_types': selected_tickets,
-        'subtotal': subtotal,
-        'total': total,
-        'discount': discount,
-        'promo_code': promo_code,
+        'order': order,
+        'ticket_types': order.lines.all(),
+        'subtotal': order.subtotal,
+        'total': order.total,
+        'discount': order.discount,
+        'promo_code': order.promo_code,
         'user': request.user,
-        'total_attendees': total_attendees,
+        'total_attendees': order.total_attendees,
         'show_service_fee': False,  # Flag to control template display
         'debug': settings.DEBUG,  # Pass debug flag for environment detection
     }
@@ -757,55 +534,50 @@ def validate_promo_code(request, code):
     if not code or code.strip() == '':
         return JsonResponse({'valid': False, 'message': 'Please enter a promo code'})
     
-    # Check if the same code is already stored in the session and is valid
-    stored_promo = request.session.get('ticket_order', {}).get('promo_code', '')
-    if stored_promo == code and request.session.get('ticket_order', {}).get('discount', 0) > 0:
-        # Return existing discount data from session
-        discount = request.session['ticket_order']['discount']
-        final_total = request.session['ticket_order']['total']
-        subtotal = request.session['ticket_order'].get('subtotal', 0)
-        
-        return JsonResponse({
-            'valid': True,
-            'discount': round(float(discount), 2),
-            'final_total': round(float(final_total), 2),
-            'message': f'Promo code applied successfully!'
-        })
-        
+    client_ip = get_client_ip(request)
+    if promo_guesses_exceeded(client_ip):
+        logger.warning(f"Promo code validation blocked for {client_ip} after too many unknown codes")
+        return JsonResponse({'valid': False, 'message': 'Too many invalid promo codes. Please try again later.'}, status=429)
+
     try:
-        promo = PromoCode.objects.get(code=code, event_id=event_id)
-        
-        if not promo.is_valid:
-            now = timezone.now()
-            if not promo.is_active: message = 'This promo code is inactive'
-            elif promo.valid_from > now: message = 'This promo code is not yet valid'
-            elif promo.valid_until < now: message = 'This promo code has expired'
-            elif promo.max_uses > 0 and promo.current_uses >= promo.max_uses: message = 'This promo code has reached its maximum usage limit'
-            else: message = 'This promo code is no longer valid'
-            return JsonResponse({'valid': False, 'message': message})
-            
-        order_total = request.session.get('ticket_order', {}).get('subtotal', 0)
-        if order_total == 0:
+        # Answered from the cached promo code index: unknown and unusable codes never reach the database
+        entry = lookup_promo_code(int(event_id), code) if event_id.isdigit() else None
+        if entry is None:
+            record_promo_guess(client_ip)
+            return JsonResponse({'valid': False, 'message': 'Invalid promo code'})
+        
+        problem = promo_entry_problem(entry)
+        if problem:
+            return JsonResponse({'valid': False, 'message': problem})
+        
+        order = get_session_order(request, event_id)
+        if not order or order.subtotal == 0:
             return JsonResponse({'valid': False, 'message': 'No order total available for discount calculation'})
+        
+        # The same code is already applied to the order
+        if order.promo_code == code and order.discount > 0:
+            return JsonResponse({
+                'valid': True,
+                'discount': round(float(order.discount), 2),
+                'final_total': round(float(order.total), 2),
+                'message': f'Promo code applied successfully!'
+            })
+        
+        promo = PromoCode.objects.get(pk=entry['id'])
+        if not user_can_redeem(promo, request.user):
+            return JsonResponse({'valid': False, 'message': 'You have already used this promo code the maximum number of times'})
             
         if promo.discount_type == 'PERCENTAGE':
-            discount = (float(promo.discount_value) / 100) * order_total
             discount_text = f"{promo.discount_value}% off"
         else:
-            discount = min(float(promo.discount_value), order_total)
             discount_text = f"₹{promo.discount_value} off"
             
-        final_total = max(0, order_total - discount)
-        
-        request.session['ticket_order']['total'] = final_total
-        request.session['ticket_order']['discount'] = discount
-        request.session['ticket_order']['promo_code'] = code
-        request.session.modified = True
+        apply_promo_code(order, promo)
         
         return JsonResponse({
             'valid': True,
-            'discount': round(float(discount), 2),
-            'final_total': round(float(final_total), 2),
+            'discount': round(float(order.discount), 2),
+            'final_total': round(float(order.total), 2),
             'discount_text': discount_text,
             'message': f'Promo code applied successfully! {discount_text}'
         })
@@ -995,20 +767,9 @@ def event_pass(request, ticket_id):
         # Ensure ticket has all required fields
         ensure_ticket_integrity(ticket)
 
-        # Generate QR code as base64
-        qr_data = create_signed_ticket_data(ticket)
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_H,
-            box_size=10,
-            border=0,
-        )
-        qr.add_data(qr_data)
-        qr.make(fit=True)
-        qr_img = qr.make_image(fill_color="black", back_color="white").convert('RGBA')
-        buffered = BytesIO()
-        qr_img.save(buffered, format="PNG")
-        qr_code_base64 = base64.b64encode(buffered.getvalue()).decode()
+        # QR code as base64, encoded once per token and then served from the render cache
+        qr_png, _ = get_ticket_qr_png(ticket, border=0)
+        qr_code_base64 = base64.b64encode(qr_png).decode()
 
         # Sponsor logos as list of URLs
         sponsor_logos_list = []
@@ -1061,11 +822,8 @@ def api_download_ticket(request, ticket_id):
             return JsonResponse({'success': False, 'message': 'Ticket type not available'}, status=400)
             
         try:
-            ticket_image = generate_ticket_image(ticket)
-            
-            buffered = BytesIO()
-            ticket_image.save(buffered, format="PNG")
-            img_str = base64.b64encode(buffered.getvalue()).decode()
+            pass_png, _ = get_ticket_pass_png(ticket)
+            img_str = base64.b64encode(pass_png).decode()
             
             return JsonResponse({
                 'success': True,
@@ -1101,20 +859,13 @@ def generate_ticket_image(ticket):
     # Perforated line
     for y in range(0, height, 20):
         draw.rectangle([left_w-2, y, left_w, y+10], fill=accent)
-    # Fonts
-    def load_font(size, bold=False):
-        try:
-            if bold:
-                return ImageFont.truetype("arialbd.ttf", size)
-            return ImageFont.truetype("arial.ttf", size)
-        except:
-            return ImageFont.load_default()
-    font_title = load_font(60, bold=True)
-    font_subtitle = load_font(32)
-    font_label = load_font(20)
-    font_value = load_font(28, bold=True)
-    font_small = load_font(18)
-    font_xs = load_font(14)
+    # Fonts (parsed once per process)
+    font_title = get_font(60, bold=True)
+    font_subtitle = get_font(32)
+    font_label = get_font(20)
+    font_value = get_font(28, bold=True)
+    font_small = get_font(18)
+    font_xs = get_font(14)
     # Event Name
     draw.text((40, 40), event.title, font=font_title, fill=white)
     # Subtitle
@@ -1132,17 +883,9 @@ def generate_ticket_image(ticket):
     sponsor_x = 250
     sponsor_y = 265
     sponsor_size = 60
-    if hasattr(event, 'sponsors'):
-        sponsors = [s for s in event.sponsors.all() if hasattr(s, 'get_logo_url') and s.get_logo_url()]
-        for i, sponsor in enumerate(sponsors[:3]):
-            try:
-                import requests
-                from io import BytesIO as BIO
-                resp = requests.get(sponsor.get_logo_url(), timeout=2)
-                logo_img = Image.open(BIO(resp.content)).convert('RGBA').resize((sponsor_size, sponsor_size))
-                img.paste(logo_img, (sponsor_x + i*(sponsor_size+20), sponsor_y), logo_img)
-            except Exception as e:
-                logger.warning(f"Could not load sponsor logo: {e}")
+    # Logos come pre-decoded from the asset cache; ones still downloading are left out
+    for i, (sponsor, logo_img) in enumerate(get_sponsor_logos(event, limit=3)):
+        img.paste(logo_img, (sponsor_x + i*(sponsor_size+20), sponsor_y), logo_img)
     # Ticketing Partner
     draw.text((40, 350), "TICKETING PARTNER", font=font_label, fill=accent)
     draw.text((250, 350), "TAPNEX", font=font_value, fill=blue)
@@ -1160,16 +903,8 @@ def generate_ticket_image(ticket):
         unique_id = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
         ticket.unique_secure_token = unique_id
         ticket.save()
-    qr_data = create_signed_ticket_data(ticket)
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_H,
-        box_size=10,
-        border=0,
-    )
-    qr.add_data(qr_data)
-    qr.make(fit=True)
-    qr_img = qr.make_image(fill_color="black", back_color="white").convert('RGBA')
+    qr_png, _ = get_ticket_qr_png(ticket, border=0)
+    qr_img = Image.open(BytesIO(qr_png)).convert('RGBA')
     qr_size = 180
     qr_pos = (right_x, 220)
     qr_img = qr_img.resize((qr_size, qr_size))
@@ -1181,6 +916,53 @@ def generate_ticket_image(ticket):
     draw.text((right_x, 460), "This ticket is non-transferable. Management reserves the right of admission.", font=font_xs, fill=accent)
     return img
 
+def render_ticket_qr_png(ticket, border=4):
+    """Encode the signed ticket data as a QR code PNG"""
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_H,
+        box_size=10,
+        border=border,
+    )
+    qr.add_data(create_signed_ticket_data(ticket))
+    qr.make(fit=True)
+    qr_img = qr.make_image(fill_color="black", back_color="white")
+    buffer = BytesIO()
+    qr_img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+def get_ticket_qr_png(ticket, border=4):
+    """Cached QR code PNG for a ticket, returns (bytes, etag)"""
+    return get_or_render(ticket, f'qr-{border}', lambda: render_ticket_qr_png(ticket, border))
+
+def render_ticket_pass_png(ticket):
+    buffer = BytesIO()
+    generate_ticket_image(ticket).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+def get_ticket_pass_png(ticket):
+    """Cached 1200x500 pass PNG for a ticket, returns (bytes, etag). Re-rendered when the event is edited"""
+    return get_or_render(
+        ticket, 'pass', lambda: render_ticket_pass_png(ticket),
+        ticket.ticket_type_id, ticket.event.updated_at.timestamp(), get_sponsor_logos_fingerprint(ticket.event),
+    )
+
+@login_required
+@require_http_methods(["GET"])
+def download_ticket_pass(request, ticket_id):
+    """The pass image as a PNG download, served from the render cache with ETag/Cache-Control"""
+    ticket = get_object_or_404(Ticket.objects.select_related('event', 'ticket_type'), id=ticket_id)
+    if request.user != ticket.customer and request.user.role != 'ADMIN':
+        return HttpResponse(status=403)
+
+    ensure_ticket_integrity(ticket)
+    response = serve_cached_png(
+        request, ticket, 'pass', lambda: render_ticket_pass_png(ticket),
+        ticket.ticket_type_id, ticket.event.updated_at.timestamp(), get_sponsor_logos_fingerprint(ticket.event),
+    )
+    response['Content-Disposition'] = f'inline; filename="ticket_{ticket.ticket_number}.png"'
+    return response
+
 def create_signed_ticket_data(ticket):
     """Create signed ticket data for QR code"""
     if not ticket.ticket_number or len(ticket.ticket_number) < 6:
@@ -1296,7 +1078,7 @@ def send_ticket_email(request, ticket_id):
             base_url = 'https://tickets.tapnex.tech'
         else:
             # Development - fallback to request domain but prefer localhost
-            if 'testserver' in request.get_host():
+            if request is None or 'testserver' in request.get_host():
                 base_url = 'http://localhost:8000'
             else:
                 base_url = request.build_absolute_uri('/').rstrip('/')
@@ -1334,7 +1116,7 @@ def send_ticket_email(request, ticket_id):
 def send_ticket_confirmation_email(ticket, request):
     """
     Sends an automatic ticket confirmation email with online pass link after successful payment.
-    This is called automatically during payment processing.
+    This is called by the send_email background job; request may be None there.
     """
     try:
         # Build the pass URL (secure, only for owner)
@@ -1347,7 +1129,7 @@ def send_ticket_confirmation_email(ticket, request):
             base_url = 'https://tickets.tapnex.tech'
         else:
             # Development - fallback to request domain but prefer localhost
-            if 'testserver' in request.get_host():
+            if request is None or 'testserver' in request.get_host():
                 base_url = 'http://localhost:8000'
             else:
                 base_url = request.build_absolute_uri('/').rstrip('/')
@@ -1395,22 +1177,9 @@ def view_online_ticket(request, unique_id):
         # Ensure ticket has all required fields
         ensure_ticket_integrity(ticket)
         
-        # Generate QR code as base64
-        qr_data = create_signed_ticket_data(ticket)
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_H,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(qr_data)
-        qr.make(fit=True)
-        
-        qr_img = qr.make_image(fill_color="black", back_color="white")
-        buffer = BytesIO()
-        qr_img.save(buffer, format='PNG')
-        qr_code_base64 = base64.b64encode(buffer.getvalue()).decode()
-        qr_code_data_url = f"data:image/png;base64,{qr_code_base64}"
+        # The QR code is served by online_ticket_qr so browsers can cache it (ETag)
+        # instead of receiving a freshly encoded base64 image on every page view
+        qr_code_data_url = reverse('online_ticket_qr', kwargs={'unique_id': ticket.unique_id})
     
         # Prepare sponsor logos
         sponsor_logos_list = []
@@ -1455,17 +1224,23 @@ def view_online_ticket(request, unique_id):
         return redirect('my_tickets')
 
 
+def online_ticket_qr(request, unique_id):
+    """QR code image for the online pass, served from the render cache with ETag/Cache-Control"""
+    ticket = get_object_or_404(Ticket, unique_id=unique_id)
+    ensure_ticket_integrity(ticket)
+    return serve_cached_png(request, ticket, 'qr-4', lambda: render_ticket_qr_png(ticket, 4))
+
+
 @login_required
 def create_cashfree_order(request):
     if request.method == 'POST':
         try:
             print(f"DEBUG: Starting create_cashfree_order")
-            ticket_order = request.session.get('ticket_order', {})
-            print(f"DEBUG: Ticket order from session: {ticket_order}")
-            order_amount = ticket_order.get('total')
+            order = get_session_order(request)
+            order_amount = order.total if order else None
             print(f"DEBUG: Order amount: {order_amount}")
 
-            if not order_amount or float(order_amount) <= 0:
+            if not order_amount or order_amount <= 0:
                 print(f"DEBUG: Invalid order amount: {order_amount}")
                 return JsonResponse({'error': 'Invalid order amount. Please select tickets and try again.'}, status=400)
 
@@ -1499,6 +1274,14 @@ def create_cashfree_order(request):
             customer_name = f"{user.first_name} {user.last_name}".strip() or user.email
             customer_email = user.email
 
+            # Take the promo code slot now so a limited code cannot be redeemed past its cap
+            try:
+                reserve_promo_code(order)
+            except PromoUnavailable as e:
+                logger.info(f"Promo code {order.promo_code} not reserved for order #{order.id}: {e}")
+                apply_promo_code(order, None)
+                return JsonResponse({'error': 'Sorry, this promo code is no longer available. It has been removed from your order, please review the new total.'}, status=409)
+
             # Generate a unique order ID
             order_id = f"order_{uuid_module.uuid4().hex[:12]}"
             
@@ -1513,10 +1296,10 @@ def create_cashfree_order(request):
                 amount=float(order_amount),
                 status='CREATED',
                 payment_gateway=gateway_type,
-                event_id=ticket_order.get('event_id'),
-                quantity=ticket_order.get('total_attendees', 1),
+                event_id=order.event_id,
+                quantity=order.total_attendees,
+                purchase_order=order,
                 response_data={
-                    'ticket_order': ticket_order,
                     'customer_id': customer_id,
                     'customer_email': customer_email,
                     'creation_timestamp': timezone.now().isoformat(),
@@ -1528,50 +1311,57 @@ def create_cashfree_order(request):
             )
             print(f"DEBUG: Payment transaction created: {payment_transaction.id}")
 
+            # Reserve the seats while the customer pays so a sell-out cannot oversell
+            try:
+                place_hold(order.event_id, order.total_attendees, payment_transaction)
+            except CapacityError as e:
+                payment_transaction.status = 'FAILED'
+                payment_transaction.payment_status = 'Error - Capacity'
+                payment_transaction.save()
+                release_promo_code(order)
+                if e.available > 0:
+                    message = f'Sorry, only {e.available} spots are left for this event. Please update your selection.'
+                else:
+                    message = 'Sorry, this event is sold out.'
+                return JsonResponse({'error': message}, status=409)
+
             # Setup return URL with all necessary parameters for proper callback processing
             return_url = request.build_absolute_uri(reverse('payment_status')) + \
-                        f"?order_id={{order_id}}&session_order_id={order_id}&" + \
+                        f"?order_id={{order_id}}&" + \
                         f"payment_status={{payment_status}}&transaction_id={{transaction_id}}"
 
             # Create order request for Cashfree API
-            create_order_request = CreateOrderRequest(
-                order_amount=float(order_amount),
-                order_currency="INR",
-                customer_details=CustomerDetails(
-                    customer_id=customer_id,
-                    customer_name=customer_name,
-                    customer_email=customer_email,
-                    customer_phone=customer_phone,
-                ),
-                order_meta=OrderMeta(
-                    return_url=return_url,
+            create_order_request = {
+                'order_id': order_id,
+                'order_amount': float(order_amount),
+                'order_currency': 'INR',
+                'customer_details': {
+                    'customer_id': customer_id,
+                    'customer_name': customer_name,
+                    'customer_email': customer_email,
+                    'customer_phone': customer_phone,
+                },
+                'order_meta': {
+                    'return_url': return_url,
                     # Send server-to-server notifications to the dedicated webhook, not the user-facing callback
-                    notify_url=request.build_absolute_uri(reverse('cashfree_webhook'))
-                ),
-                order_id=order_id
-            )
+                    'notify_url': request.build_absolute_uri(reverse('cashfree_webhook')),
+                },
+            }
             print(f"DEBUG: Create order request prepared")
-            
-            # Store the ticket order in the session for retrieval during payment callback
-            request.session[order_id] = ticket_order
-            request.session.modified = True
-            print(f"DEBUG: Ticket order stored in session")
 
             try:
                 # Make API call to create payment order
                 print(f"DEBUG: Sending create order request to Cashfree for order: {order_id}")
-                api_response = Cashfree().PGCreateOrder(
-                    x_api_version=CASHFREE_API_VERSION,
-                    create_order_request=create_order_request,
-                )
+                # Shared keep-alive client: no new TLS handshake per payment
+                api_response = get_cashfree_gateway().create_order(create_order_request)
                 print(f"DEBUG: Cashfree API response received")
                 
                 # Handle API response
-                if hasattr(api_response, 'data') and api_response.data:
+                if api_response and api_response.get('payment_session_id'):
                     # Extract and save important data from the response
-                    payment_session_id = getattr(api_response.data, 'payment_session_id', None)
-                    cf_order_id = getattr(api_response.data, 'order_id', None)
-                    payment_link = getattr(api_response.data, 'payment_link', None)
+                    payment_session_id = api_response.get('payment_session_id')
+                    cf_order_id = api_response.get('order_id')
+                    payment_link = api_response.get('payment_link')
                     
                     # Update the transaction record with API response details
                     payment_transaction.response_data = {
@@ -1595,8 +1385,24 @@ def create_cashfree_order(request):
                     return JsonResponse(response_data)
                 else:
                     print(f"DEBUG: Invalid response from Cashfree for order {order_id}: {api_response}")
+                    release_reservations(payment_transaction)
                     return JsonResponse({'error': 'Invalid response from payment gateway'}, status=500)
 
+            except GatewayUnavailable as e:
+                # Gateway down or circuit open: fail fast and let the customer retry shortly
+                logger.error(f"Cashfree unavailable while creating order {order_id}: {str(e)}")
+                payment_transaction.status = 'FAILED'
+                payment_transaction.response_data = {
+                    **payment_transaction.response_data,
+                    'error': str(e),
+                    'error_timestamp': timezone.now().isoformat()
+                }
+                payment_transaction.save()
+                release_reservations(payment_transaction)
+                response = JsonResponse({'error': 'The payment gateway is temporarily unavailable. Please try again in a minute.'}, status=503)
+                response['Retry-After'] = str(getattr(settings, 'CASHFREE_BREAKER_RESET_SECONDS', 30))
+                return response
+
             except Exception as e:
                 print(f"DEBUG: Cashfree order creation failed for order {order_id}: {str(e)}")
                 import traceback
@@ -1609,6 +1415,7 @@ def create_cashfree_order(request):
                     'error_timestamp': timezone.now().isoformat()
                 }
                 payment_transaction.save()
+                release_reservations(payment_transaction)
                 return JsonResponse({'error': f'Payment gateway error: {str(e)}'}, status=500)
 
         except Exception as outer_e:
@@ -1623,7 +1430,6 @@ def create_cashfree_order(request):
 @csrf_exempt
 def payment_status(request):
     cashfree_order_id = request.GET.get('order_id')
-    session_order_id = request.GET.get('session_order_id')
 
     # Cashfree may not substitute unknown placeholders; sanitize placeholder values like "{payment_status}"
     raw_payment_status = request.GET.get('payment_status', '')
@@ -1639,93 +1445,33 @@ def payment_status(request):
     # Log all received parameters for debugging
     logger.info(f"Payment callback received - order_id: {cashfree_order_id}, payment_status: {payment_status_param}, transaction_id: {transaction_id}")
 
-    ticket_order = request.session.get(session_order_id)
-
-    if not ticket_order:
-        logger.warning(f"No ticket_order found in session for order_id: {cashfree_order_id}")
-        # Instead of redirecting immediately, try to fetch payment transaction and verify status again
-        try:
-            payment_transaction = PaymentTransaction.objects.get(order_id=cashfree_order_id)
-            logger.info(f"Found payment transaction for expired session order {cashfree_order_id} with status {payment_transaction.status}")
-            
-            if payment_transaction.status == 'SUCCESS':
-                # Check if tickets exist for this transaction
-                recent_tickets = Ticket.objects.filter(
-                    purchase_transaction=payment_transaction
-                ).select_related('event', 'ticket_type')
-                
-                if recent_tickets.exists():
-                    # Tickets already exist, show success page
-                    messages.info(request, "Your payment was already processed successfully.")
-                    return render(request, 'core/payment_success.html', {
-                        'order_id': cashfree_order_id,
-                        'transaction_id': payment_transaction.transaction_id,
-                        'recent_tickets': recent_tickets,
-                    })
-                else:
-                    # Payment successful but no tickets created - recover ticket_order from transaction data
-                    response_data = payment_transaction.response_data or {}
-                    ticket_order = response_data.get('ticket_order', {})
-                    
-                    if ticket_order:
-                        logger.info(f"Recovered ticket_order from transaction data for {cashfree_order_id}")
-                        # Continue with normal ticket creation process below
-                    else:
-                        messages.error(request, "Your session has expired and we cannot recover your order details. Please contact support with your order ID.")
-                        return redirect('home')
-            else:
-                messages.error(request, "Your payment status is not successful. Please contact support.")
-                return redirect('home')
-        except PaymentTransaction.DoesNotExist:
-            messages.error(request, "Your session has expired. Please contact support if payment was deducted.")
-            return redirect('home')
-
-    # Get or create the payment transaction record
-    payment_transaction = None
+    # The order is stored with the transaction, so an expired session no longer loses it
     try:
         payment_transaction = PaymentTransaction.objects.get(order_id=cashfree_order_id)
-        logger.info(f"Found existing transaction record for order {cashfree_order_id}, status: {payment_transaction.status}")
+    except PaymentTransaction.DoesNotExist:
+        logger.warning(f"No transaction record found for order {cashfree_order_id}")
+        messages.error(request, "We could not find your order. Please contact support if payment was deducted.")
+        return redirect('home')
+    logger.info(f"Found existing transaction record for order {cashfree_order_id}, status: {payment_transaction.status}")
 
-        # If payment was already successfully processed, don't process again
-        if payment_transaction.status == 'SUCCESS':
-            logger.info(f"Transaction {cashfree_order_id} was already marked as successful, showing success page")
-            messages.info(request, "Your payment was already processed successfully.")
+    event_id = payment_transaction.event_id
 
-            # Get the tickets that were created for this transaction
-            recent_tickets = Ticket.objects.filter(
-                purchase_transaction=payment_transaction
-            ).select_related('event', 'ticket_type')
-            
-            # Fix any tickets with missing unique_id
-            for ticket in recent_tickets:
-                if not ticket.unique_id:
-                    ticket.unique_id = uuid_module.uuid4()
-                    if not ticket.unique_secure_token:
-                        ticket.unique_secure_token = str(uuid_module.uuid4())
-                    ticket.save()
-                    logger.info(f"Fixed missing unique_id for ticket {ticket.id} from transaction {cashfree_order_id}")
+    # If payment was already successfully processed, don't process again
+    if payment_transaction.status == 'SUCCESS':
+        recent_tickets = Ticket.objects.filter(
+            purchase_transaction=payment_transaction
+        ).select_related('event', 'ticket_type')
 
+        if recent_tickets:
+            logger.info(f"Transaction {cashfree_order_id} was already marked as successful, showing success page")
+            messages.info(request, "Your payment was already processed successfully.")
+            forget_order(request)
             return render(request, 'core/payment_success.html', {
                 'order_id': cashfree_order_id,
                 'transaction_id': payment_transaction.transaction_id,
                 'recent_tickets': recent_tickets,
             })
-    except PaymentTransaction.DoesNotExist:
-        logger.info(f"No transaction record found for order {cashfree_order_id}, creating new record")
-        # Set payment gateway to 'SANDBOX' if in debug mode to distinguish test transactions
-        gateway_type = 'SANDBOX' if settings.DEBUG else 'Cashfree'
-        payment_transaction = PaymentTransaction.objects.create(
-            user=request.user,
-            order_id=cashfree_order_id,
-            transaction_id=transaction_id,
-            amount=float(ticket_order.get('total', 0)),
-            status='PENDING',
-            payment_gateway=gateway_type,
-            response_data={
-                'initial_callback_params': dict(request.GET.items()),
-                'environment': 'SANDBOX' if settings.DEBUG else 'PRODUCTION'
-            }
-        )
+        # Paid but no tickets yet: continue below, issuing is idempotent
 
     try:
         # Verify payment status with Cashfree servers
@@ -1750,31 +1496,11 @@ def payment_status(request):
                 logger.error("Missing Cashfree credentials")
                 raise ValueError("Cashfree credentials not configured")
             
-            # Use direct HTTP request to avoid SDK header issues
-            import requests
-            
-            # Set up API endpoint based on environment
-            if settings.DEBUG:
-                base_url = "https://sandbox.cashfree.com/pg"
-                logger.info("Using SANDBOX environment for payment verification")
-            else:
-                base_url = "https://api.cashfree.com/pg"
-                logger.info("Using PRODUCTION environment for payment verification")
-            
-            endpoint = f"{base_url}/orders/{cashfree_order_id}"
-            
-            headers = {
-                "Accept": "application/json",
-                "x-api-version": str(CASHFREE_API_VERSION),
-                "x-client-id": str(settings.CASHFREE_CLIENT_ID),
-                "x-client-secret": str(settings.CASHFREE_CLIENT_SECRET)
-            }
-            
-            response = requests.get(endpoint, headers=headers, timeout=30)
-            
-            if response.status_code == 200:
-                order_data = response.json()
-                
+            # Shared keep-alive client with timeouts, retries and a circuit breaker. If the
+            # gateway is unavailable the callback parameters below decide the outcome instead
+            order_data = get_cashfree_gateway().get_order(cashfree_order_id)
+
+            if order_data:
                 # Extract payment details from API response
                 api_order_status = order_data.get('order_status', '').upper()
                 api_payment_status = ''  # Not always available in order details
@@ -1809,15 +1535,14 @@ def payment_status(request):
                         'raw_response': order_data
                     }
                 }
-                payment_transaction.save()
+                payment_transaction.save(update_fields=['response_data', 'updated_at'])
                 
                 # Update transaction ID if available from API
                 if api_transaction_id:
                     payment_transaction.transaction_id = api_transaction_id
                     
             else:
-                logger.error(f"Cashfree API returned {response.status_code}: {response.text}")
-                raise Exception(f"API returned {response.status_code}: {response.text}")
+                raise Exception("Empty response from Cashfree order lookup")
                 
         except Exception as e:
             logger.error(f"Error verifying payment with Cashfree API: {e}")
@@ -1826,7 +1551,7 @@ def payment_status(request):
                 'api_error': str(e),
                 'api_error_timestamp': timezone.now().isoformat(),
             }
-            payment_transaction.save()
+            payment_transaction.save(update_fields=['response_data', 'updated_at'])
 
         # Store response data for auditing
         if order_details and hasattr(order_details, 'data'):
@@ -1847,7 +1572,7 @@ def payment_status(request):
                     'verification_timestamp': timezone.now().isoformat(),
                 }
             }
-            payment_transaction.save()
+            payment_transaction.save(update_fields=['response_data', 'transaction_id', 'updated_at'])
 
             logger.info(f"API verification result - Order status: {api_order_status}, Payment status: {api_payment_status}")
 
@@ -1890,39 +1615,38 @@ def payment_status(request):
             'verification_source': verification_source,
             'verification_timestamp': timezone.now().isoformat(),
         }
-        payment_transaction.save()
+        payment_transaction.save(update_fields=['response_data', 'updated_at'])
 
         # Step 4: Handle failed/cancelled/unknown payments
         if not payment_verified:
             # If we couldn't verify via API and callback didn't provide a definitive status,
             # don't mark as failed; keep it pending and show a processing page.
             if verification_source is None:
-                payment_transaction.status = 'PENDING'
-                payment_transaction.save()
+                # Conditional so a webhook that already settled the order is not overwritten
+                PaymentTransaction.objects.filter(pk=payment_transaction.pk, status='CREATED').update(status='PENDING')
                 messages.info(request, "We're processing your payment. This can take a few seconds. If this page doesn't update automatically, please refresh after 10–20 seconds. If money was deducted but the status doesn't change, contact support with your Order ID.")
                 context = {
                     'order_id': cashfree_order_id,
-                    'event_id': ticket_order['event_id'],
+                    'event_id': event_id,
                     'failure_reason': 'PENDING'
                 }
                 return render(request, 'core/payment_failed.html', context)
 
             # Update payment status based on specific failure reason if available
             if payment_status_param == 'CANCELLED' or api_order_status == 'CANCELLED' or api_payment_status == 'CANCELLED':
-                payment_transaction.status = 'CANCELLED'
+                outcome = 'CANCELLED'
                 failure_message = "Payment was cancelled. No tickets have been booked."
             else:
-                payment_transaction.status = 'FAILED'
+                outcome = 'FAILED'
                 failure_message = "Payment was not completed successfully. No tickets have been booked."
 
-            payment_transaction.save()
+            # Same locked state machine as the webhook processor (also releases the capacity hold)
+            payment_transaction, _ = apply_payment_outcome(cashfree_order_id, outcome, source='redirect')
 
             messages.error(request, failure_message)
             logger.warning(f"Payment failed/cancelled for order {cashfree_order_id} - Status set to {payment_transaction.status}")
 
-            # Clean up the session but keep the ticket order so user can try again
-            if session_order_id in request.session:
-                del request.session[session_order_id]
+            # Keep the order in the session so the user can try paying again
 
             # Render payment failed page
             # Determine the failure reason from the appropriate source
@@ -1933,162 +1657,39 @@ def payment_status(request):
                 
             context = {
                 'order_id': cashfree_order_id,
-                'event_id': ticket_order['event_id'],
+                'event_id': event_id,
                 'failure_reason': failure_reason
             }
             return render(request, 'core/payment_failed.html', context)
         
-        # Step 5: Process successful payment and create tickets
-        with transaction.atomic():
-            # Update payment status first
-            payment_transaction.status = 'SUCCESS'
-            if transaction_id and not payment_transaction.transaction_id:
-                payment_transaction.transaction_id = transaction_id
-            payment_transaction.save()
-            
-            logger.info(f"Payment marked as successful for order {cashfree_order_id}")
-            
-            # Check if tickets were already created for this transaction to avoid duplicates
-            existing_tickets = Ticket.objects.filter(
-                purchase_transaction_id=payment_transaction.id
-            )
-            
-            # Get event for promo code processing
-            event_id = ticket_order['event_id']
-            event = get_object_or_404(Event, id=event_id)
-            
-            if existing_tickets.exists():
-                logger.info(f"{existing_tickets.count()} tickets already created for transaction {payment_transaction.id}, skipping creation")
-                recent_tickets = existing_tickets.select_related('event', 'ticket_type')
-            else:
-                logger.info(f"Creating new tickets for verified payment {cashfree_order_id}")
-                selected_tickets = ticket_order.get('ticket_types', [])
-                
-                created_tickets = []
-                for ticket_data in selected_tickets:
-                    ticket_type = get_object_or_404(TicketType, id=ticket_data['id'])
-                    
-                    # Calculate consolidated ticket details
-                    attendees_per_ticket = ticket_type.attendees_per_ticket or 1
-                    booking_quantity = ticket_data['quantity']
-                    total_admissions = booking_quantity * attendees_per_ticket
-                    
-                    # Create single consolidated ticket instead of multiple tickets
-                    ticket = Ticket.objects.create(
-                        event=event,
-                        ticket_type=ticket_type,
-                        customer=request.user,
-                        ticket_number=generate_ticket_number(),
-                        status='SOLD',
-                        purchase_date=timezone.now(),
-                        unique_secure_token=str(uuid_module.uuid4()),
-                        unique_id=uuid_module.uuid4(),  # Ensure unique_id is set for email URLs
-                        purchase_transaction=payment_transaction,  # Link ticket to transaction
-                        booking_quantity=booking_quantity,
-                        total_admission_count=total_admissions
-                    )
-                    created_tickets.append(ticket)
-
-                # Update payment transaction with ticket information
-                payment_transaction.response_data = {
-                    **(payment_transaction.response_data or {}),
-                    'tickets_created': [t.id for t in created_tickets],
-                    'ticket_count': len(created_tickets),
-                    'ticket_creation_timestamp': timezone.now().isoformat()
-                }
-                payment_transaction.save()
-                
-                # Store tickets for display
-                recent_tickets = Ticket.objects.filter(id__in=[t.id for t in created_tickets]).select_related('event', 'ticket_type')
-
-            # Handle promo code if used (moved outside ticket creation to ensure it always runs)
-            promo_code_str = ticket_order.get('promo_code')
-            if promo_code_str:
-                try:
-                    # Check if promo code usage already exists for this transaction to avoid duplicates
-                    existing_usage = PromoCodeUsage.objects.filter(
-                        promo_code__code=promo_code_str,
-                        user=request.user,
-                        ticket__purchase_transaction=payment_transaction
-                    ).first()
-                    
-                    if not existing_usage:
-                        promo_code = PromoCode.objects.get(code=promo_code_str, event=event)
-                        # Only increment current_uses after successful payment verification
-                        # This ensures promo code analytics only reflect actual successful purchases
-                        promo_code.current_uses += 1
-                        promo_code.save()
-                        
-                        PromoCodeUsage.objects.create(
-                            promo_code=promo_code,
-                            user=request.user,
-                            ticket=recent_tickets.first() if recent_tickets else None,
-                            order_total=ticket_order.get('subtotal', 0),
-                            discount_amount=ticket_order.get('discount', 0)
-                        )
-                        
-                        logger.info(f"Promo code {promo_code_str} applied successfully for order {cashfree_order_id}")
-                    else:
-                        logger.info(f"Promo code usage already recorded for order {cashfree_order_id}")
-                except Exception as e:
-                    logger.error(f"Error processing promo code: {str(e)}")
-                    # Don't fail the whole transaction if promo code processing fails
-
-        # Generate invoices for each ticket
-        from .invoice_utils import create_invoice_for_ticket, send_invoice_email
-        
-        invoices_generated = 0
-        tickets_emailed = 0
-        
-        for ticket in recent_tickets:
-            try:
-                # Create invoice record
-                invoice = create_invoice_for_ticket(ticket, payment_transaction)
-                
-                if invoice:
-                    # Send invoice email with PDF attachment
-                    email_sent = send_invoice_email(invoice)
-                    
-                    if email_sent:
-                        invoices_generated += 1
-                        logger.info(f"Invoice #{invoice.invoice_number} generated and sent for ticket {ticket.ticket_number}")
-                    else:
-                        logger.error(f"Failed to send invoice email for ticket {ticket.ticket_number}")
-                        
-            except Exception as e:
-                logger.error(f"Error generating invoice for ticket {ticket.ticket_number}: {str(e)}")
-                logger.error(traceback_module.format_exc())
-            
-            # Send ticket confirmation email with online pass link
-            try:
-                ticket_email_sent = send_ticket_confirmation_email(ticket, request)
-                if ticket_email_sent:
-                    tickets_emailed += 1
-                    logger.info(f"Ticket confirmation email sent for ticket {ticket.ticket_number}")
-                else:
-                    logger.error(f"Failed to send ticket confirmation email for ticket {ticket.ticket_number}")
-            except Exception as e:
-                logger.error(f"Error sending ticket confirmation email for ticket {ticket.ticket_number}: {str(e)}")
-                logger.error(traceback_module.format_exc())
-        
+        # Step 5: Mark the order paid and issue its tickets. This takes the same
+        # PaymentTransaction row lock as the webhook processor, so whichever runs
+        # first issues the tickets and the other one finds them.
+        payment_transaction, _ = apply_payment_outcome(
+            cashfree_order_id,
+            'SUCCESS',
+            transaction_id=transaction_id,
+            source='redirect',
+        )
+        recent_tickets = Ticket.objects.filter(
+            purchase_transaction=payment_transaction
+        ).select_related('event', 'ticket_type')
+
         # Clean up the session
-        if session_order_id in request.session:
-            del request.session[session_order_id]
-        if 'ticket_order' in request.session:
-            del request.session['ticket_order']
+        forget_order(request)
         
-        logger.info(f"Successfully processed payment, created {recent_tickets.count()} tickets, sent {invoices_generated} invoices, and sent {tickets_emailed} ticket confirmation emails for order {cashfree_order_id}")
+        logger.info(f"Successfully processed payment, {recent_tickets.count()} tickets issued for order {cashfree_order_id}")
         messages.success(request, "Payment successful and tickets booked! Check your email for ticket confirmation and invoice. You can also view them in 'My Tickets'.")
 
     except Exception as e:
-        # Update payment status to failed
+        # Record the error; a paid order stays SUCCESS so it can still be issued or refunded
         if payment_transaction:
-            payment_transaction.status = 'FAILED'
             payment_transaction.response_data = {
                 **(payment_transaction.response_data or {}),
                 'processing_error': str(e)
             }
-            payment_transaction.save()
+            payment_transaction.save(update_fields=['response_data', 'updated_at'])
+            PaymentTransaction.objects.filter(pk=payment_transaction.pk).exclude(status='SUCCESS').update(status='FAILED')
             
         logger.error(f"Error creating tickets after payment for order {cashfree_order_id}: {e}")
         logger.error(traceback_module.format_exc())  # Log the full stack trace
@@ -2097,7 +1698,7 @@ def payment_status(request):
         # Render payment failed page with error context
         context = {
             'order_id': cashfree_order_id,
-            'event_id': ticket_order.get('event_id'),
+            'event_id': event_id,
             'error_message': "There was a technical error processing your payment. Please contact support."
         }
         return render(request, 'core/payment_failed.html', context)
@@ -2149,191 +1750,14 @@ def verify_cashfree_signature(payload, signature, timestamp):
     
     return is_valid
 
-# --- TICKET CREATION FOR PAYMENTTRANSACTION ---
-def create_tickets_for_payment(transaction):
-    """
-    Create tickets for a successful PaymentTransaction.
-    This function is idempotent: it will not create duplicate tickets if already created.
-    """
-    from .models import Ticket, Event
-    from django.db import transaction as db_transaction
-    
-    if transaction.status != 'SUCCESS':
-        raise ValueError('Transaction must be marked as SUCCESS before creating tickets.')
-    
-    # Check if tickets already exist for this transaction
-    existing_tickets = Ticket.objects.filter(purchase_transaction=transaction)
-    if existing_tickets.exists():
-        return list(existing_tickets)
-    
-    # Get ticket order data from response_data
-    ticket_order = transaction.response_data.get('ticket_order', {})
-    if not ticket_order:
-        raise ValueError('No ticket order data found in transaction response_data.')
-    
-    event_id = ticket_order.get('event_id')
-    ticket_types = ticket_order.get('ticket_types', {})
-    # Fix: handle ticket_types as list or dict
-    if isinstance(ticket_types, list):
-        # Convert list of dicts like [{'id': 5, 'quantity': 2}, ...] to {5: 2, ...}
-        try:
-            ticket_types_dict = {}
-            for entry in ticket_types:
-                if isinstance(entry, dict) and 'id' in entry and 'quantity' in entry:
-                    ticket_types_dict[entry['id']] = entry['quantity']
-            ticket_types = ticket_types_dict
-        except Exception as e:
-            logger.error(f"ticket_types is a list but could not convert to dict: {e}")
-            ticket_types = {}
-    elif not isinstance(ticket_types, dict):
-        logger.error(f"ticket_types is not a dict or list: {type(ticket_types)}")
-        ticket_types = {}
-    total_attendees = ticket_order.get('total_attendees', 1)
-    
-    if not event_id:
-        raise ValueError('No event_id found in ticket order data.')
-    
-    # Get the event
-    try:
-        event = Event.objects.get(id=event_id)
-    except Event.DoesNotExist:
-        raise ValueError(f'Event with id {event_id} does not exist.')
-    
-    # Check event capacity
-    with db_transaction.atomic():
-        event.refresh_from_db()
-        if hasattr(event, 'remaining_attendee_capacity'):
-            remaining = event.remaining_attendee_capacity
-        else:
-            # Fallback: calculate manually
-            sold = Ticket.objects.filter(event=event, status__in=['SOLD', 'VALID']).count()
-            remaining = max(0, event.capacity - sold)
-        
-        if total_attendees > remaining:
-            transaction.payment_status = 'Error - Capacity'
-            transaction.save()
-            raise ValueError(f'Not enough event capacity to create tickets. Need {total_attendees}, available {remaining}.')
-        
-        # Create tickets based on ticket types
-        tickets = []
-        for ticket_type_id, quantity in ticket_types.items():
-            if quantity > 0:
-                try:
-                    ticket_type = event.ticket_types.get(id=ticket_type_id)
-                    
-                    # Calculate consolidated ticket details
-                    attendees_per_ticket = ticket_type.attendees_per_ticket or 1
-                    booking_quantity = quantity
-                    total_admissions = booking_quantity * attendees_per_ticket
-                    
-                    # Create single consolidated ticket instead of multiple tickets
-                    ticket_code = str(uuid_module.uuid4())[:10].upper()
-                    ticket = Ticket.objects.create(
-                        purchase_transaction=transaction,
-                        event=event,
-                        ticket_type=ticket_type,
-                        customer=transaction.user,
-                        ticket_number=ticket_code,
-                        status='SOLD',
-                        purchase_date=timezone.now(),
-                        unique_id=uuid_module.uuid4(),  # Ensure unique_id is set for email URLs
-                        unique_secure_token=str(uuid_module.uuid4()),  # Also set secure token
-                        booking_quantity=booking_quantity,
-                        total_admission_count=total_admissions
-                    )
-                    tickets.append(ticket)
-                except Exception as e:
-                    logger.error(f"Error creating ticket for type {ticket_type_id}: {str(e)}")
-                    raise
-        
-        # Update event tickets_sold if present
-        if hasattr(event, 'tickets_sold'):
-            event.tickets_sold = event.tickets_sold + total_attendees
-            event.save()
-        
-        logger.info(f"Created {len(tickets)} tickets for transaction {transaction.order_id}")
-        
-        # Handle promo code if used
-        promo_code_str = ticket_order.get('promo_code')
-        if promo_code_str and tickets:
-            try:
-                # Check if promo code usage already exists for this transaction to avoid duplicates
-                existing_usage = PromoCodeUsage.objects.filter(
-                    promo_code__code=promo_code_str,
-                    user=transaction.user,
-                    ticket__purchase_transaction=transaction
-                ).first()
-                
-                if not existing_usage:
-                    promo_code = PromoCode.objects.get(code=promo_code_str, event=event)
-                    # Only increment current_uses for successful transactions
-                    # This ensures promo code analytics only reflect actual successful purchases
-                    promo_code.current_uses += 1
-                    promo_code.save()
-                    
-                    PromoCodeUsage.objects.create(
-                        promo_code=promo_code,
-                        user=transaction.user,
-                        ticket=tickets[0],  # Link to first ticket
-                        order_total=ticket_order.get('subtotal', 0),
-                        discount_amount=ticket_order.get('discount', 0)
-                    )
-                    
-                    logger.info(f"Promo code {promo_code_str} applied successfully for transaction {transaction.order_id}")
-                else:
-                    logger.info(f"Promo code usage already recorded for transaction {transaction.order_id}")
-            except PromoCode.DoesNotExist:
-                logger.error(f"Promo code {promo_code_str} does not exist for event {event.id}")
-            except Exception as e:
-                logger.error(f"Error processing promo code: {str(e)}")
-                # Don't fail the whole transaction if promo code processing fails
-        
-        # Send emails for all created tickets
-        from django.test import RequestFactory
-        from .invoice_utils import create_invoice_for_ticket, send_invoice_email
-        
-        factory = RequestFactory()
-        request = factory.get('/')
-        request.user = transaction.user
-        
-        invoices_generated = 0
-        tickets_emailed = 0
-        
-        for ticket in tickets:
-            try:
-                # Send invoice email
-                invoice = create_invoice_for_ticket(ticket, transaction)
-                if invoice:
-                    if send_invoice_email(invoice):
-                        invoices_generated += 1
-                        logger.info(f"Invoice email sent for ticket {ticket.ticket_number}")
-                    else:
-                        logger.error(f"Failed to send invoice email for ticket {ticket.ticket_number}")
-                else:
-                    logger.error(f"Failed to create invoice for ticket {ticket.ticket_number}")
-            except Exception as e:
-                logger.error(f"Error sending invoice email for ticket {ticket.ticket_number}: {str(e)}")
-                
-            try:
-                # Send ticket confirmation email
-                if send_ticket_confirmation_email(ticket, request):
-                    tickets_emailed += 1
-                    logger.info(f"Ticket confirmation email sent for ticket {ticket.ticket_number}")
-                else:
-                    logger.error(f"Failed to send ticket confirmation email for ticket {ticket.ticket_number}")
-            except Exception as e:
-                logger.error(f"Error sending ticket confirmation email for ticket {ticket.ticket_number}: {str(e)}")
-        
-        logger.info(f"Email summary for transaction {transaction.order_id}: {invoices_generated} invoices sent, {tickets_emailed} ticket confirmations sent")
-        
-        return tickets
-
 # --- CASHFREE WEBHOOK HANDLER ---
 from django.views.decorators.csrf import csrf_exempt
 @csrf_exempt
 def cashfree_webhook(request):
     """
     Handles incoming webhook notifications from Cashfree Payments for PaymentTransaction.
+    The delivery is only verified and stored in the WebhookInbox here; the process_webhook
+    job applies it to the order, so retries are acknowledged without touching the order.
     """
     if request.method != 'POST':
         return HttpResponse(status=405)
@@ -2344,51 +1768,14 @@ def cashfree_webhook(request):
         return HttpResponse(status=401)
     try:
         data = json.loads(raw_payload)
-        payment_data = data.get('data', {}).get('payment', {})
-        order_data = data.get('data', {}).get('order', {})
-        payment_status = payment_data.get('payment_status')
-        order_id = order_data.get('order_id')
-        cf_payment_id = payment_data.get('cf_payment_id')
-        # Find the PaymentTransaction by order_id
-        from .models import PaymentTransaction
-        try:
-            transaction = PaymentTransaction.objects.get(order_id=order_id)
-        except PaymentTransaction.DoesNotExist:
-            return HttpResponse(status=404)
-        # Prevent duplicate processing
-        if transaction.status == 'SUCCESS':
-            return HttpResponse(status=200)
-        
-        if payment_status == 'SUCCESS':
-            transaction.status = 'SUCCESS'
-            transaction.payment_status = 'Paid'
-            transaction.cf_payment_id = cf_payment_id
-            transaction.save()
-            try:
-                tickets = create_tickets_for_payment(transaction)
-                logger.info(f"Successfully created {len(tickets)} tickets for transaction {order_id}")
-                
-                # Verify all tickets have unique_id set
-                for ticket in tickets:
-                    if not ticket.unique_id or not ticket.unique_secure_token:
-                        if not ticket.unique_id:
-                            ticket.unique_id = uuid_module.uuid4()
-                        if not ticket.unique_secure_token:
-                            ticket.unique_secure_token = str(uuid_module.uuid4())
-                        ticket.save()
-                        logger.info(f"Fixed missing unique_id or unique_secure_token for ticket {ticket.id} from transaction {order_id}")
-            except Exception as e:
-                logger.error(f"Error creating tickets for transaction {order_id}: {str(e)}")
-                # Continue processing - don't fail the webhook
-        elif payment_status in ['FAILED', 'USER_DROPPED', 'CANCELLED']:
-            transaction.status = 'FAILED'
-            transaction.payment_status = 'Failed'
-            transaction.save()
-        # Always acknowledge receipt
-        return HttpResponse(status=200)
-    except Exception as e:
-        logger.error(f"Error processing webhook for order {order_id}: {str(e)}")
+        if not isinstance(data, dict):
+            raise ValueError('Webhook payload is not an object')
+        record_webhook_delivery(data, request.headers, raw_payload)
+    except ValueError as e:
+        logger.error(f"Rejected malformed Cashfree webhook: {str(e)}")
         return HttpResponse(status=400)
+    # Always acknowledge receipt
+    return HttpResponse(status=200)
 
 def payment_failed(request):
     return render(request, 'core/payment_failed.html')
@@ -2399,71 +1786,33 @@ def payment_failed(request):
 def event_dashboard(request, event_id):
     event = get_object_or_404(Event, id=event_id, organizer=request.user)
     
-    # Calculate total revenue
-    sold_tickets = Ticket.objects.filter(event=event, status='SOLD').select_related('ticket_type')
-    total_revenue = sum(ticket.ticket_type.price for ticket in sold_tickets)
-    
-    # Calculate tickets sold and remaining
-    tickets_sold = sold_tickets.count()
-    tickets_remaining = event.capacity - tickets_sold
-    
-    # Get ticket sales over time (for the line chart)
-    # Group by date and count
-    sales_by_date = {}
-    tickets_by_type = {}
-    
-    # Initialize ticket types
-    for ticket_type in event.ticket_types.all():
-        tickets_by_type[ticket_type.id] = {
-            'name': ticket_type.type_name,
-            'count': 0,
-            'revenue': 0
-        }
-    
-    # Process ticket data for charts
-    for ticket in sold_tickets:
-        # For sales over time
-        purchase_date = ticket.purchase_date.date() if ticket.purchase_date else timezone.now().date()
-        date_str = purchase_date.strftime('%Y-%m-%d')
-        if date_str not in sales_by_date:
-            sales_by_date[date_str] = 0
-        sales_by_date[date_str] += 1
-        
-        # For ticket type breakdown
-        if ticket.ticket_type and ticket.ticket_type.id in tickets_by_type:
-            tickets_by_type[ticket.ticket_type.id]['count'] += 1
-            tickets_by_type[ticket.ticket_type.id]['revenue'] += float(ticket.ticket_type.price)
-    
-    # Convert to sorted lists for charts
-    sales_dates = sorted(sales_by_date.keys())
-    sales_counts = [sales_by_date[date] for date in sales_dates]
-    
-    # Format dates for display
-    formatted_dates = []
-    for date_str in sales_dates:
-        try:
-            date_obj = dt.strptime(date_str, '%Y-%m-%d')
-            formatted_dates.append(date_obj.strftime('%b %d'))
-        except ValueError:
-            # In case of invalid date string, use a placeholder
-            formatted_dates.append('Unknown')
-    
-    # Format ticket type data for pie chart
-    ticket_types_data = list(tickets_by_type.values())
-    
     context = {
         'event': event,
-        'total_revenue': total_revenue,
-        'tickets_sold': tickets_sold,
-        'tickets_remaining': tickets_remaining,
-        'sales_dates': formatted_dates,
-        'sales_counts': sales_counts,
-        'ticket_types_data': ticket_types_data,
+        'occupancy_poll_seconds': getattr(settings, 'OCCUPANCY_POLL_SECONDS', 10),
+        **get_event_dashboard_stats(event),
     }
     
     return render(request, 'core/event_dashboard.html', context)
 
 
+@login_required
+@user_passes_test(lambda u: u.role in ['ORGANIZER', 'ADMIN'])
+def api_event_occupancy(request, event_id):
+    """
+    Live gate occupancy for an event as JSON, read from the check-in counters.
+    Answers straight away; the dashboard polls it every OCCUPANCY_POLL_SECONDS
+    rather than holding a (serverless) request open until the next check-in.
+    """
+    events = Event.objects.all()
+    if request.user.role != 'ADMIN':
+        events = events.filter(Q(organizer=request.user) | Q(staff__user=request.user, staff__role='ORGANIZER')).distinct()
+    event = get_object_or_404(events, id=event_id)
+
+    response = JsonResponse(get_occupancy(event))
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
 @login_required
 @user_passes_test(lambda u: u.role == 'ORGANIZER')
 def download_organizer_report(request):
@@ -2474,12 +1823,7 @@ def download_organizer_report(request):
     events = Event.objects.filter(organizer=request.user)
     
     # Check if there's any data to report
-    has_data = False
-    for event in events:
-        tickets = Ticket.objects.filter(event=event).exists()
-        if tickets:
-            has_data = True
-            break
+    has_data = Ticket.objects.filter(event__organizer=request.user).exists()
     
     if not has_data:
         messages.warning(request, "No ticket data available to download.")
@@ -2576,43 +1920,38 @@ def download_organizer_report(request):
         return response
         
     else:  # Default to CSV
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="organizer_report_{datetime.datetime.now().strftime("%Y%m%d_%H%M%S")}.csv"'
-        
-        writer = csv.writer(response)
-        
-        # Write header
-        writer.writerow([
+        header = [
             'Event Title', 'Event Date', 'Ticket Type', 'Ticket Number', 
             'Customer Email', 'Customer Name', 'Purchase Date', 'Price', 
             'Status', 'Check-in Time', 'Attendees'
-        ])
-        
-        # For each event, get all tickets
-        for event in events:
-            tickets = Ticket.objects.filter(
-                event=event
-            ).select_related('ticket_type', 'customer', 'validated_by')
-            
-            for ticket in tickets:
-                # Calculate number of attendees for this ticket
-                attendees = ticket.ticket_type.attendees_per_ticket if ticket.ticket_type and ticket.ticket_type.attendees_per_ticket else 1
-                
-                writer.writerow([
-                    event.title,
-                    event.date.strftime("%Y-%m-%d"),
-                    ticket.ticket_type.type_name if ticket.ticket_type else 'N/A',
-                    ticket.ticket_number,
-                    ticket.customer.email if ticket.customer else 'N/A',
-                    f"{ticket.customer.first_name} {ticket.customer.last_name}" if ticket.customer else 'N/A',
-                    ticket.purchase_date.strftime("%Y-%m-%d %H:%M") if ticket.purchase_date else 'N/A',
-                    ticket.ticket_type.price if ticket.ticket_type else 'N/A',
-                    ticket.status,
-                    ticket.used_at.strftime("%Y-%m-%d %H:%M") if ticket.used_at else 'N/A',
-                    attendees
-                ])
+        ]
+        tickets = Ticket.objects.select_related('event', 'ticket_type', 'customer')
+        event_ids = list(events.values_list('id', flat=True))
+        
+        def rows():
+            # Event by event, each walked in chunks, so rows stay grouped per event
+            for event_id in event_ids:
+                for ticket in iterate_in_chunks(tickets.filter(event_id=event_id)):
+                    event = ticket.event
+                    # Calculate number of attendees for this ticket
+                    attendees = ticket.ticket_type.attendees_per_ticket if ticket.ticket_type and ticket.ticket_type.attendees_per_ticket else 1
+                    
+                    yield [
+                        event.title,
+                        event.date.strftime("%Y-%m-%d"),
+                        ticket.ticket_type.type_name if ticket.ticket_type else 'N/A',
+                        ticket.ticket_number,
+                        ticket.customer.email if ticket.customer else 'N/A',
+                        f"{ticket.customer.first_name} {ticket.customer.last_name}" if ticket.customer else 'N/A',
+                        ticket.purchase_date.strftime("%Y-%m-%d %H:%M") if ticket.purchase_date else 'N/A',
+                        ticket.ticket_type.price if ticket.ticket_type else 'N/A',
+                        ticket.status,
+                        ticket.used_at.strftime("%Y-%m-%d %H:%M") if ticket.used_at else 'N/A',
+                        attendees
+                    ]
         
-        return response
+        filename = f'organizer_report_{datetime.datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+        return csv_streaming_response(filename, header, rows())
         
 @login_required
 @user_passes_test(lambda u: u.role == 'ORGANIZER')
@@ -2620,29 +1959,27 @@ def download_ticket_sales(request):
     """Download detailed CSV of all ticket sales for an organizer's events"""
     import datetime as dt  # Use dt as alias to avoid conflict
     
-    # Get all events for this organizer
-    events = Event.objects.filter(organizer=request.user)
+    # Only include sold or used tickets
+    tickets = Ticket.objects.filter(
+        event__organizer=request.user,
+        status__in=['SOLD', 'USED']
+    )
     
     # Check if there's any data to report
-    has_data = False
-    for event in events:
-        tickets = Ticket.objects.filter(event=event, status__in=['SOLD', 'USED']).exists()
-        if tickets:
-            has_data = True
-            break
-    
-    if not has_data:
+    if not tickets.exists():
         messages.warning(request, "No ticket sales data available to download.")
         return redirect('dashboard')
     
-    response = HttpResponse(content_type='text/csv')
-    timestamp = dt.datetime.now().strftime("%Y%m%d_%H%M%S")
-    response['Content-Disposition'] = f'attachment; filename="ticket_sales_{timestamp}.csv"'
-    
-    writer = csv.writer(response)
+    # Promo code details come from subqueries instead of a PromoCodeUsage lookup per row
+    first_usage = PromoCodeUsage.objects.filter(ticket=OuterRef('pk')).order_by('pk')
+    tickets = tickets.select_related('event', 'ticket_type', 'customer', 'validated_by').annotate(
+        promo_code_used=Subquery(first_usage.values('promo_code__code')[:1]),
+        promo_discount_amount=Subquery(first_usage.values('discount_amount')[:1]),
+    )
+    event_ids = list(Event.objects.filter(organizer=request.user).values_list('id', flat=True))
     
     # Write header with more detailed ticket information
-    writer.writerow([
+    header = [
         'Event Title', 
         'Event Date', 
         'Ticket Type', 
@@ -2658,43 +1995,32 @@ def download_ticket_sales(request):
         'Checked-in By',
         'Promo Code Used',
         'Discount Amount'
-    ])
-    
-    # Get all events for this organizer
-    events = Event.objects.filter(organizer=request.user)
+    ]
     
-    # For each event, get all sold tickets
-    for event in events:
-        tickets = Ticket.objects.filter(
-            event=event,
-            status__in=['SOLD', 'USED']  # Only include sold or used tickets
-        ).select_related('ticket_type', 'customer', 'validated_by')
-        
-        for ticket in tickets:
-            # Get promo code information if available
-            promo_code_usage = PromoCodeUsage.objects.filter(ticket=ticket).first()
-            promo_code = promo_code_usage.promo_code.code if promo_code_usage else 'None'
-            discount_amount = promo_code_usage.discount_amount if promo_code_usage else 0
-            
-            writer.writerow([
-                event.title,
-                event.date.strftime("%Y-%m-%d"),
-                ticket.ticket_type.type_name if ticket.ticket_type else 'N/A',
-                ticket.ticket_number,
-                ticket.ticket_type.price if ticket.ticket_type else 'N/A',
-                ticket.customer.email if ticket.customer else 'N/A',
-                f"{ticket.customer.first_name} {ticket.customer.last_name}" if ticket.customer else 'N/A',
-                ticket.customer.mobile_number if ticket.customer else 'N/A',
-                ticket.purchase_date.strftime("%Y-%m-%d %H:%M") if ticket.purchase_date else 'N/A',
-                'Paid' if ticket.status in ['SOLD', 'USED'] else 'Not Paid',
-                'Checked In' if ticket.status == 'USED' else 'Not Checked In',
-                ticket.used_at.strftime("%Y-%m-%d %H:%M") if ticket.used_at else 'N/A',
-                f"{ticket.validated_by.first_name} {ticket.validated_by.last_name}" if ticket.validated_by else 'N/A',
-                promo_code,
-                discount_amount
-            ])
+    def rows():
+        for event_id in event_ids:
+            for ticket in iterate_in_chunks(tickets.filter(event_id=event_id)):
+                event = ticket.event
+                yield [
+                    event.title,
+                    event.date.strftime("%Y-%m-%d"),
+                    ticket.ticket_type.type_name if ticket.ticket_type else 'N/A',
+                    ticket.ticket_number,
+                    ticket.ticket_type.price if ticket.ticket_type else 'N/A',
+                    ticket.customer.email if ticket.customer else 'N/A',
+                    f"{ticket.customer.first_name} {ticket.customer.last_name}" if ticket.customer else 'N/A',
+                    ticket.customer.mobile_number if ticket.customer else 'N/A',
+                    ticket.purchase_date.strftime("%Y-%m-%d %H:%M") if ticket.purchase_date else 'N/A',
+                    'Paid' if ticket.status in ['SOLD', 'USED'] else 'Not Paid',
+                    'Checked In' if ticket.status == 'USED' else 'Not Checked In',
+                    ticket.used_at.strftime("%Y-%m-%d %H:%M") if ticket.used_at else 'N/A',
+                    f"{ticket.validated_by.first_name} {ticket.validated_by.last_name}" if ticket.validated_by else 'N/A',
+                    ticket.promo_code_used or 'None',
+                    ticket.promo_discount_amount if ticket.promo_code_used else 0
+                ]
     
-    return response
+    timestamp = dt.datetime.now().strftime("%Y%m%d_%H%M%S")
+    return csv_streaming_response(f"ticket_sales_{timestamp}.csv", header, rows())
 
 
 def test_static_files(request):
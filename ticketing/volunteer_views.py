@@ -1,7 +1,7 @@
 import json
 import logging
 import hmac
-import hashlib
+import time
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.views.decorators.http import require_http_methods
@@ -10,9 +10,12 @@ from django.http import JsonResponse
 from django.utils import timezone
 from django.conf import settings
 from django.db import transaction
-from django.db.models import Q
+from django.db.models import Q, Sum
 from datetime import datetime, date
-from .models import Ticket, User
+from .models import CheckInCounter, Event, Ticket, User
+from .checkin_utils import build_event_manifest, apply_offline_checkins, validate_ticket_batch, scan_signature, parse_scan_time, verify_manifest
+from .occupancy_utils import record_check_in
+from .scanlog_utils import log_scan_attempt, get_scan_device, scan_event, write_scan_log
 
 # Get the logger instance for this module
 logger = logging.getLogger(__name__)
@@ -30,18 +33,16 @@ def volunteer_dashboard(request):
     # Get today's statistics for this volunteer
     today = date.today()
     
-    # Count tickets validated by this volunteer today
-    today_tickets = Ticket.objects.filter(
-        validated_by=request.user,
-        used_at__date=today
-    )
+    # Today's admitted and rejected scans from the per-minute check-in counters
+    today_start = timezone.make_aware(datetime.combine(today, datetime.min.time()))
+    today_counts = CheckInCounter.objects.filter(
+        volunteer=request.user,
+        minute__gte=today_start,
+    ).aggregate(valid=Sum('scans'), invalid=Sum('rejected'))
     
-    context['today_scanned'] = today_tickets.count()
-    context['today_valid'] = today_tickets.filter(status='USED').count()
-    
-    # Count invalid attempts (this would need to be tracked in a separate model in a real app)
-    # For now, we'll assume all scanned tickets were valid
-    context['today_invalid'] = 0
+    context['today_valid'] = today_counts['valid'] or 0
+    context['today_invalid'] = today_counts['invalid'] or 0
+    context['today_scanned'] = context['today_valid'] + context['today_invalid']
     
     return render(request, 'core/volunteer/dashboard.html', context)
 
@@ -49,12 +50,18 @@ def volunteer_dashboard(request):
 @user_passes_test(is_volunteer)
 def volunteer_scan_tickets(request):
     """View for volunteer ticket scanning interface"""
-    return render(request, 'core/volunteer/scan_tickets.html')
+    # Events a scanner can download an offline manifest for: today's and upcoming ones
+    events = Event.objects.filter(
+        status='PUBLISHED',
+        date__gte=timezone.localdate(),
+    ).order_by('date').only('id', 'title', 'date')
+    return render(request, 'core/volunteer/scan_tickets.html', {'events': events})
 
 @login_required
 @user_passes_test(lambda u: u.role in ['VOLUNTEER', 'ADMIN', 'ORGANIZER'])
 @require_http_methods(["POST"])
 @csrf_exempt  # For simplicity in the example; consider using proper CSRF protection in production
+@log_scan_attempt
 def api_validate_ticket(request):
     """API endpoint for validating tickets via QR code scan"""
     try:
@@ -72,55 +79,84 @@ def api_validate_ticket(request):
             logger.warning(f"Missing required data in validation request from user {request.user.email}")
             return JsonResponse({
                 'success': False,
+                'error_code': 'MISSING_DATA',
                 'message': 'Missing required data'
             }, status=400)
         
-        # Find the ticket by ID
         try:
-            ticket = get_object_or_404(Ticket, id=ticket_id)
-        except:
+            ticket_id = int(ticket_id)
+        except (TypeError, ValueError):
+            logger.warning(f"Ticket not found: {ticket_id} requested by {request.user.email}")
+            return JsonResponse({
+                'success': False,
+                'error_code': 'NOT_FOUND',
+                'message': 'Ticket not found'
+            }, status=404)
+        
+        # Verify signature if provided
+        if signature and timestamp:
+            if not hmac.compare_digest(scan_signature(ticket_id, unique_secure_token, timestamp), str(signature)):
+                logger.warning(f"Invalid signature for ticket ID: {ticket_id} by user {request.user.email}")
+                return JsonResponse({
+                    'success': False,
+                    'error_code': 'INVALID_SIGNATURE',
+                    'message': 'Invalid ticket signature'
+                }, status=403)
+        
+        # Check in with a single conditional UPDATE. The row only changes if the token matches
+        # and the ticket is still SOLD/VALID, so of two volunteers scanning the same pass at
+        # the same moment exactly one gets an affected row back.
+        now = timezone.now()
+        admitted = Ticket.objects.filter(
+            id=ticket_id,
+            unique_secure_token=unique_secure_token,
+            status__in=['VALID', 'SOLD'],
+        ).update(status='USED', used_at=now, validated_by=request.user)
+        
+        # One fetch with everything the response needs, whatever the outcome
+        ticket = Ticket.objects.select_related('event', 'ticket_type', 'validated_by').filter(id=ticket_id).first()
+        if ticket is None:
             logger.warning(f"Ticket not found: {ticket_id} requested by {request.user.email}")
             return JsonResponse({
                 'success': False,
+                'error_code': 'NOT_FOUND',
                 'message': 'Ticket not found'
             }, status=404)
         
+        if admitted:
+            record_check_in(ticket, request.user, now)
+            logger.info(f"Ticket {ticket.ticket_number} validated by {request.user.email} at {now}")
+            return JsonResponse({
+                'success': True,
+                'message': 'Ticket validated successfully',
+                'ticket_number': ticket.ticket_number,
+                'ticket_type_name': ticket.ticket_type.type_name if ticket.ticket_type else 'General Admission',
+                'entry_count': ticket.total_admission_count,  # Use consolidated admission count
+                'booking_quantity': ticket.booking_quantity,  # Show how many tickets were booked
+                'event_name': ticket.event.title,
+                'event_date': ticket.event.date.strftime('%B %d, %Y') if ticket.event else 'Unknown Date',
+                'validation_time': timezone.localtime(now).strftime('%I:%M %p')
+            })
+        
         # Verify the secure token
         if ticket.unique_secure_token != unique_secure_token:
             # Log security incident
             logger.warning(f"Invalid token attempt for ticket ID: {ticket_id} by user {request.user.email}")
             return JsonResponse({
                 'success': False,
+                'error_code': 'INVALID_TOKEN',
                 'message': 'Invalid ticket token'
             }, status=403)
-            
-        # Verify signature if provided
-        if signature and timestamp:
-            try:
-                secret_key = settings.SECRET_KEY.encode()
-                message = f"{ticket_id}:{unique_secure_token}:{timestamp}".encode()
-                expected_signature = hmac.new(secret_key, message, hashlib.sha256).hexdigest()[:16]
-                
-                if signature != expected_signature:
-                    logger.warning(f"Invalid signature for ticket ID: {ticket_id} by user {request.user.email}")
-                    return JsonResponse({
-                        'success': False,
-                        'message': 'Invalid ticket signature'
-                    }, status=403)
-            except Exception as e:
-                logger.error(f"Error verifying signature: {str(e)}")
-                # Continue without signature verification if an error occurs
         
-        # Check ticket status
         if ticket.status == 'USED':
             # Enhanced response for already used tickets
             used_at_str = None
             validated_by_name = None
             
-            if hasattr(ticket, 'used_at') and ticket.used_at:
-                used_at_str = ticket.used_at.strftime('%B %d, %Y at %I:%M %p')
+            if ticket.used_at:
+                used_at_str = timezone.localtime(ticket.used_at).strftime('%B %d, %Y at %I:%M %p')
             
-            if hasattr(ticket, 'validated_by') and ticket.validated_by:
+            if ticket.validated_by:
                 validated_by_name = f"{ticket.validated_by.first_name} {ticket.validated_by.last_name}".strip()
                 if not validated_by_name:
                     validated_by_name = ticket.validated_by.email
@@ -137,44 +173,21 @@ def api_validate_ticket(request):
                 'validated_by': validated_by_name
             })
         
-        elif ticket.status not in ['VALID', 'SOLD']:
-            logger.warning(f"Invalid ticket status {ticket.status} for ticket {ticket.ticket_number} scanned by {request.user.email}")
-            return JsonResponse({
-                'success': False,
-                'error_code': 'INVALID_STATUS',
-                'message': f'Invalid ticket status: {ticket.get_status_display()}',
-                'ticket_number': ticket.ticket_number,
-                'ticket_type_name': ticket.ticket_type.type_name if ticket.ticket_type else 'Unknown Type',
-                'event_name': ticket.event.title if ticket.event else 'Unknown Event'
-            })
-        
-        # Ticket is valid (either VALID or SOLD status), update status with transaction
-        with transaction.atomic():
-            ticket.status = 'USED'
-            ticket.used_at = timezone.now()
-            ticket.validated_by = request.user
-            ticket.save()
-            
-            # Log the validation
-            logger.info(f"Ticket {ticket.ticket_number} validated by {request.user.email} at {ticket.used_at}")
-        
-        # Return success response with ticket details
+        logger.warning(f"Invalid ticket status {ticket.status} for ticket {ticket.ticket_number} scanned by {request.user.email}")
         return JsonResponse({
-            'success': True,
-            'message': 'Ticket validated successfully',
+            'success': False,
+            'error_code': 'INVALID_STATUS',
+            'message': f'Invalid ticket status: {ticket.get_status_display()}',
             'ticket_number': ticket.ticket_number,
-            'ticket_type_name': ticket.ticket_type.type_name if ticket.ticket_type else 'General Admission',
-            'entry_count': ticket.total_admission_count,  # Use consolidated admission count
-            'booking_quantity': ticket.booking_quantity,  # Show how many tickets were booked
-            'event_name': ticket.event.title,
-            'event_date': ticket.event.date.strftime('%B %d, %Y') if ticket.event else 'Unknown Date',
-            'validation_time': ticket.used_at.strftime('%I:%M %p')
+            'ticket_type_name': ticket.ticket_type.type_name if ticket.ticket_type else 'Unknown Type',
+            'event_name': ticket.event.title if ticket.event else 'Unknown Event'
         })
         
     except json.JSONDecodeError:
         logger.error(f"JSON decode error in ticket validation by user {request.user.email}")
         return JsonResponse({
             'success': False,
+            'error_code': 'INVALID_JSON',
             'message': 'Invalid JSON data'
         }, status=400)
     except Exception as e:
@@ -183,3 +196,109 @@ def api_validate_ticket(request):
             'success': False,
             'message': f'Error processing ticket: {str(e)}'
         }, status=500)
+
+
+@login_required
+@user_passes_test(lambda u: u.role in ['VOLUNTEER', 'ADMIN', 'ORGANIZER'])
+@require_http_methods(["GET"])
+def api_checkin_manifest(request, event_id):
+    """Signed manifest of an event's tickets for scanning without a network connection"""
+    event = get_object_or_404(Event, id=event_id)
+    data = build_event_manifest(event)
+    logger.info(f"Offline manifest for event {event.id} ({len(data['manifest']['tickets'])} tickets) downloaded by {request.user.email}")
+    return JsonResponse(data)
+
+@login_required
+@user_passes_test(lambda u: u.role in ['VOLUNTEER', 'ADMIN', 'ORGANIZER'])
+@require_http_methods(["POST"])
+def api_verify_checkin_manifest(request, event_id):
+    """Check a scanner's stored manifest: {"generated_at", "digest", "signature"}"""
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'message': 'Invalid JSON data'}, status=400)
+    return JsonResponse({'success': True, 'valid': verify_manifest(event_id, data) is not None})
+
+@login_required
+@user_passes_test(lambda u: u.role in ['VOLUNTEER', 'ADMIN', 'ORGANIZER'])
+@require_http_methods(["POST"])
+def api_bulk_checkin(request):
+    """
+    Upload check-ins queued by an offline scanner:
+    {"event_id": ..., "manifest": {"generated_at", "digest", "signature"}, "scans": [{"tid", "tok", "scanned_at"}]}
+    """
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'message': 'Invalid JSON data'}, status=400)
+    if not isinstance(data, dict):
+        return JsonResponse({'success': False, 'message': 'Request body must be a JSON object'}, status=400)
+
+    scans = data.get('scans')
+    if not isinstance(scans, list) or not all(isinstance(scan, dict) for scan in scans):
+        return JsonResponse({'success': False, 'message': 'scans must be a list of objects'}, status=400)
+    if len(scans) > getattr(settings, 'CHECKIN_SYNC_MAX_SCANS', 1000):
+        return JsonResponse({'success': False, 'message': 'Too many scans in one upload'}, status=400)
+    try:
+        event_id = int(data.get('event_id'))
+    except (TypeError, ValueError):
+        return JsonResponse({'success': False, 'message': 'event_id must be an integer'}, status=400)
+
+    event = get_object_or_404(Event, id=event_id)
+    generated_at = verify_manifest(event.id, data.get('manifest'))
+    if generated_at is None:
+        return JsonResponse({
+            'success': False,
+            'error_code': 'INVALID_MANIFEST',
+            'message': 'Offline manifest failed verification, download it again',
+        }, status=400)
+    with transaction.atomic():
+        results = apply_offline_checkins(event, scans, request.user, not_before=generated_at)
+
+    device = get_scan_device(request, data)
+    write_scan_log([
+        scan_event(
+            request.user, result['tid'],
+            'ADMITTED' if result['result'] == 'ADMITTED' else 'REJECTED',
+            error_code='' if result['result'] == 'ADMITTED' else result['result'],
+            device=device, source='OFFLINE', event_id=event.id,
+            scanned_at=parse_scan_time(scan.get('scanned_at'), generated_at),
+        )
+        for scan, result in zip(scans, results)
+    ])
+    return JsonResponse({'success': True, 'results': results})
+
+@login_required
+@user_passes_test(lambda u: u.role in ['VOLUNTEER', 'ADMIN', 'ORGANIZER'])
+@require_http_methods(["POST"])
+@csrf_exempt  # Same device clients as api_validate_ticket
+def api_validate_tickets_batch(request):
+    """Validate several buffered scans in one request: {"scans": [{"tid", "tok", "ts", "sig"}, ...]}"""
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'message': 'Invalid JSON data'}, status=400)
+    if not isinstance(data, dict):
+        return JsonResponse({'success': False, 'message': 'Request body must be a JSON object'}, status=400)
+
+    scans = data.get('scans')
+    if not isinstance(scans, list) or not all(isinstance(scan, dict) for scan in scans):
+        return JsonResponse({'success': False, 'message': 'scans must be a list of objects'}, status=400)
+    if len(scans) > getattr(settings, 'CHECKIN_BATCH_MAX_SCANS', 100):
+        return JsonResponse({'success': False, 'message': 'Too many scans in one request'}, status=400)
+
+    started = time.monotonic()
+    with transaction.atomic():
+        results = validate_ticket_batch(scans, request.user)
+    latency_ms = (time.monotonic() - started) * 1000 / max(len(scans), 1)
+
+    device = get_scan_device(request, data)
+    write_scan_log([
+        scan_event(
+            request.user, scan.get('tid') or scan.get('ticket_id'),
+            'ADMITTED' if result['success'] else 'REJECTED',
+            error_code=result.get('error_code', ''), device=device, latency_ms=latency_ms, source='BATCH',
+        )
+        for scan, result in zip(scans, results)
+    ])
+    return JsonResponse({'success': True, 'results': results})